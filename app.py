@@ -1,63 +1,3179 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, abort, g, has_request_context, request, jsonify, render_template, stream_with_context
+from flask.logging import default_handler
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
-import qrcode
+from datetime import datetime, date, timedelta, timezone
 import base64
 from io import BytesIO
 import uuid
 import os
-import traceback
+import logging
+import logging.handlers
+import queue
+import random
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+import atexit
+import binascii
+import hmac
+import secrets
+from urllib.parse import urlsplit
+import functools
+import gc
+import importlib
+import cProfile
+import sys
+from contextlib import contextmanager
+import zlib
+import struct
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import csv
+import io
+import zipfile
+import json
+import gzip
+import html
+import re
+
+try:
+    import brotli
+except ImportError:  # optional: serve gzip only
+    brotli = None
+try:
+    import fcntl
+except ImportError:  # not on Windows: metrics archive folding runs unlocked
+    fcntl = None
+
+
+@functools.lru_cache(maxsize=None)
+def optional_module(name):
+    """Import a heavy optional dependency on first use; None when it is not installed.
+
+    numpy (QR rasterizer, falls back to pure Python) and pyarrow
+    (Parquet/Arrow export) cost tens of milliseconds each to import, so
+    workers that never need them never load them.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tablets.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///tablets.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', -64000))  # negative = KiB
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['QR_CACHE_MEMORY_BYTES'] = int(os.environ.get('QR_CACHE_MEMORY_BYTES', 16 * 1024 * 1024))
+app.config['QR_CACHE_DISK_BYTES'] = int(os.environ.get('QR_CACHE_DISK_BYTES', 256 * 1024 * 1024))
+app.config['QR_CACHE_PATH'] = os.environ.get('QR_CACHE_PATH', os.path.join(app.instance_path, 'qr_cache.db'))
+app.config['QR_RENDER_WORKERS'] = int(os.environ.get('QR_RENDER_WORKERS', os.cpu_count() or 1))
+app.config['QR_RENDER_OFFLOAD'] = os.environ.get('QR_RENDER_OFFLOAD', '0') == '1'  # single renders in the pool
+app.config['QR_RENDER_TIMEOUT'] = float(os.environ.get('QR_RENDER_TIMEOUT', 5.0))
+app.config['QR_RASTERIZER'] = os.environ.get('QR_RASTERIZER', 'vector')  # 'vector' or 'pil'
+app.config['QR_PNG_COMPRESS_LEVEL'] = int(os.environ.get('QR_PNG_COMPRESS_LEVEL', 6))
+app.config['QR_BATCH_MAX'] = int(os.environ.get('QR_BATCH_MAX', 20000))
+app.config['QR_PAYLOAD_MODE'] = os.environ.get('QR_PAYLOAD_MODE', 'uuid')  # 'uuid', 'short' or 'signed'
+app.config['QR_SIGNING_KEY'] = os.environ.get('QR_SIGNING_KEY')  # required for 'signed'
+app.config['LABEL_MAX'] = int(os.environ.get('LABEL_MAX', 100000))
+app.config['LABEL_PNG_DPI'] = int(os.environ.get('LABEL_PNG_DPI', 200))
+app.config['BULK_CHUNK_SIZE'] = int(os.environ.get('BULK_CHUNK_SIZE', 2000))
+app.config['BULK_MAX_ERRORS'] = int(os.environ.get('BULK_MAX_ERRORS', 1000))
+app.config['LIST_DEFAULT_LIMIT'] = int(os.environ.get('LIST_DEFAULT_LIMIT', 50))
+app.config['LIST_MAX_LIMIT'] = int(os.environ.get('LIST_MAX_LIMIT', 500))
+app.config['EXPORT_CHUNK_SIZE'] = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+app.config['SEARCH_MAX_LIMIT'] = int(os.environ.get('SEARCH_MAX_LIMIT', 100))
+app.config['SEARCH_RANK_CANDIDATES'] = int(os.environ.get('SEARCH_RANK_CANDIDATES', 0))  # 0 = rank all
+app.config['SEARCH_CACHE_SIZE'] = int(os.environ.get('SEARCH_CACHE_SIZE', 2000))
+app.config['SEARCH_CACHE_TTL'] = int(os.environ.get('SEARCH_CACHE_TTL', 300))
+app.config['VERIFY_MAX_ITEMS'] = int(os.environ.get('VERIFY_MAX_ITEMS', 100000))
+app.config['VERIFY_CHUNK_SIZE'] = int(os.environ.get('VERIFY_CHUNK_SIZE', 500))
+app.config['EXPIRING_MAX_DAYS'] = int(os.environ.get('EXPIRING_MAX_DAYS', 3650))
+app.config['SCAN_ANALYTICS_ENABLED'] = os.environ.get('SCAN_ANALYTICS_ENABLED', '1') == '1'
+app.config['SCAN_BUFFER_SIZE'] = int(os.environ.get('SCAN_BUFFER_SIZE', 50000))
+app.config['SCAN_FLUSH_BATCH'] = int(os.environ.get('SCAN_FLUSH_BATCH', 500))
+app.config['SCAN_FLUSH_INTERVAL'] = float(os.environ.get('SCAN_FLUSH_INTERVAL', 2.0))
+app.config['INFO_PAGE_CACHE_SIZE'] = int(os.environ.get('INFO_PAGE_CACHE_SIZE', 5000))
+app.config['INFO_PAGE_CACHE_TTL'] = int(os.environ.get('INFO_PAGE_CACHE_TTL', 300))
+app.config['MONOGRAPH_CACHE_SIZE'] = int(os.environ.get('MONOGRAPH_CACHE_SIZE', 10000))
+app.config['TABLET_CACHE_SIZE'] = int(os.environ.get('TABLET_CACHE_SIZE', 20000))
+app.config['SHORT_CODE_CACHE_SIZE'] = int(os.environ.get('SHORT_CODE_CACHE_SIZE', 100000))
+app.config['TABLET_CACHE_TTL'] = int(os.environ.get('TABLET_CACHE_TTL', 300))
+app.config['TABLET_CACHE_CHECK_INTERVAL'] = float(os.environ.get('TABLET_CACHE_CHECK_INTERVAL', 1.0))
+app.config['INDEX_MAX_AGE'] = int(os.environ.get('INDEX_MAX_AGE', 86400))
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+app.config['LOG_QUEUE_SIZE'] = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))  # hot-route INFO/DEBUG kept
+app.config['PROFILE_SECRET'] = os.environ.get('PROFILE_SECRET')  # enables X-Profile and /api/profiles
+app.config['PROFILE_SAMPLE_EVERY'] = int(os.environ.get('PROFILE_SAMPLE_EVERY', 0))  # 0 = no aggregate sampling
+app.config['PROFILE_FORMAT'] = os.environ.get('PROFILE_FORMAT', 'pstats')  # 'pstats' or 'speedscope'
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 200))
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0))
+
+# ============================================================================
+# LOGGING
+# ============================================================================
+# Log records are put on an in-memory queue by the request thread and
+# formatted as one JSON object per line by a background listener, so a slow
+# stdout pipe never blocks a worker. Below WARNING, records from the
+# high-volume scan and QR routes are kept for only LOG_SAMPLE_RATE of
+# requests (decided once per request so a sampled request logs in full).
+LOG_SAMPLED_ENDPOINTS = frozenset(('tablet_info', 'resolve_short_code', 'resolve_signed_payload',
+                                   'generate_qr_code', 'get_tablet'))
+_LOG_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record; extra= fields become top-level keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _LOG_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach request fields and apply per-request sampling on the caller's thread"""
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if not has_request_context():
+            return True
+        if record.levelno < logging.WARNING and request.endpoint in LOG_SAMPLED_ENDPOINTS:
+            if 'log_sampled' not in g:
+                g.log_sampled = random.random() < self.sample_rate
+            if not g.log_sampled:
+                return False
+        record.method = request.method
+        record.path = request.path
+        return True
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """QueueHandler with a per-process listener thread and a bounded queue.
+
+    Formatting is left to the listener; when the queue is full records are
+    dropped and counted instead of blocking the request.
+    """
+
+    def __init__(self, target, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        # Threads do not survive fork, so each worker starts its own listener
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._listener = logging.handlers.QueueListener(self.queue, self.target,
+                                                                respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._ensure_listener()
+        super().emit(record)
+
+    def prepare(self, record):
+        # Freeze the message now (args may be mutated later) but leave
+        # exc_info in place: the queue never leaves this process
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Drain and stop this process's listener (registered with atexit)"""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+_log_target = logging.StreamHandler()
+_log_target.setFormatter(JsonLogFormatter())
+log_handler = QueueLogHandler(_log_target, app.config['LOG_QUEUE_SIZE'])
+log_handler.addFilter(RequestContextFilter(app.config['LOG_SAMPLE_RATE']))
+atexit.register(log_handler.stop)
+
+log = logging.getLogger('pharma_qr')
+log.setLevel(app.config['LOG_LEVEL'])
+log.addHandler(log_handler)
+log.propagate = False
+app.logger.removeHandler(default_handler)
+app.logger.addHandler(log_handler)
+
+# Compiled templates are persisted so worker restarts skip Jinja compilation
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR']))
+
+# ============================================================================
+# STORAGE CONFIGURATION
+# ============================================================================
+# Hosted Postgres providers still hand out the legacy postgres:// scheme
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://' + app.config['SQLALCHEMY_DATABASE_URI'][len('postgres://'):]
+
+if app.config['SQLALCHEMY_DATABASE_URI'] in ('sqlite://', 'sqlite:///:memory:'):
+    pass  # Flask-SQLAlchemy pins in-memory databases to a single static connection
+elif app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT'] / 1000},
+    }
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection):
+    """Tune a fresh SQLite connection for concurrent readers and a single writer"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA cache_size={app.config['SQLITE_CACHE_SIZE']}")
+    cursor.execute(f"PRAGMA mmap_size={app.config['SQLITE_MMAP_SIZE']}")
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT']}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection)
+
+
 db = SQLAlchemy(app)
 
-# Database Model
-class Tablet(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    name = db.Column(db.String(100), nullable=False)
-    manufacturer = db.Column(db.String(100), nullable=False)
-    batch_number = db.Column(db.String(50), nullable=False)
-    mfg_date = db.Column(db.Date, nullable=False)
-    expiry_date = db.Column(db.Date, nullable=False)
-    composition = db.Column(db.Text, nullable=False)
-    dosage = db.Column(db.String(50), nullable=False)
-    use_cases = db.Column(db.Text, nullable=False)
-    side_effects = db.Column(db.Text)
-    precautions = db.Column(db.Text)
-    storage_instructions = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+# ============================================================================
+# METRICS
+# ============================================================================
+# Upper bounds (seconds) shared by every latency histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_HELP = {
+    'http_requests_total': ('counter', 'Requests served, by route, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Time to build the response, by route'),
+    'http_request_db_seconds': ('histogram', 'Database time spent per request, by route'),
+    'db_query_duration_seconds': ('histogram', 'Individual SQL statement execution time'),
+    'qr_render_phase_seconds': ('histogram', 'QR rendering time by phase (matrix, draw, encode, base64)'),
+    'app_errors_total': ('counter', 'Exceptions caught by route handlers, by exception type'),
+    'qr_cache_requests_total': ('counter', 'Rendered QR cache lookups by result'),
+    'qr_cache_evictions_total': ('counter', 'Rendered QR cache evictions by tier'),
+    'qr_matrix_cache_requests_total': ('counter', 'QR module matrix cache lookups by result'),
+    'info_page_cache_requests_total': ('counter', 'Rendered scan page cache lookups by result'),
+    'monograph_cache_requests_total': ('counter', 'Shared product text cache lookups by result'),
+    'tablet_cache_requests_total': ('counter', 'Tablet record cache lookups by result'),
+    'tablet_cache_flushes_total': ('counter', 'Tablet record cache flushes after another process wrote'),
+    'short_code_cache_requests_total': ('counter', 'Short code to tablet id cache lookups by result'),
+    'scan_events_total': ('counter', 'Scan analytics events by state'),
+}
+
+
+class Metrics:
+    """Per-process counters and histograms exported in Prometheus text format.
+
+    Each process accumulates in memory and a background thread writes a
+    snapshot to METRICS_DIR/<pid>-<token>.json every flush_interval
+    seconds, so a scrape answered by any gunicorn worker covers the whole
+    server. The token keeps a reused pid from overwriting an exited
+    process's file. Snapshots of exited processes (workers, render pool
+    children) are folded into one archive file, either right away by
+    mark_process_dead() from gunicorn's child_exit hook or by the next
+    scrape, so counters never go backwards and the directory stays small.
+    Collectors registered with add_collector() contribute counters (e.g.
+    cache stats) at snapshot time.
+    """
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._filename = None
+
+    def _ensure_thread(self):
+        # Forked workers (and QR render pool processes) start from zero
+        with self._start_lock:
+            if self._pid != os.getpid():
+                with self._lock:
+                    self._counters.clear()
+                    self._histograms.clear()
+                self._filename = f"{os.getpid()}-{secrets.token_hex(4)}.json"
+                threading.Thread(target=self._run, name='metrics-writer', daemon=True).start()
+                self._pid = os.getpid()
+
+    def inc(self, name, value=1, **labels):
+        if self._pid != os.getpid():
+            self._ensure_thread()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if self._pid != os.getpid():
+            self._ensure_thread()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += seconds
+            hist[2] += 1
+
+    def add_collector(self, collect):
+        """collect() returns (name, labels, value) counter samples"""
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, dict(labels), list(buckets), total, count]
+                          for (name, labels), (buckets, total, count) in self._histograms.items()]
+        for collect in self._collectors:
+            counters.extend([name, labels, value] for name, labels, value in collect())
+        return {'counters': counters, 'histograms': histograms}
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.write()
+
+    def write(self):
+        """Persist this process's snapshot for other workers to merge"""
+        if self._pid != os.getpid():
+            return  # nothing recorded in this process yet
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._dump(self._filename, self.snapshot())
+        except OSError as e:
+            log.warning("Metrics write failed", extra={'error': str(e)})
+
+    def _dump(self, name, snap):
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snap, f)
+        os.replace(path + '.tmp', path)
+
+    def _load(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # a process is mid-write or the file was folded away
+
+    @contextmanager
+    def _archive_lock(self):
+        """Serialize folding and reading across processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'archive.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _pid_of(name):
+        try:
+            return int(name[:-len('.json')].split('-', 1)[0])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _merge(snapshots):
+        counters, histograms = {}, {}
+        for snap in snapshots:
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(sorted(labels.items())))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, buckets, total, count in snap['histograms']:
+                key = (name, tuple(sorted(labels.items())))
+                merged = histograms.setdefault(key, [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                merged[1] += total
+                merged[2] += count
+        return counters, histograms
+
+    def _fold(self, names):
+        """Add the named snapshots to the archive and delete them; call under _archive_lock"""
+        snaps = [snap for snap in map(self._load, names) if snap is not None]
+        if snaps:
+            archive = self._load(self.ARCHIVE) or {'counters': [], 'histograms': []}
+            counters, histograms = self._merge([archive] + snaps)
+            self._dump(self.ARCHIVE, {
+                'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                'histograms': [[name, dict(labels), buckets, total, count]
+                               for (name, labels), (buckets, total, count) in histograms.items()],
+            })
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _snapshot_names(self):
+        try:
+            return [n for n in os.listdir(self.directory) if n.endswith('.json') and n != self.ARCHIVE]
+        except FileNotFoundError:
+            return []
+
+    def mark_process_dead(self, pid):
+        """Fold an exited process's snapshot into the archive (gunicorn child_exit)"""
+        try:
+            with self._archive_lock():
+                self._fold([n for n in self._snapshot_names() if self._pid_of(n) == pid])
+        except OSError as e:
+            log.warning("Metrics archive update failed", extra={'error': str(e)})
+
+    def collect_all(self):
+        """Merge the archive and every live process's latest snapshot with this process's values"""
+        snapshots = {}
+        try:
+            with self._archive_lock():
+                names = self._snapshot_names()
+                dead = [n for n in names if n != self._filename and self._pid_of(n) is not None
+                        and not self._alive(self._pid_of(n))]
+                if dead:
+                    self._fold(dead)
+                for name in [self.ARCHIVE] + [n for n in names if n not in dead]:
+                    snap = self._load(name)
+                    if snap is not None:
+                        snapshots[name] = snap
+        except OSError as e:
+            log.warning("Metrics archive read failed", extra={'error': str(e)})
+        snapshots[self._filename or 'self'] = self.snapshot()
+        return self._merge(snapshots.values())
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        counters, histograms = self.collect_all()
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+        lines = []
+        for name in sorted({n for n, _ in counters} | {n for n, _ in histograms}):
+            kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{fmt(labels)} {value}")
+            for (n, labels), (buckets, total, count) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(LATENCY_BUCKETS, buckets):
+                    cumulative += bucket
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{fmt(labels)} {round(total, 6)}")
+                lines.append(f"{name}_count{fmt(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if app.config['METRICS_ENABLED']:
+        metrics.observe('db_query_duration_seconds', elapsed)
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_db_seconds += elapsed
+
+
+@contextmanager
+def timed_phase(name, phase):
+    """Record the duration of a block in the named phase histogram"""
+    if not app.config['METRICS_ENABLED']:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(name, time.perf_counter() - started, phase=phase)
+
+# Database Model
+class Monograph(db.Model):
+    """Descriptive product text shared by every pack of a product line.
+
+    Rows are content-addressed: the id is a hash of the text, so identical
+    text is stored once and a row never changes after it is written.
+    """
+    __tablename__ = 'monographs'
+    id = db.Column(db.String(64), primary_key=True)
+    composition = db.Column(db.Text, nullable=False)
+    use_cases = db.Column(db.Text, nullable=False)
+    side_effects = db.Column(db.Text)
+    precautions = db.Column(db.Text)
+    storage_instructions = db.Column(db.Text)
+
+
+def _monograph_field(name):
+    def getter(self):
+        monograph = self.monograph
+        return monograph[name] if monograph else None
+    return property(getter)
+
+
+class Tablet(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), nullable=False)
+    manufacturer = db.Column(db.String(100), nullable=False)
+    batch_number = db.Column(db.String(50), nullable=False)
+    mfg_date = db.Column(db.Date, nullable=False)
+    expiry_date = db.Column(db.Date, nullable=False)
+    dosage = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    short_code = db.Column(db.String(16))
+    monograph_id = db.Column(db.String(64), db.ForeignKey('monographs.id'))
+
+    # Composite indexes back keyset pagination and the listing filters
+    __table_args__ = (
+        db.Index('ix_tablet_short_code', 'short_code', unique=True),
+        db.Index('ix_tablet_created_at_id', 'created_at', 'id'),
+        db.Index('ix_tablet_manufacturer_created_at', 'manufacturer', 'created_at', 'id'),
+        db.Index('ix_tablet_batch_number_created_at', 'batch_number', 'created_at', 'id'),
+        db.Index('ix_tablet_expiry_date_id', 'expiry_date', 'id'),
+    )
+
+    # Shared product text lives in monographs and is read through monograph_cache
+    composition = _monograph_field('composition')
+    use_cases = _monograph_field('use_cases')
+    side_effects = _monograph_field('side_effects')
+    precautions = _monograph_field('precautions')
+    storage_instructions = _monograph_field('storage_instructions')
+
+    @property
+    def monograph(self):
+        return monograph_cache.get(self.monograph_id) if self.monograph_id else None
+
+    def to_dict(self):
+        monograph = self.monograph or {}
+        return {
+            'id': self.id,
+            'name': self.name,
+            'manufacturer': self.manufacturer,
+            'batch_number': self.batch_number,
+            'mfg_date': self.mfg_date.strftime('%Y-%m-%d'),
+            'expiry_date': self.expiry_date.strftime('%Y-%m-%d'),
+            'composition': monograph.get('composition'),
+            'dosage': self.dosage,
+            'use_cases': monograph.get('use_cases'),
+            'side_effects': monograph.get('side_effects'),
+            'precautions': monograph.get('precautions'),
+            'storage_instructions': monograph.get('storage_instructions'),
+            'short_code': self.short_code,
+            'monograph_id': self.monograph_id
+        }
+
+
+class ExpirySummary(db.Model):
+    """Tablet counts per manufacturer/batch/expiry day, maintained incrementally"""
+    __tablename__ = 'expiry_summary'
+    manufacturer = db.Column(db.String(100), primary_key=True)
+    batch_number = db.Column(db.String(50), primary_key=True)
+    expiry_date = db.Column(db.Date, primary_key=True)
+    tablet_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_expiry_summary_expiry_date', 'expiry_date'),
+    )
+
+
+class CacheVersion(db.Model):
+    """Single-row counter bumped whenever a tablet row changes or goes away"""
+    __tablename__ = 'cache_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ScanEvent(db.Model):
+    """One QR scan of a tablet's info page"""
+    __tablename__ = 'scan_events'
+    id = db.Column(db.Integer, primary_key=True)
+    tablet_id = db.Column(db.String(36), nullable=False)
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    device = db.Column(db.String(16))
+    language = db.Column(db.String(16))
+
+    __table_args__ = (
+        db.Index('ix_scan_events_tablet_id_scanned_at', 'tablet_id', 'scanned_at'),
+        db.Index('ix_scan_events_scanned_at', 'scanned_at'),
+    )
+
+
+# Keep expiry_summary in step with every insert/delete/update on tablet,
+# including bulk inserts that bypass the ORM
+_summary_add = ("INSERT INTO expiry_summary (manufacturer, batch_number, expiry_date, tablet_count) "
+                "VALUES (new.manufacturer, new.batch_number, new.expiry_date, 1) "
+                "ON CONFLICT (manufacturer, batch_number, expiry_date) "
+                "DO UPDATE SET tablet_count = tablet_count + 1;")
+_summary_remove = ("UPDATE expiry_summary SET tablet_count = tablet_count - 1 "
+                   "WHERE manufacturer = old.manufacturer AND batch_number = old.batch_number "
+                   "AND expiry_date = old.expiry_date; "
+                   "DELETE FROM expiry_summary WHERE tablet_count <= 0 AND manufacturer = old.manufacturer "
+                   "AND batch_number = old.batch_number AND expiry_date = old.expiry_date;")
+EXPIRY_SUMMARY_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS expiry_summary_ai AFTER INSERT ON tablet BEGIN {_summary_add} END",
+    f"CREATE TRIGGER IF NOT EXISTS expiry_summary_ad AFTER DELETE ON tablet BEGIN {_summary_remove} END",
+    f"CREATE TRIGGER IF NOT EXISTS expiry_summary_au AFTER UPDATE OF manufacturer, batch_number, expiry_date "
+    f"ON tablet BEGIN {_summary_remove} {_summary_add} END",
+)
+
+
+def expiry_summary_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def rebuild_expiry_summary():
+    """Recompute expiry_summary from the tablet table"""
+    with db.engine.begin() as conn:
+        conn.execute(db.delete(ExpirySummary))
+        conn.execute(
+            db.insert(ExpirySummary).from_select(
+                ['manufacturer', 'batch_number', 'expiry_date', 'tablet_count'],
+                db.select(Tablet.manufacturer, Tablet.batch_number, Tablet.expiry_date, db.func.count())
+                .group_by(Tablet.manufacturer, Tablet.batch_number, Tablet.expiry_date)
+            )
+        )
+
+
+# Workers poll cache_version to learn that another process changed a tablet;
+# triggers keep it honest for raw SQL writes as well as the ORM. Inserts
+# need no bump because misses are never cached.
+_version_bump = "UPDATE cache_version SET version = version + 1 WHERE id = 1;"
+CACHE_VERSION_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS cache_version_au AFTER UPDATE ON tablet BEGIN {_version_bump} END",
+    f"CREATE TRIGGER IF NOT EXISTS cache_version_ad AFTER DELETE ON tablet BEGIN {_version_bump} END",
+)
+
+
+def cache_version_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_cache_version():
+    """Seed the version row and install the bump triggers"""
+    with db.engine.begin() as conn:
+        if conn.execute(db.select(CacheVersion.id).where(CacheVersion.id == 1)).first() is None:
+            conn.execute(db.insert(CacheVersion).values(id=1, version=0))
+        for statement in CACHE_VERSION_TRIGGERS:
+            conn.exec_driver_sql(statement)
+
+
+def ensure_expiry_summary():
+    """Install the summary triggers, backfilling the summary on first run"""
+    with db.engine.begin() as conn:
+        for statement in EXPIRY_SUMMARY_TRIGGERS:
+            conn.exec_driver_sql(statement)
+        summary_empty = conn.execute(db.select(ExpirySummary.expiry_date).limit(1)).first() is None
+        tablets_exist = conn.execute(db.select(Tablet.id).limit(1)).first() is not None
+    if summary_empty and tablets_exist:
+        rebuild_expiry_summary()
+
+
+# Full-text search: an external-content FTS5 index over the descriptive
+# columns, kept in sync with the tablet table by triggers. The content table
+# is a view joining each tablet to its monograph; monographs never change,
+# so the triggers look the text up by monograph_id.
+TABLET_FTS_COLUMNS = ('name', 'manufacturer', 'composition', 'use_cases', 'side_effects', 'precautions')
+MONOGRAPH_FIELDS = ('composition', 'use_cases', 'side_effects', 'precautions', 'storage_instructions')
+
+
+def _fts_values(ref):
+    return ', '.join(f"(SELECT {c} FROM monographs WHERE id = {ref}.monograph_id)" if c in MONOGRAPH_FIELDS
+                     else f"{ref}.{c}" for c in TABLET_FTS_COLUMNS)
+
+
+_fts_cols = ', '.join(TABLET_FTS_COLUMNS)
+TABLET_SEARCH_VIEW = (
+    "CREATE VIEW IF NOT EXISTS tablet_search AS "
+    "SELECT t.rowid AS tablet_rowid, t.id, t.name, t.manufacturer, t.batch_number, t.expiry_date, "
+    f"{', '.join(f'm.{c}' for c in MONOGRAPH_FIELDS)} "
+    "FROM tablet t LEFT JOIN monographs m ON m.id = t.monograph_id"
+)
+TABLET_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE tablet_fts USING fts5({_fts_cols}, content='tablet_search', "
+    f"content_rowid='tablet_rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS tablet_fts_ai AFTER INSERT ON tablet BEGIN "
+    f"INSERT INTO tablet_fts(rowid, {_fts_cols}) VALUES (new.rowid, {_fts_values('new')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS tablet_fts_ad AFTER DELETE ON tablet BEGIN "
+    f"INSERT INTO tablet_fts(tablet_fts, rowid, {_fts_cols}) VALUES ('delete', old.rowid, {_fts_values('old')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS tablet_fts_au AFTER UPDATE OF name, manufacturer, monograph_id ON tablet BEGIN "
+    f"INSERT INTO tablet_fts(tablet_fts, rowid, {_fts_cols}) VALUES ('delete', old.rowid, {_fts_values('old')}); "
+    f"INSERT INTO tablet_fts(rowid, {_fts_cols}) VALUES (new.rowid, {_fts_values('new')}); END",
+)
+LEGACY_FTS_DDL = (
+    "DROP TRIGGER IF EXISTS tablet_fts_ai",
+    "DROP TRIGGER IF EXISTS tablet_fts_ad",
+    "DROP TRIGGER IF EXISTS tablet_fts_au",
+    "DROP TABLE IF EXISTS tablet_fts",
+)
+
+
+def search_index_supported():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def rebuild_search_index():
+    """Repopulate the FTS index from the tablet table"""
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO tablet_fts(tablet_fts) VALUES ('rebuild')")
+        conn.exec_driver_sql("INSERT INTO tablet_fts(tablet_fts) VALUES ('optimize')")
+
+
+def ensure_search_index():
+    """Create the FTS table and triggers, indexing existing rows the first time"""
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(TABLET_SEARCH_VIEW)
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tablet_fts'"
+        ).first()
+        if not exists:
+            conn.exec_driver_sql(TABLET_FTS_DDL[0])
+            # Name and composition matches outrank mentions in side effects/precautions
+            conn.exec_driver_sql(
+                "INSERT INTO tablet_fts(tablet_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0, 3.0, 1.0, 1.0)')"
+            )
+        for statement in TABLET_FTS_DDL[1:]:
+            conn.exec_driver_sql(statement)
+    if not exists:
+        rebuild_search_index()
+
+
+def add_missing_columns(model):
+    """ALTER TABLE ADD COLUMN for nullable model columns the live table lacks"""
+    existing = {c['name'] for c in db.inspect(db.engine).get_columns(model.__tablename__)}
+    with db.engine.begin() as conn:
+        for column in model.__table__.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column_type}")
+
+
+def migrate_database():
+    """Create missing tables and indexes; safe to run against existing databases"""
+    db.create_all()
+    add_missing_columns(Tablet)
+    # create_all only builds indexes together with new tables
+    for model in (Tablet, ExpirySummary, ScanEvent):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    fold_monographs()
+    if search_index_supported():
+        ensure_search_index()
+    if expiry_summary_supported():
+        ensure_expiry_summary()
+    if cache_version_supported():
+        ensure_cache_version()
+    backfill_short_codes()
+
+
+# ============================================================================
+# PRODUCT MONOGRAPHS
+# ============================================================================
+def monograph_key(values):
+    """Content hash of the monograph fields (missing and empty text hash alike)"""
+    blob = json.dumps([values.get(f) or '' for f in MONOGRAPH_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def insert_ignoring_duplicates(table):
+    """INSERT that skips rows whose primary key already exists"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise RuntimeError(f"Monograph deduplication is not supported on {dialect}")
+    return insert(table).on_conflict_do_nothing()
+
+
+def store_monographs(rows):
+    """Move the monograph fields of each row dict into the shared table.
+
+    Every row gets a monograph_id in place of the text; text already stored
+    by an earlier pack of the same product is not written again. Runs in
+    the caller's session transaction.
+    """
+    monographs = {}
+    for row in rows:
+        values = {f: row.pop(f, None) or '' for f in MONOGRAPH_FIELDS}
+        row['monograph_id'] = key = monograph_key(values)
+        monographs.setdefault(key, dict(values, id=key))
+    if monographs:
+        db.session.execute(insert_ignoring_duplicates(Monograph.__table__), list(monographs.values()))
+
+
+class MonographCache:
+    """Bounded LRU of monograph rows keyed by content hash.
+
+    A monograph never changes once written (new text gets a new id), so
+    entries need no TTL and no invalidation.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, monograph_id):
+        with self._lock:
+            entry = self._entries.get(monograph_id)
+            if entry is not None:
+                self._entries.move_to_end(monograph_id)
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+        row = db.session.execute(
+            db.select(*[getattr(Monograph, f) for f in MONOGRAPH_FIELDS]).where(Monograph.id == monograph_id)
+        ).mappings().first()
+        if row is None:
+            return None
+        monograph = dict(row)
+        size = sum(len(v.encode('utf-8')) for v in monograph.values() if v)
+        with self._lock:
+            if monograph_id not in self._entries:
+                self._entries[monograph_id] = (monograph, size)
+                self._bytes += size
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.stats['evictions'] += 1
+        return monograph
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries,
+                        text_bytes=self._bytes)
+
+
+monograph_cache = MonographCache(app.config['MONOGRAPH_CACHE_SIZE'])
+
+
+def fold_monographs(chunk_size=5000):
+    """Move per-tablet text columns from older schemas into monographs.
+
+    Returns the number of tablets folded. The legacy columns are dropped
+    afterwards; on SQLite the freed pages are returned with VACUUM.
+    """
+    existing = {c['name'] for c in db.inspect(db.engine).get_columns('tablet')}
+    legacy = [f for f in MONOGRAPH_FIELDS if f in existing]
+    if not legacy:
+        return 0
+    log.info("Folding tablet text into monographs", extra={'columns': legacy})
+    if search_index_supported():
+        # The old index reads the text straight from tablet; it is rebuilt
+        # over the monograph view by ensure_search_index
+        with db.engine.begin() as conn:
+            for statement in LEGACY_FTS_DDL:
+                conn.exec_driver_sql(statement)
+
+    table = db.table('tablet', db.column('id'), db.column('monograph_id'), *[db.column(f) for f in legacy])
+    folded = 0
+    last_id = ''
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, *[table.c[f] for f in legacy])
+            .where(table.c.monograph_id.is_(None), table.c.id > last_id)
+            .order_by(table.c.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+        values = [dict(row) for row in rows]
+        store_monographs(values)
+        db.session.execute(
+            db.update(table).where(table.c.id == db.bindparam('tablet_id'))
+            .values(monograph_id=db.bindparam('folded_id')),
+            [{'tablet_id': v['id'], 'folded_id': v['monograph_id']} for v in values]
+        )
+        db.session.commit()
+        folded += len(values)
+        last_id = values[-1]['id']
+
+    with db.engine.begin() as conn:
+        for column in legacy:
+            conn.exec_driver_sql(f"ALTER TABLE tablet DROP COLUMN {column}")
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('VACUUM')
+    log.info("Folded tablet text into monographs", extra={'tablets': folded})
+    return folded
+
+
+# ============================================================================
+# SHORT CODES
+# ============================================================================
+# Crockford base32: no I, L, O or U, so codes survive being read aloud or
+# retyped. 8 characters give 2^40 codes.
+SHORT_CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+SHORT_CODE_LENGTH = 8
+_SHORT_CODE_FIXUPS = str.maketrans({'O': '0', 'I': '1', 'L': '1'})
+
+
+def normalize_short_code(code):
+    return code.strip().upper().translate(_SHORT_CODE_FIXUPS).replace('-', '')
+
+
+def generate_short_codes(count):
+    """Return count distinct short codes that are not yet in use"""
+    codes = set()
+    while len(codes) < count:
+        wanted = count - len(codes)
+        candidates = {''.join(secrets.choice(SHORT_CODE_ALPHABET) for _ in range(SHORT_CODE_LENGTH))
+                      for _ in range(wanted)}
+        taken = set()
+        candidate_list = list(candidates)
+        for start in range(0, len(candidate_list), 500):
+            taken.update(db.session.execute(
+                db.select(Tablet.short_code).where(Tablet.short_code.in_(candidate_list[start:start + 500]))
+            ).scalars())
+        codes.update(candidates - taken)
+    return list(codes)[:count]
+
+
+class ShortCodeCache:
+    """Bounded LRU of short code -> tablet id.
+
+    A code never changes once assigned, so entries need no TTL; a tablet
+    that is gone still fails on the scan page lookup that follows.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, code):
+        with self._lock:
+            tablet_id = self._entries.get(code)
+            if tablet_id is not None:
+                self._entries.move_to_end(code)
+                self.stats['hits'] += 1
+                return tablet_id
+            self.stats['misses'] += 1
+        tablet_id = db.session.execute(
+            db.select(Tablet.id).where(Tablet.short_code == code)
+        ).scalar()
+        if tablet_id is None:
+            return None
+        with self._lock:
+            self._entries[code] = tablet_id
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return tablet_id
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries)
+
+
+short_code_cache = ShortCodeCache(app.config['SHORT_CODE_CACHE_SIZE'])
+
+
+def backfill_short_codes(chunk_size=5000):
+    """Give every tablet created before short codes existed a code of its own"""
+    while True:
+        ids = db.session.execute(
+            db.select(Tablet.id).where(Tablet.short_code.is_(None)).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return
+        codes = generate_short_codes(len(ids))
+        db.session.execute(
+            db.update(Tablet.__table__).where(Tablet.__table__.c.id == db.bindparam('tablet_id'))
+            .values(short_code=db.bindparam('code')),
+            [{'tablet_id': tid, 'code': code} for tid, code in zip(ids, codes)]
+        )
+        db.session.commit()
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Bring the database schema up to date."""
+    migrate_database()
+    print("✅ Database migrated")
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index from the tablet table."""
+    if not search_index_supported():
+        print("❌ Full-text search index requires SQLite FTS5")
+        return
+    ensure_search_index()
+    rebuild_search_index()
+    print("✅ Search index rebuilt")
+
+
+@app.cli.command('rebuild-expiry-summary')
+def rebuild_expiry_summary_command():
+    """Recompute the per-batch expiry summary from the tablet table."""
+    rebuild_expiry_summary()
+    print("✅ Expiry summary rebuilt")
+
+
+# ============================================================================
+# QR CODE RENDERING & CACHE
+# ============================================================================
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_ERROR_CORRECTION = ('L', 'M', 'Q', 'H')
+QR_FORMATS = {
+    'json': 'application/json',
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def build_qr(qr_data, box_size=QR_BOX_SIZE, border=QR_BORDER, ec='L'):
+    """Encode qr_data into a QRCode whose module matrix is ready to draw"""
+    # Imported here so processes that never render (and never need Pillow
+    # behind qrcode's image factory) do not load it
+    import qrcode
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=getattr(qrcode.constants, f'ERROR_CORRECT_{ec}'),
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    return qr
+
+
+QR_RASTERIZERS = ('vector', 'pil')
+QR_PAYLOAD_MODES = ('uuid', 'short', 'signed')
+
+
+def pack_qr_rows(matrix, box_size):
+    """Pack each module row (True = dark) into one 1-bit pixel row, dark = 0.
+
+    Returns (width, rows). NumPy does it in one repeat/packbits pass;
+    without it each row is built once as a big integer.
+    """
+    numpy = optional_module('numpy')
+    if numpy is not None:
+        pixels = numpy.logical_not(numpy.array(matrix, dtype=bool)).repeat(box_size, axis=1)
+        return pixels.shape[1], [row.tobytes() for row in numpy.packbits(pixels, axis=1)]
+    width = len(matrix[0]) * box_size
+    row_bytes = (width + 7) // 8
+    padding = row_bytes * 8 - width
+    light = (1 << box_size) - 1
+    rows = []
+    for row in matrix:
+        bits = 0
+        for dark in row:
+            bits = (bits << box_size) | (0 if dark else light)
+        rows.append((bits << padding).to_bytes(row_bytes, 'big'))
+    return width, rows
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def encode_qr_png(matrix, box_size, compress_level=None):
+    """Encode a module matrix as a bit-depth-1 greyscale PNG.
+
+    Each module row becomes one scanline followed by box_size - 1 copies
+    written with the PNG 'Up' filter. Those copies are all zero bytes, so
+    zlib has almost nothing to do and the file stays small.
+    """
+    with timed_phase('qr_render_phase_seconds', 'draw'):
+        width, rows = pack_qr_rows(matrix, box_size)
+        repeat = (b'\x02' + bytes(len(rows[0]))) * (box_size - 1)
+        scanlines = b''.join(b'\x00' + row + repeat for row in rows)
+    with timed_phase('qr_render_phase_seconds', 'encode'):
+        level = app.config['QR_PNG_COMPRESS_LEVEL'] if compress_level is None else compress_level
+        height = len(rows) * box_size
+        return b''.join((
+            b'\x89PNG\r\n\x1a\n',
+            _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)),
+            _png_chunk(b'IDAT', zlib.compress(scanlines, level)),
+            _png_chunk(b'IEND', b''),
+        ))
+
+
+def render_qr_png(qr_data, box_size=QR_BOX_SIZE, border=QR_BORDER, ec='L', rasterizer=None):
+    """Build the QR matrix for qr_data and return it as PNG bytes.
+
+    The 'vector' rasterizer packs the module matrix into scanlines in one
+    pass and writes the PNG directly; 'pil' is qrcode's own image
+    factory, which draws one rectangle per dark module before Pillow
+    encodes it. Both produce the same pixels.
+    """
+    with timed_phase('qr_render_phase_seconds', 'matrix'):
+        qr = build_qr(qr_data, box_size, border, ec)
+    if (rasterizer or app.config['QR_RASTERIZER']) == 'vector':
+        return encode_qr_png(qr.get_matrix(), box_size)
+    with timed_phase('qr_render_phase_seconds', 'draw'):
+        img = qr.make_image(fill_color="black", back_color="white")
+    with timed_phase('qr_render_phase_seconds', 'encode'):
+        buffered = BytesIO()
+        img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+@functools.lru_cache(maxsize=int(os.environ.get('QR_MATRIX_CACHE_SIZE', 4096)))
+def qr_module_runs(qr_data, border=QR_BORDER, ec='L'):
+    """Return (size, runs) where runs are (x, y, length) stretches of dark modules"""
+    matrix = build_qr(qr_data, 1, border, ec).get_matrix()
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        size = len(row)
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append((start, y, x - start))
+            else:
+                x += 1
+    return len(matrix), tuple(runs)
+
+
+def render_qr_svg(qr_data, box_size=QR_BOX_SIZE, border=QR_BORDER, ec='L'):
+    """Draw the QR module matrix straight to SVG, one path run per dark stretch"""
+    with timed_phase('qr_render_phase_seconds', 'matrix'):
+        size, runs = qr_module_runs(qr_data, border, ec)
+    parts = [f"M{x} {y}h{n}v1h-{n}z" for x, y, n in runs]
+    pixels = size * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(parts)}"/></svg>'
+    ).encode('utf-8')
+
+
+# ============================================================================
+# SIGNED OFFLINE PAYLOADS
+# ============================================================================
+# A signed payload carries the essentials of a tablet so a scanner app can
+# verify and show them without reaching the server. Binary layout (all
+# integers big-endian), base32-encoded without padding:
+#
+#   version   1 byte   (OFFLINE_PAYLOAD_VERSION)
+#   tablet id 16 bytes (UUID)
+#   mfg date  2 bytes  (days since 2000-01-01)
+#   expiry    2 bytes  (days since 2000-01-01)
+#   batch     1 byte length + UTF-8, at most 20 bytes
+#   name      1 byte length + UTF-8, at most 32 bytes
+#   signature 16 bytes (HMAC-SHA256 over everything above, truncated)
+#
+# The QR text is <site>/V/<base32>, so phones without the app still land
+# on the scan page. Base32 and an upper-cased URL keep the whole code in
+# QR alphanumeric mode: at most 91 bytes -> 146 characters, so a typical
+# label is a version 6 (L) to 10 (H) code. See `python bench.py qrsize`.
+OFFLINE_PAYLOAD_VERSION = 1
+OFFLINE_EPOCH = date(2000, 1, 1)
+OFFLINE_MAX_DATE = OFFLINE_EPOCH + timedelta(days=0xFFFF)
+OFFLINE_SIGNATURE_BYTES = 16
+OFFLINE_MAX_BATCH_BYTES = 20
+OFFLINE_MAX_NAME_BYTES = 32
+
+
+def qr_signing_key():
+    """HMAC key from QR_SIGNING_KEY; signed payloads are disabled without one"""
+    key = app.config.get('QR_SIGNING_KEY')
+    if not key:
+        raise ValueError('Signed QR payloads need QR_SIGNING_KEY to be set')
+    return key.encode('utf-8') if isinstance(key, str) else key
+
+
+def check_payload_mode(mode):
+    """Validate a requested QR payload mode before any work is done"""
+    mode = mode or app.config['QR_PAYLOAD_MODE']
+    if mode not in QR_PAYLOAD_MODES:
+        raise ValueError(f"payload must be one of {', '.join(QR_PAYLOAD_MODES)}")
+    if mode == 'signed':
+        qr_signing_key()
+    return mode
+
+
+def offline_dates_fit(*dates):
+    """True if every date fits the payload's 2-byte day count"""
+    return all(OFFLINE_EPOCH <= d <= OFFLINE_MAX_DATE for d in dates)
+
+
+def _truncate_utf8(value, limit):
+    raw = (value or '').encode('utf-8')[:limit]
+    return raw.decode('utf-8', errors='ignore').encode('utf-8')
+
+
+def encode_offline_payload(tablet_id, name, batch_number, mfg_date, expiry_date, key=None):
+    """Pack and sign the key tablet fields; returns the base32 text"""
+    if not offline_dates_fit(mfg_date, expiry_date):
+        raise ValueError(f"Dates must fall between {OFFLINE_EPOCH} and {OFFLINE_MAX_DATE}")
+    batch = _truncate_utf8(batch_number, OFFLINE_MAX_BATCH_BYTES)
+    label = _truncate_utf8(name, OFFLINE_MAX_NAME_BYTES)
+    body = (bytes([OFFLINE_PAYLOAD_VERSION])
+            + uuid.UUID(tablet_id).bytes
+            + (mfg_date - OFFLINE_EPOCH).days.to_bytes(2, 'big')
+            + (expiry_date - OFFLINE_EPOCH).days.to_bytes(2, 'big')
+            + bytes([len(batch)]) + batch
+            + bytes([len(label)]) + label)
+    signature = hmac.new(key or qr_signing_key(), body, hashlib.sha256).digest()[:OFFLINE_SIGNATURE_BYTES]
+    return base64.b32encode(body + signature).decode('ascii').rstrip('=')
+
+
+def decode_offline_payload(text, key=None):
+    """Unpack a signed payload; raises ValueError if it is malformed or forged"""
+    try:
+        raw = base64.b32decode(text.upper() + '=' * (-len(text) % 8))
+        body, signature = raw[:-OFFLINE_SIGNATURE_BYTES], raw[-OFFLINE_SIGNATURE_BYTES:]
+        if body[0] != OFFLINE_PAYLOAD_VERSION:
+            raise ValueError(f"Unsupported payload version {body[0]}")
+        expected = hmac.new(key or qr_signing_key(), body, hashlib.sha256).digest()[:OFFLINE_SIGNATURE_BYTES]
+        if not hmac.compare_digest(signature, expected):
+            raise ValueError('Signature mismatch')
+        pos = 21
+        batch_len = body[pos]
+        batch = body[pos + 1:pos + 1 + batch_len].decode('utf-8')
+        pos += 1 + batch_len
+        name_len = body[pos]
+        name = body[pos + 1:pos + 1 + name_len].decode('utf-8')
+        if pos + 1 + name_len != len(body):
+            raise ValueError('Trailing bytes in payload')
+        return {
+            'id': str(uuid.UUID(bytes=body[1:17])),
+            'mfg_date': OFFLINE_EPOCH + timedelta(days=int.from_bytes(body[17:19], 'big')),
+            'expiry_date': OFFLINE_EPOCH + timedelta(days=int.from_bytes(body[19:21], 'big')),
+            'batch_number': batch,
+            'name': name,
+        }
+    except (IndexError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Malformed payload: {e}")
+
+
+def _tablet_field(tablet, name):
+    return tablet[name] if hasattr(tablet, 'keys') else getattr(tablet, name)
+
+
+def tablet_qr_payload(tablet, base_url, mode=None):
+    """The text encoded into a tablet's QR code.
+
+    'uuid' encodes the /info/<id> URL. 'short' encodes /i/<code> and
+    'signed' encodes /V/<signed payload>, falling back to the /info/<id>
+    URL for tablets whose dates the payload cannot carry (before 2000 or
+    after 2179), so one odd record never breaks a batch or label stream.
+    Both compact modes are
+    upper-cased when the app is served from the site root, so the whole
+    payload fits the QR alphanumeric mode (5.5 bits per character instead
+    of 8).
+    """
+    mode = mode or app.config['QR_PAYLOAD_MODE']
+    field = functools.partial(_tablet_field, tablet)
+    at_root = urlsplit(base_url).path in ('', '/')
+    if mode == 'signed' and offline_dates_fit(field('mfg_date'), field('expiry_date')):
+        blob = encode_offline_payload(field('id'), field('name'), field('batch_number'),
+                                      field('mfg_date'), field('expiry_date'))
+        return f"{base_url.upper() if at_root else base_url}V/{blob}"
+    if mode == 'short' and field('short_code'):
+        url = f"{base_url}i/{field('short_code')}"
+        return url.upper() if at_root else url
+    return f"{base_url}info/{field('id')}"
+
+
+QR_RENDERERS = {
+    'png': render_qr_png,
+    'svg': render_qr_svg,
+}
+
+
+class QRCache:
+    """Content-addressed cache of rendered QR images.
+
+    A bounded in-process LRU sits in front of a SQLite blob store that is
+    shared by every worker. Both tiers evict least recently used entries
+    once their byte budget is exceeded. The disk tier keeps its byte total
+    in a one-row table maintained by triggers, records last_access for
+    disk hits in batches, and does all SQLite work outside the lock that
+    memory hits take.
+    """
+
+    TOUCH_BATCH = 256        # disk hits buffered before last_access is written
+    TOUCH_INTERVAL = 5.0     # ... or after this many seconds
+    EVICT_CHUNK = 256        # most blobs one put may evict
+    EVICT_TO = 0.9           # evict down to this fraction of the budget
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS qr_blobs ("
+        "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL, data BLOB NOT NULL);"
+        "CREATE INDEX IF NOT EXISTS ix_qr_blobs_last_access ON qr_blobs (last_access);"
+        "CREATE TABLE IF NOT EXISTS qr_blobs_total (id INTEGER PRIMARY KEY CHECK (id = 1), bytes INTEGER NOT NULL);"
+        "INSERT OR IGNORE INTO qr_blobs_total (id, bytes) VALUES (1, 0);"
+        "CREATE TRIGGER IF NOT EXISTS qr_blobs_ai AFTER INSERT ON qr_blobs BEGIN "
+        "UPDATE qr_blobs_total SET bytes = bytes + new.size WHERE id = 1; END;"
+        "CREATE TRIGGER IF NOT EXISTS qr_blobs_ad AFTER DELETE ON qr_blobs BEGIN "
+        "UPDATE qr_blobs_total SET bytes = bytes - old.size WHERE id = 1; END;"
+        "CREATE TRIGGER IF NOT EXISTS qr_blobs_au AFTER UPDATE OF size ON qr_blobs BEGIN "
+        "UPDATE qr_blobs_total SET bytes = bytes + new.size - old.size WHERE id = 1; END;"
+    )
+
+    def __init__(self, path, memory_bytes, disk_bytes):
+        self.path = path
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._touched = {}
+        self._touch_due = time.monotonic() + self.TOUCH_INTERVAL
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                      'memory_evictions': 0, 'disk_evictions': 0}
+
+    @staticmethod
+    def make_key(kind, payload, **options):
+        """Hash the encoded payload together with its render options"""
+        opts = '&'.join(f"{k}={options[k]}" for k in sorted(options))
+        return hashlib.sha256(f"{kind}|{opts}|{payload}".encode('utf-8')).hexdigest()
+
+    def _db(self):
+        # One connection per thread, and never shared across forked workers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.stats['memory_evictions'] += 1
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return data
+        try:
+            row = self._db().execute("SELECT data FROM qr_blobs WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            log.warning("QR cache read failed", extra={'error': str(e)})
+            row = None
+        data = bytes(row[0]) if row is not None else None
+        touched = None
+        with self._lock:
+            if data is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, data)
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH or time.monotonic() >= self._touch_due:
+                touched, self._touched = self._touched, {}
+                self._touch_due = time.monotonic() + self.TOUCH_INTERVAL
+        if touched:
+            self._write_touches(touched)
+        return data
+
+    def _write_touches(self, touched):
+        try:
+            with self._db() as conn:
+                conn.executemany("UPDATE qr_blobs SET last_access = ? WHERE key = ?",
+                                 [(at, key) for key, at in touched.items()])
+        except sqlite3.Error as e:
+            log.warning("QR cache access update failed", extra={'error': str(e)})
+
+    def _evict(self, conn, total):
+        """Delete up to EVICT_CHUNK least recently used blobs.
+
+        Each over-budget put frees at most one chunk, so no single request
+        pays for a large eviction; the chunk frees far more than one put
+        adds, so the store converges back under budget.
+        """
+        target = int(self.disk_bytes * self.EVICT_TO)
+        victims = []
+        with conn:
+            for key, size in conn.execute(
+                "SELECT key, size FROM qr_blobs ORDER BY last_access LIMIT ?", (self.EVICT_CHUNK,)
+            ).fetchall():
+                if total <= target:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM qr_blobs WHERE key = ?", victims)
+        with self._lock:
+            self.stats['disk_evictions'] += len(victims)
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember(key, data)
+        try:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "INSERT INTO qr_blobs (key, size, last_access, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET size = excluded.size, "
+                    "last_access = excluded.last_access, data = excluded.data",
+                    (key, len(data), time.time(), sqlite3.Binary(data))
+                )
+                total = conn.execute("SELECT bytes FROM qr_blobs_total WHERE id = 1").fetchone()[0]
+            if total > self.disk_bytes:
+                self._evict(conn, total)
+        except sqlite3.Error as e:
+            log.warning("QR cache write failed", extra={'error': str(e)})
+
+    def missing(self, keys, chunk_size=500):
+        """Return the subset of keys held by neither tier, without reading any blobs"""
+        with self._lock:
+            absent = {key for key in keys if key not in self._memory}
+        pending = list(absent)
+        try:
+            conn = self._db()
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                marks = ','.join('?' * len(chunk))
+                absent.difference_update(
+                    row[0] for row in conn.execute(f"SELECT key FROM qr_blobs WHERE key IN ({marks})", chunk)
+                )
+        except sqlite3.Error as e:
+            log.warning("QR cache read failed", extra={'error': str(e)})
+        with self._lock:
+            self.stats['misses'] += len(absent)
+        return absent
+
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+            hits = self.stats['memory_hits'] + self.stats['disk_hits']
+            return dict(
+                self.stats,
+                memory_entries=len(self._memory),
+                memory_bytes=self._memory_size,
+                memory_limit_bytes=self.memory_bytes,
+                disk_limit_bytes=self.disk_bytes,
+                hit_ratio=round(hits / lookups, 4) if lookups else 0.0,
+            )
+
+
+qr_cache = QRCache(
+    app.config['QR_CACHE_PATH'],
+    app.config['QR_CACHE_MEMORY_BYTES'],
+    app.config['QR_CACHE_DISK_BYTES'],
+)
+
+# Worker processes render QR codes for batch requests. Small batches are
+# rendered inline because the pool round-trip would cost more than it saves.
+QR_POOL_MIN_BATCH = 16
+QR_POOL_CHUNK = 8           # payloads per pool task in a batch
+QR_POOL_WINDOW = 2          # chunks in flight per render worker
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    global _render_pool, _render_pool_pid
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            # The pool is created from a request thread while other threads
+            # (requests, metrics, logging, scan writer) may hold locks; a
+            # forked child would inherit them held. forkserver children
+            # start from a clean single-threaded process instead.
+            _render_pool = ProcessPoolExecutor(max_workers=app.config['QR_RENDER_WORKERS'],
+                                               mp_context=multiprocessing.get_context('forkserver'))
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+
+def discard_render_pool(pool):
+    """Drop a broken pool so the next render starts a fresh one"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    # Futures of a broken pool have already failed; nothing else is cancelled
+    pool.shutdown(wait=False)
+
+
+def render_qr_single(render, qr_data, options):
+    """Render one QR image for a request.
+
+    With QR_RENDER_OFFLOAD (set by gunicorn.conf.py for threaded workers)
+    the render runs in the pool, so the worker's other request threads
+    are not starved of the GIL by a 10 ms matrix build.
+    """
+    if app.config['QR_RENDER_OFFLOAD']:
+        pool = get_render_pool()
+        future = None
+        try:
+            future = pool.submit(render, qr_data, **options)
+            return future.result(timeout=app.config['QR_RENDER_TIMEOUT'])
+        except FutureTimeoutError:
+            # Give up on this render only; the pool and other threads' renders carry on
+            future.cancel()
+            log.warning("QR render timed out in the pool; rendering inline")
+        except (BrokenProcessPool, CancelledError, RuntimeError) as e:
+            # RuntimeError: the pool was shut down between get_render_pool and submit
+            log.warning("QR render pool failed; rendering inline", extra={'error': type(e).__name__})
+            if isinstance(e, BrokenProcessPool):
+                discard_render_pool(pool)
+    return render(qr_data, **options)
+
+
+def render_qr_chunk(payloads):
+    return [render_qr_png(p) for p in payloads]
+
+
+def render_qr_pngs(payloads):
+    """Yield a PNG for each payload in order.
+
+    Large batches go to the pool in chunks, with only a few chunks in
+    flight at once, so finished images never pile up ahead of the
+    consumer. A chunk that times out is rendered inline; if the pool
+    breaks, the rest of the batch is rendered inline.
+    """
+    workers = app.config['QR_RENDER_WORKERS']
+    if len(payloads) < QR_POOL_MIN_BATCH or workers <= 1:
+        yield from map(render_qr_png, payloads)
+        return
+    chunks = [payloads[i:i + QR_POOL_CHUNK] for i in range(0, len(payloads), QR_POOL_CHUNK)]
+    window = workers * QR_POOL_WINDOW
+    pool = get_render_pool()
+    futures = {}
+    submitted = 0
+
+    def abandon_pool(e):
+        log.warning("QR render pool failed during a batch; rendering inline", extra={'error': type(e).__name__})
+        if isinstance(e, BrokenProcessPool):
+            discard_render_pool(pool)
+        for future in futures.values():
+            future.cancel()
+        futures.clear()
+        return None
+
+    try:
+        for i, chunk in enumerate(chunks):
+            while pool is not None and submitted < min(len(chunks), i + window):
+                try:
+                    futures[submitted] = pool.submit(render_qr_chunk, chunks[submitted])
+                except (BrokenProcessPool, RuntimeError) as e:
+                    pool = abandon_pool(e)
+                    break
+                submitted += 1
+            future = futures.pop(i, None)
+            pngs = None
+            if future is not None:
+                try:
+                    pngs = future.result(timeout=app.config['QR_RENDER_TIMEOUT'])
+                except FutureTimeoutError:
+                    future.cancel()
+                    log.warning("QR batch chunk timed out in the pool; rendering inline")
+                except (BrokenProcessPool, CancelledError, RuntimeError) as e:
+                    pool = abandon_pool(e)
+            yield from pngs if pngs is not None else render_qr_chunk(chunk)
+    finally:
+        # The consumer may stop early (client gone); drop work nobody will read
+        for future in futures.values():
+            future.cancel()
+
+
+def render_qr_batch(payloads):
+    """Yield PNG bytes for each payload in order, using the cache and worker pool.
+
+    Only the cache index is consulted up front; cached images are read one
+    at a time as the caller consumes them, and missing ones are rendered a
+    window at a time, so a large batch never holds every PNG in memory.
+    """
+    keys = [QRCache.make_key('png', p, box_size=QR_BOX_SIZE, border=QR_BORDER, ec='L',
+                             rasterizer=app.config['QR_RASTERIZER']) for p in payloads]
+    missing = qr_cache.missing(keys)
+    rendered = render_qr_pngs([p for p, key in zip(payloads, keys) if key in missing])
+
+    try:
+        for payload, key in zip(payloads, keys):
+            if key in missing:
+                data = next(rendered)
+            else:
+                data = qr_cache.get(key)
+                if data is not None:
+                    yield data
+                    continue
+                # Evicted since the index check
+                data = render_qr_png(payload)
+            qr_cache.put(key, data)
+            yield data
+    finally:
+        rendered.close()
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only sink that lets zipfile emit an archive chunk by chunk"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """Stream (filename, bytes) pairs as a ZIP archive without buffering it whole"""
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+            yield sink.drain()
+    yield sink.drain()
+
+# ============================================================================
+# LABEL SHEETS
+# ============================================================================
+MM = 72 / 25.4  # points per millimetre
+
+# Page geometry in PDF points: page size, grid, outer margin and gutter
+LABEL_LAYOUTS = {
+    'a4': {'page': (210 * MM, 297 * MM), 'cols': 3, 'rows': 8, 'margin': 10 * MM, 'gap': 3 * MM},
+    'letter': {'page': (612, 792), 'cols': 3, 'rows': 10, 'margin': 36, 'gap': 9},
+    'roll-50x30': {'page': (50 * MM, 30 * MM), 'cols': 1, 'rows': 1, 'margin': 1.5 * MM, 'gap': 0},
+    'roll-40x25': {'page': (40 * MM, 25 * MM), 'cols': 1, 'rows': 1, 'margin': 1.5 * MM, 'gap': 0},
+}
+LABEL_FORMATS = ('pdf', 'png')
+
+
+def label_cells(layout):
+    """Yield the (x, y, width, height) of every label on a page, top-left origin"""
+    page_w, page_h = layout['page']
+    cols, rows, margin, gap = layout['cols'], layout['rows'], layout['margin'], layout['gap']
+    cell_w = (page_w - 2 * margin - (cols - 1) * gap) / cols
+    cell_h = (page_h - 2 * margin - (rows - 1) * gap) / rows
+    for r in range(rows):
+        for c in range(cols):
+            yield margin + c * (cell_w + gap), margin + r * (cell_h + gap), cell_w, cell_h
+
+
+def layout_label(cell, tablet, payload):
+    """Place one tablet's QR code and text lines inside a label cell"""
+    x, y, w, h = cell
+    pad = min(w, h) * 0.05
+    side = min(h - 2 * pad, w * 0.5)
+    text_x = x + side + 2 * pad
+    text_w = max(0, w - side - 3 * pad)
+    # Size text so a full "Exp: YYYY-MM-DD" line fits beside the code
+    size = max(4.0, min(9.0, side / 7, text_w / (0.556 * 16)))
+    max_chars = max(4, int(text_w / (0.556 * size)))
+    lines = [
+        (tablet['name'], True),
+        (f"Batch: {tablet['batch_number']}", False),
+        (f"Exp: {tablet['expiry_date'].strftime('%Y-%m-%d')}", False),
+        (tablet['manufacturer'], False),
+    ]
+    text = []
+    line_y = y + pad + size
+    for value, bold in lines:
+        if line_y > y + h - pad:
+            break
+        if len(value) > max_chars:
+            value = value[:max_chars - 1] + '…'
+        text.append((text_x, line_y, size, value, bold))
+        line_y += size * 1.3
+    return {'qr': (x + pad, y + (h - side) / 2, side), 'payload': payload, 'text': text}
+
+
+def _pdf_text(value):
+    raw = value.encode('cp1252', errors='replace')
+    return raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PdfLabelWriter:
+    """Minimal streaming PDF writer: pages are emitted as soon as they are drawn.
+
+    Object numbers: 1 catalog, 2 page tree (written last, once every page
+    id is known), 3-4 fonts, then a content stream and page object per page.
+    """
+
+    def __init__(self, page_size):
+        self.page_w, self.page_h = page_size
+        self.offset = 0
+        self.xref = {}
+        self.page_ids = []
+        self.next_id = 5
+
+    def _obj(self, num, body):
+        data = f"{num} 0 obj\n".encode() + body + b"\nendobj\n"
+        self.xref[num] = self.offset
+        self.offset += len(data)
+        return data
+
+    def header(self):
+        data = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.offset += len(data)
+        font = "<< /Type /Font /Subtype /Type1 /BaseFont /{} /Encoding /WinAnsiEncoding >>"
+        return (data
+                + self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+                + self._obj(3, font.format('Helvetica').encode())
+                + self._obj(4, font.format('Helvetica-Bold').encode()))
+
+    def page(self, labels):
+        """Draw QR modules as filled rectangles and text in the base-14 fonts"""
+        ops = [b"0 g"]
+        for label in labels:
+            qx, qy, side = label['qr']
+            size, runs = qr_module_runs(label['payload'])
+            m = side / size
+            top = self.page_h - qy
+            ops.extend(f"{qx + x * m:.2f} {top - (y + 1) * m:.2f} {n * m:.2f} {m:.2f} re".encode()
+                       for x, y, n in runs)
+            ops.append(b"f")
+            for tx, ty, font_size, value, bold in label['text']:
+                font = 'F2' if bold else 'F1'
+                ops.append(f"BT /{font} {font_size:.1f} Tf {tx:.2f} {self.page_h - ty:.2f} Td (".encode()
+                           + _pdf_text(value) + b") Tj ET")
+        stream = zlib.compress(b"\n".join(ops), 6)
+
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        out = self._obj(content_id, f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+                        + stream + b"\nendstream")
+        out += self._obj(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.page_w:.2f} {self.page_h:.2f}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        return out
+
+    def trailer(self):
+        kids = ' '.join(f"{pid} 0 R" for pid in self.page_ids)
+        out = self._obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        xref_at = self.offset
+        entries = ["0000000000 65535 f "] + [f"{self.xref[i]:010d} 00000 n " for i in range(1, self.next_id)]
+        out += f"xref\n0 {self.next_id}\n".encode() + ''.join(e + "\n" for e in entries).encode()
+        out += f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+        return out
+
+@functools.lru_cache(maxsize=32)
+def label_font(size_px, bold=False):
+    from PIL import ImageFont
+    name = 'DejaVuSans-Bold.ttf' if bold else 'DejaVuSans.ttf'
+    try:
+        return ImageFont.truetype(name, size_px)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def render_label_png(layout, labels, dpi):
+    """Rasterize one label page to a 1-bit PNG"""
+    from PIL import Image, ImageDraw
+    scale = dpi / 72
+    page_w, page_h = layout['page']
+    img = Image.new('1', (round(page_w * scale), round(page_h * scale)), 1)
+    draw = ImageDraw.Draw(img)
+    for label in labels:
+        qx, qy, side = label['qr']
+        size, runs = qr_module_runs(label['payload'])
+        m = side * scale / size
+        ox, oy = qx * scale, qy * scale
+        for x, y, n in runs:
+            draw.rectangle([round(ox + x * m), round(oy + y * m),
+                            round(ox + (x + n) * m) - 1, round(oy + (y + 1) * m) - 1], fill=0)
+        for tx, ty, font_size, value, bold in label['text']:
+            font = label_font(max(6, round(font_size * scale)), bold)
+            draw.text((tx * scale, ty * scale), value, fill=0, font=font, anchor='ls')
+    buffered = BytesIO()
+    img.save(buffered, format='PNG', optimize=False)
+    return buffered.getvalue()
+
+
+def iter_label_tablets(tablet_ids=None, batch_number=None, chunk_size=500):
+    """Stream the label and QR fields for a selection of tablets without loading them all"""
+    columns = (Tablet.id, Tablet.name, Tablet.manufacturer, Tablet.batch_number, Tablet.mfg_date,
+               Tablet.expiry_date, Tablet.short_code)
+    if tablet_ids:
+        for start in range(0, len(tablet_ids), chunk_size):
+            chunk = tablet_ids[start:start + chunk_size]
+            rows = db.session.execute(db.select(*columns).where(Tablet.id.in_(chunk))).mappings().all()
+            by_id = {row['id']: row for row in rows}
+            yield from (by_id[tid] for tid in chunk if tid in by_id)
+    else:
+        query = db.select(*columns).where(Tablet.batch_number == batch_number) \
+            .order_by(Tablet.created_at, Tablet.id).execution_options(yield_per=chunk_size)
+        yield from db.session.execute(query).mappings()
+
+
+def iter_label_pages(layout, tablets, base_url, payload_mode=None):
+    """Group tablets into pages of laid-out labels"""
+    cells = list(label_cells(layout))
+    page = []
+    for tablet in tablets:
+        payload = tablet_qr_payload(tablet, base_url, payload_mode)
+        page.append(layout_label(cells[len(page)], tablet, payload))
+        if len(page) == len(cells):
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def stream_label_pdf(layout, pages):
+    writer = PdfLabelWriter(layout['page'])
+    yield writer.header()
+    for labels in pages:
+        yield writer.page(labels)
+    yield writer.trailer()
+
+
+def stream_label_pngs(layout, pages, dpi):
+    def entries():
+        for number, labels in enumerate(pages, start=1):
+            yield f"labels-page-{number:04d}.png", render_label_png(layout, labels, dpi)
+    return stream_zip(entries())
+
+# ============================================================================
+# BULK TABLET INGESTION
+# ============================================================================
+TABLET_REQUIRED_FIELDS = ('name', 'manufacturer', 'batch_number', 'mfg_date', 'expiry_date',
+                          'composition', 'dosage', 'use_cases')
+TABLET_OPTIONAL_FIELDS = ('side_effects', 'precautions', 'storage_instructions')
+TABLET_DATE_FIELDS = ('mfg_date', 'expiry_date')
+
+
+def _column_limits():
+    return {
+        col.name: col.type.length
+        for col in Tablet.__table__.columns
+        if getattr(col.type, 'length', None)
+    }
+
+
+def validate_tablet_row(row, limits):
+    """Return (values, error) for one incoming tablet record"""
+    if not isinstance(row, dict):
+        return None, 'Row must be an object'
+    missing = [f for f in TABLET_REQUIRED_FIELDS if row.get(f) in (None, '')]
+    if missing:
+        return None, f"Missing required field(s): {', '.join(missing)}"
+
+    values = {f: str(row[f]).strip() for f in TABLET_REQUIRED_FIELDS}
+    for f in TABLET_OPTIONAL_FIELDS:
+        values[f] = str(row.get(f) or '')
+    for f in TABLET_DATE_FIELDS:
+        try:
+            # fromisoformat is several times faster than strptime for YYYY-MM-DD
+            values[f] = date.fromisoformat(values[f])
+        except ValueError:
+            return None, f"Invalid date for {f}: {values[f]!r} (expected YYYY-MM-DD)"
+    if values['expiry_date'] < values['mfg_date']:
+        return None, 'expiry_date is before mfg_date'
+    for f, limit in limits.items():
+        if f in values and isinstance(values[f], str) and len(values[f]) > limit:
+            return None, f"{f} exceeds {limit} characters"
+
+    values['id'] = str(uuid.uuid4())
+    return values, None
+
+
+def iter_bulk_rows():
+    """Yield incoming records from a JSON array, NDJSON stream or CSV upload"""
+    content_type = (request.mimetype or '').lower()
+
+    if 'file' in request.files:
+        upload = request.files['file']
+        yield from csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'))
+    elif content_type in ('text/csv', 'application/csv'):
+        yield from csv.DictReader(io.TextIOWrapper(request.stream, encoding='utf-8-sig'))
+    elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f"Invalid JSON line: {e}")
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('tablets')
+        if not isinstance(data, list):
+            raise ValueError('Expected a JSON array of tablets, NDJSON or a CSV upload')
+        yield from data
+
+
+def bulk_insert_tablets(rows, chunk_size, max_errors):
+    """Validate rows in a single pass and insert them in chunked transactions.
+
+    Returns (inserted_ids, errors, error_count, read_error). If the input
+    stops being readable part way through (a decode error in a CSV, a
+    broken upload), the rows read so far are still inserted and
+    read_error says where reading stopped; an input that cannot be read
+    at all raises ValueError as before.
+    """
+    limits = _column_limits()
+    created_at = datetime.utcnow()
+    inserted_ids = []
+    errors = []
+    error_count = 0
+    chunk = []
+    chunk_rows = []
+
+    def record_error(index, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < max_errors:
+            errors.append({'row': index, 'error': message})
+
+    def flush():
+        if not chunk:
+            return
+        try:
+            for values, code in zip(chunk, generate_short_codes(len(chunk))):
+                values['short_code'] = code
+            store_monographs(chunk)
+            db.session.execute(db.insert(Tablet), chunk)
+            db.session.commit()
+            inserted_ids.extend(v['id'] for v in chunk)
+        except Exception as e:
+            db.session.rollback()
+            for index in chunk_rows:
+                record_error(index, f"Chunk insert failed: {e}")
+        chunk.clear()
+        chunk_rows.clear()
+
+    rows = iter(rows)
+    read_error = None
+    index = 0
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            break
+        except (ValueError, csv.Error, OSError) as e:
+            if index == 0:
+                raise ValueError(str(e))
+            # Chunks already committed stay; report where the input broke off
+            read_error = f"Input unreadable from row {index} on; later rows were not processed: {e}"
+            break
+        if isinstance(row, Exception):
+            record_error(index, str(row))
+        else:
+            values, error = validate_tablet_row(row, limits)
+            if error:
+                record_error(index, error)
+            else:
+                values['created_at'] = created_at
+                chunk.append(values)
+                chunk_rows.append(index)
+                if len(chunk) >= chunk_size:
+                    flush()
+        index += 1
+    flush()
+
+    return inserted_ids, errors, error_count, read_error
+
+# ============================================================================
+# SCAN PAGE CACHE
+# ============================================================================
+def tablet_etag(tablet, today):
+    """Strong validator for the scan page: row contents plus the current date"""
+    fingerprint = json.dumps(tablet.to_dict(), sort_keys=True) + f"|{tablet.created_at}|{today.isoformat()}"
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:32]
+
+
+class PageCache:
+    """Bounded LRU of rendered pages that expire on TTL or day rollover"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, today):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['day'] != today or time.monotonic() - entry['stored'] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, today, **entry):
+        with self._lock:
+            self._entries[key] = dict(entry, day=today, stored=time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries)
+
+
+info_page_cache = PageCache(app.config['INFO_PAGE_CACHE_SIZE'], app.config['INFO_PAGE_CACHE_TTL'])
+
+
+@db.event.listens_for(Tablet, 'after_update')
+@db.event.listens_for(Tablet, 'after_delete')
+def _invalidate_tablet_pages(mapper, connection, target):
+    info_page_cache.invalidate(target.id)
+
+
+def cached_page_response(entry):
+    """Build the scan page response, answering 304 when the client copy is current"""
+    if request.if_none_match.contains(entry['etag']):
+        response = Response(status=304)
+    else:
+        response = Response(entry['html'], mimetype='text/html')
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    # Every scan revalidates here, so record_scan sees it; the 304 is cheap
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+# ============================================================================
+# TABLET RECORD CACHE
+# ============================================================================
+class TabletRecord:
+    """Read-only tablet backed by a cached row.
+
+    Offers the attributes, monograph text and to_dict() of Tablet, so the
+    scan page, JSON record and QR payload take either one.
+    """
+    __slots__ = ('_row',)
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        try:
+            return self._row[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    monograph = Tablet.monograph
+    composition = Tablet.composition
+    use_cases = Tablet.use_cases
+    side_effects = Tablet.side_effects
+    precautions = Tablet.precautions
+    storage_instructions = Tablet.storage_instructions
+    to_dict = Tablet.to_dict
+
+
+class TabletCache:
+    """Per-worker LRU/TTL of tablet rows, invalidated across processes.
+
+    Every process compares cache_version at most once per check interval
+    and drops its entries (and those of on_flush caches) when the version
+    moved, so a write in one gunicorn worker is seen by the others within
+    that interval. Writes made through this process's session invalidate
+    their own entry at once.
+    """
+
+    def __init__(self, max_entries, ttl, check_interval):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.on_flush = []
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._next_check = 0.0
+        self._generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'flushes': 0}
+
+    def sync_version(self):
+        now = time.monotonic()
+        if now < self._next_check or not cache_version_supported():
+            return
+        self._next_check = now + self.check_interval
+        version = db.session.execute(
+            db.select(CacheVersion.version).where(CacheVersion.id == 1)
+        ).scalar()
+        with self._lock:
+            if version == self._version:
+                return
+            flush = self._version is not None
+            self._version = version
+            if flush:
+                self._entries.clear()
+                self._generation += 1
+                self.stats['flushes'] += 1
+        if flush:
+            for callback in self.on_flush:
+                callback()
+
+    def get(self, tablet_id):
+        with self._lock:
+            entry = self._entries.get(tablet_id)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self._entries.move_to_end(tablet_id)
+                self.stats['hits'] += 1
+                return TabletRecord(entry[0])
+            if entry is not None:
+                del self._entries[tablet_id]
+            self.stats['misses'] += 1
+            generation = self._generation
+        row = db.session.execute(
+            db.select(*Tablet.__table__.columns).where(Tablet.id == tablet_id)
+        ).mappings().first()
+        if row is None:
+            return None
+        row = dict(row)
+        with self._lock:
+            # A flush while the row was being read means it may already be stale
+            if generation == self._generation:
+                self._entries[tablet_id] = (row, time.monotonic())
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return TabletRecord(row)
+
+    def invalidate(self, tablet_id):
+        with self._lock:
+            if self._entries.pop(tablet_id, None) is not None:
+                self.stats['invalidations'] += 1
+            self._generation += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries,
+                        version=self._version,
+                        hit_ratio=round(self.stats['hits'] / lookups, 4) if lookups else None)
+
+
+tablet_cache = TabletCache(app.config['TABLET_CACHE_SIZE'], app.config['TABLET_CACHE_TTL'],
+                           app.config['TABLET_CACHE_CHECK_INTERVAL'])
+tablet_cache.on_flush.append(info_page_cache.clear)
+
+
+@db.event.listens_for(Tablet, 'after_update')
+@db.event.listens_for(Tablet, 'after_delete')
+def _invalidate_tablet_record(mapper, connection, target):
+    tablet_cache.invalidate(target.id)
+
+
+@app.before_request
+def sync_tablet_cache():
+    tablet_cache.sync_version()
+
+
+def load_tablet_or_404(tablet_id):
+    """Tablet record for a request, from the per-worker cache when possible"""
+    tablet = tablet_cache.get(tablet_id)
+    if tablet is None:
+        abort(404)
+    return tablet
+
+# ============================================================================
+# TEMPLATES & PRECOMPRESSED PAGES
+# ============================================================================
+TEMPLATE_NAMES = ('index.html', 'info.html')
+
+
+class PrecompressedPage:
+    """A static page rendered once and kept in identity, gzip and brotli encodings"""
+
+    def __init__(self, html, max_age):
+        body = html.encode('utf-8')
+        self.max_age = max_age
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=11)
+
+    def response(self):
+        encoding = request.accept_encodings.best_match(
+            [e for e in ('br', 'gzip') if e in self.encodings], default='identity'
+        )
+        etag = self.etag if encoding == 'identity' else f"{self.etag}-{encoding}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.encodings[encoding], mimetype='text/html')
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f"public, max-age={self.max_age}"
+        return response
+
+
+index_page = None
+
+
+def warm_templates():
+    """Compile every template up front and prebuild the static index page"""
+    global index_page
+    for name in TEMPLATE_NAMES:
+        app.jinja_env.get_template(name)
+    index_page = PrecompressedPage(render_template('index.html'), app.config['INDEX_MAX_AGE'])
+
+
+# ============================================================================
+# TABLET LISTING
+# ============================================================================
+TABLET_FIELDS = ('id', 'name', 'manufacturer', 'batch_number', 'mfg_date', 'expiry_date', 'composition',
+                 'dosage', 'use_cases', 'side_effects', 'precautions', 'storage_instructions', 'created_at',
+                 'short_code', 'monograph_id')
+TABLET_LIST_DEFAULT_FIELDS = ('id', 'name', 'manufacturer', 'batch_number', 'mfg_date', 'expiry_date', 'dosage')
+TABLET_SORT_KEYS = ('created_at', 'expiry_date')
+
+
+def serialize_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def encode_cursor(sort_value, tablet_id):
+    raw = json.dumps([serialize_value(sort_value), tablet_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, tablet_id = json.loads(raw)
+        if sort == 'created_at':
+            sort_value = datetime.fromisoformat(sort_value)
+        else:
+            sort_value = date.fromisoformat(sort_value)
+        return sort_value, str(tablet_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_date_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be YYYY-MM-DD")
+
+
+def parse_fields_arg(args, default=TABLET_LIST_DEFAULT_FIELDS):
+    """Resolve ?fields= into a tuple of column names (id is always included)"""
+    value = args.get('fields')
+    if not value:
+        return default
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in TABLET_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return tuple(dict.fromkeys(['id'] + fields))
+
+
+def select_tablet_fields(fields):
+    """SELECT the named tablet fields, joining monographs only when their text is wanted"""
+    query = db.select(*[getattr(Monograph if f in MONOGRAPH_FIELDS else Tablet, f) for f in fields])
+    if any(f in MONOGRAPH_FIELDS for f in fields):
+        query = query.select_from(Tablet).outerjoin(Monograph, Monograph.id == Tablet.monograph_id)
+    return query
+
+
+def apply_tablet_filters(query, args):
+    """Apply manufacturer/batch/expiry-range filters shared by listing endpoints"""
+    if args.get('manufacturer'):
+        query = query.where(Tablet.manufacturer == args['manufacturer'])
+    if args.get('batch_number'):
+        query = query.where(Tablet.batch_number == args['batch_number'])
+    expiry_from = parse_date_arg(args, 'expiry_from')
+    expiry_to = parse_date_arg(args, 'expiry_to')
+    if expiry_from:
+        query = query.where(Tablet.expiry_date >= expiry_from)
+    if expiry_to:
+        query = query.where(Tablet.expiry_date <= expiry_to)
+    return query
+
+
+def list_tablets_page(args):
+    """Fetch one keyset-paginated page of tablets projected onto the requested fields"""
+    sort = args.get('sort', 'created_at')
+    if sort not in TABLET_SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(TABLET_SORT_KEYS)}")
+    descending = args.get('order', 'asc') == 'desc'
+    try:
+        limit = int(args.get('limit', app.config['LIST_DEFAULT_LIMIT']))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    limit = max(1, min(limit, app.config['LIST_MAX_LIMIT']))
+    fields = parse_fields_arg(args)
+
+    sort_column = getattr(Tablet, sort)
+    query = apply_tablet_filters(select_tablet_fields(tuple(dict.fromkeys(fields + (sort,)))), args)
+
+    if args.get('cursor'):
+        sort_value, last_id = decode_cursor(args['cursor'], sort)
+        position = db.tuple_(sort_column, Tablet.id)
+        query = query.where(position < (sort_value, last_id) if descending else position > (sort_value, last_id))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), Tablet.id.desc())
+    else:
+        query = query.order_by(sort_column, Tablet.id)
+
+    # Fetch one extra row to learn whether another page exists
+    rows = db.session.execute(query.limit(limit + 1)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    tablets = [{f: serialize_value(row[f]) for f in fields} for row in rows]
+    next_cursor = encode_cursor(rows[-1][sort], rows[-1]['id']) if has_more else None
+    return tablets, next_cursor
+
+# ============================================================================
+# CATALOG EXPORT
+# ============================================================================
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+def iter_export_chunks(args, fields, chunk_size):
+    """Yield lists of row mappings from a server-side cursor, chunk_size rows at a time"""
+    query = apply_tablet_filters(select_tablet_fields(fields), args) \
+        .order_by(Tablet.created_at, Tablet.id) \
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    result = db.session.execute(query).mappings()
+    for partition in result.partitions(chunk_size):
+        yield partition
 
-    def to_dict(self):
+
+def export_ndjson(chunks, fields):
+    for rows in chunks:
+        yield ''.join(
+            json.dumps({f: serialize_value(row[f]) for f in fields}, ensure_ascii=False) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+
+def export_csv(chunks, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in chunks:
+        writer.writerows([serialize_value(row[f]) for f in fields] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _arrow_schema(fields):
+    import pyarrow
+    types = {'mfg_date': pyarrow.date32(), 'expiry_date': pyarrow.date32(),
+             'created_at': pyarrow.timestamp('us')}
+    return pyarrow.schema([(f, types.get(f, pyarrow.string())) for f in fields])
+
+
+def export_arrow(chunks, fields, parquet):
+    """Write each chunk as a Parquet row group or Arrow IPC record batch"""
+    import pyarrow.ipc
+    import pyarrow.parquet
+    schema = _arrow_schema(fields)
+    sink = _ZipStream()
+    if parquet:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    with writer:
+        for rows in chunks:
+            columns = {f: [row[f] for row in rows] for f in fields}
+            writer.write_table(pyarrow.table(columns, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+# ============================================================================
+# FULL-TEXT SEARCH
+# ============================================================================
+_SEARCH_TOKEN = re.compile(r"\w+", re.UNICODE)
+SNIPPET_COLUMNS = ('composition', 'use_cases', 'side_effects', 'precautions', 'name')
+SNIPPET_WORDS = 12
+
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 query where every term must match as a prefix"""
+    terms = _SEARCH_TOKEN.findall(text)
+    if not terms:
+        return None
+    return ' '.join(f'"{t}"*' for t in terms)
+
+
+def make_snippet(row, terms):
+    """Highlight the first matching stretch of text with <mark> tags (HTML-escaped)"""
+    pattern = re.compile(r"\b(?:" + '|'.join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE)
+    for column in SNIPPET_COLUMNS:
+        text = row.get(column) or ''
+        match = pattern.search(text)
+        if not match:
+            continue
+        words = list(re.finditer(r"\S+", text))
+        hit = next(i for i, w in enumerate(words) if w.end() > match.start())
+        start = max(0, hit - SNIPPET_WORDS // 3)
+        window = text[words[start].start():words[min(len(words), start + SNIPPET_WORDS) - 1].end()]
+        highlighted = pattern.sub(lambda m: f"\x00{m.group(0)}\x01", window)
+        snippet = html.escape(highlighted).replace('\x00', '<mark>').replace('\x01', '</mark>')
+        prefix = '…' if start > 0 else ''
+        suffix = '…' if start + SNIPPET_WORDS < len(words) else ''
+        return {'field': column, 'text': f"{prefix}{snippet}{suffix}"}
+    return None
+
+
+def search_tablets(text, limit):
+    """Ranked full-text search over the descriptive tablet columns.
+
+    Returns (results, ranking): 'full' when every match was ranked,
+    'partial' when SEARCH_RANK_CANDIDATES cut the ranked set short, and
+    'unranked' for the substring fallback.
+    """
+    fts_query = build_fts_query(text)
+    if fts_query is None:
+        return [], 'full'
+    terms = _SEARCH_TOKEN.findall(text)
+    columns = ['id', 'name', 'manufacturer', 'batch_number', 'expiry_date'] + \
+        [c for c in SNIPPET_COLUMNS if c != 'name']
+
+    if not search_index_supported():
+        # Portable fallback for non-SQLite deployments: unranked substring match
+        pattern = f"%{text}%"
+        searched = [getattr(Monograph if c in MONOGRAPH_FIELDS else Tablet, c) for c in TABLET_FTS_COLUMNS]
+        query = select_tablet_fields(columns).where(db.or_(*[c.ilike(pattern) for c in searched])).limit(limit)
+        ranked = [(row, None) for row in db.session.execute(query).mappings().all()]
+        ranking = 'unranked'
+    else:
+        # Every match is ranked by default. SEARCH_RANK_CANDIDATES caps the
+        # ranked set for latency, but the candidates are simply the first
+        # matches in rowid order (the oldest tablets), so a capped search is
+        # reported as partial rather than passed off as the best matches
+        candidates = app.config['SEARCH_RANK_CANDIDATES']
+        ranking = 'full'
+        if candidates > 0:
+            top_sql = ("SELECT rowid, rank FROM (SELECT rowid, rank FROM tablet_fts WHERE tablet_fts MATCH :query "
+                       "LIMIT :candidates) ORDER BY rank LIMIT :limit")
+            matched = db.session.execute(
+                db.text("SELECT count(*) FROM (SELECT 1 FROM tablet_fts WHERE tablet_fts MATCH :query "
+                        "LIMIT :over)"), {'query': fts_query, 'over': candidates + 1}
+            ).scalar()
+            if matched > candidates:
+                ranking = 'partial'
+        else:
+            top_sql = "SELECT rowid, rank FROM tablet_fts WHERE tablet_fts MATCH :query ORDER BY rank LIMIT :limit"
+        top = db.session.execute(
+            db.text(top_sql), {'query': fts_query, 'candidates': candidates, 'limit': limit}
+        ).all()
+        if not top:
+            return [], ranking
+        rows = db.session.execute(
+            db.text(f"SELECT tablet_rowid AS rid, {', '.join(columns)} FROM tablet_search "
+                    f"WHERE tablet_rowid IN ({', '.join(str(int(r[0])) for r in top)})")
+        ).mappings().all()
+        by_rowid = {row['rid']: row for row in rows}
+        ranked = [(by_rowid[rowid], rank) for rowid, rank in top if rowid in by_rowid]
+
+    results = [{
+        'id': row['id'],
+        'name': row['name'],
+        'manufacturer': row['manufacturer'],
+        'batch_number': row['batch_number'],
+        'expiry_date': serialize_value(row['expiry_date']),
+        'rank': round(rank, 4) if rank is not None else None,
+        'snippet': make_snippet(row, terms),
+    } for row, rank in ranked]
+    return results, ranking
+
+# Ranking every match of a common term costs tens of milliseconds on a
+# large catalog, so the response to a query is cached. Keys carry the highest tablet rowid, so a
+# new tablet makes older entries unreachable; updates and deletes clear
+# the cache, locally through the ORM events and from other workers through
+# the tablet cache version.
+search_cache = PageCache(app.config['SEARCH_CACHE_SIZE'], app.config['SEARCH_CACHE_TTL'])
+tablet_cache.on_flush.append(search_cache.clear)
+
+
+@db.event.listens_for(Tablet, 'after_update')
+@db.event.listens_for(Tablet, 'after_delete')
+def _invalidate_search_results(mapper, connection, target):
+    search_cache.clear()
+
+
+def cached_search(text, limit):
+    """search_tablets through search_cache; returns (results, ranking)"""
+    if not search_index_supported():
+        return search_tablets(text, limit)
+    newest = db.session.execute(db.text("SELECT max(rowid) FROM tablet")).scalar()
+    key = (text, limit, app.config['SEARCH_RANK_CANDIDATES'], newest)
+    today = date.today()
+    entry = search_cache.get(key, today)
+    if entry is None:
+        results, ranking = search_tablets(text, limit)
+        search_cache.put(key, today, results=results, ranking=ranking)
+        return results, ranking
+    return entry['results'], entry['ranking']
+
+# ============================================================================
+# EXPIRING STOCK
+# ============================================================================
+def expiring_batches(today, within, include_expired=False, manufacturer=None):
+    """Per-batch counts of stock expiring between today and today + within days"""
+    until = today + timedelta(days=within)
+    # Without the SQLite triggers the summary is not maintained, so aggregate
+    # straight from the expiry_date index instead
+    if expiry_summary_supported():
+        count = db.func.sum(ExpirySummary.tablet_count)
+        columns = (ExpirySummary.manufacturer, ExpirySummary.batch_number, ExpirySummary.expiry_date)
+    else:
+        count = db.func.count()
+        columns = (Tablet.manufacturer, Tablet.batch_number, Tablet.expiry_date)
+    expiry_column = columns[2]
+
+    query = db.select(*columns, count.label('tablet_count')).where(expiry_column <= until)
+    if not include_expired:
+        query = query.where(expiry_column >= today)
+    if manufacturer:
+        query = query.where(columns[0] == manufacturer)
+    query = query.group_by(*columns).order_by(expiry_column, columns[0], columns[1])
+
+    return [{
+        'manufacturer': row[0],
+        'batch_number': row[1],
+        'expiry_date': row[2].strftime('%Y-%m-%d'),
+        'days_left': (row[2] - today).days,
+        'tablet_count': int(row[3]),
+    } for row in db.session.execute(query)]
+
+# ============================================================================
+# BULK VERIFICATION
+# ============================================================================
+VERIFY_STATES = ('found', 'unknown', 'invalid', 'expired', 'expiring_soon', 'valid')
+
+
+def parse_verify_code(value):
+    """Reduce a scanned value to ('id', tablet id) or ('short', code), or None.
+
+    Accepts a bare tablet id or short code as well as the full text of any
+    QR payload mode: /info/<id>, /i/<code> or /v/<signed payload>.
+    """
+    if not isinstance(value, str) or not 0 < len(value) <= 512:
+        return None
+    text = value.strip()
+    if '/' in text:
+        prefix, _, text = urlsplit(text).path.rstrip('/').rpartition('/')
+        if prefix.rpartition('/')[2].lower() == 'v':
+            try:
+                return 'id', decode_offline_payload(text)['id']
+            except ValueError:
+                return None
+    try:
+        return 'id', str(uuid.UUID(text))
+    except ValueError:
+        code = normalize_short_code(text)
+        if len(code) == SHORT_CODE_LENGTH and all(c in SHORT_CODE_ALPHABET for c in code):
+            return 'short', code
+        return None
+
+
+def expiry_state(expiry_date, today, within):
+    """Same thresholds as the warning on the scan page"""
+    days_left = (expiry_date - today).days
+    if days_left < 0:
+        return 'expired', days_left
+    if days_left < within:
+        return 'expiring_soon', days_left
+    return 'valid', days_left
+
+
+def verify_codes(codes, today, within, chunk_size):
+    """Yield lists of per-code results in input order, one indexed query per chunk"""
+    columns = (Tablet.id, Tablet.short_code, Tablet.batch_number, Tablet.expiry_date)
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size]
+        parsed = [parse_verify_code(code) for code in chunk]
+        ids = {p[1] for p in parsed if p and p[0] == 'id'}
+        shorts = {p[1] for p in parsed if p and p[0] == 'short'}
+        conditions = []
+        if ids:
+            conditions.append(Tablet.id.in_(ids))
+        if shorts:
+            conditions.append(Tablet.short_code.in_(shorts))
+        by_key = {}
+        if conditions:
+            for row in db.session.execute(db.select(*columns).where(db.or_(*conditions))):
+                by_key[('id', row.id)] = row
+                if row.short_code:
+                    by_key[('short', row.short_code)] = row
+
+        results = []
+        for code, key in zip(chunk, parsed):
+            row = by_key.get(key) if key else None
+            if row is None:
+                results.append({'code': code, 'status': 'unknown' if key else 'invalid'})
+                continue
+            state, days_left = expiry_state(row.expiry_date, today, within)
+            results.append({
+                'code': code,
+                'status': 'found',
+                'tablet_id': row.id,
+                'batch_number': row.batch_number,
+                'expiry_date': row.expiry_date.strftime('%Y-%m-%d'),
+                'expiry': state,
+                'days_left': days_left,
+            })
+        yield results
+
+
+def stream_verify_json(chunks, today, within):
+    """Stream {"as_of", "within_days", "results": [...], "summary"} chunk by chunk"""
+    summary = dict.fromkeys(VERIFY_STATES, 0)
+    yield json.dumps({'as_of': today.strftime('%Y-%m-%d'), 'within_days': within})[:-1] + ', "results": ['
+    separator = ''
+    for results in chunks:
+        for item in results:
+            summary[item['status']] += 1
+            if 'expiry' in item:
+                summary[item['expiry']] += 1
+        if results:
+            yield separator + ', '.join(json.dumps(item, ensure_ascii=False) for item in results)
+            separator = ', '
+    yield '], "summary": ' + json.dumps(summary) + '}'
+
+# ============================================================================
+# SCAN ANALYTICS
+# ============================================================================
+def classify_device(user_agent):
+    ua = (user_agent or '').lower()
+    if 'iphone' in ua or 'ipad' in ua:
+        return 'ios'
+    if 'android' in ua:
+        return 'android'
+    if 'windows' in ua or 'macintosh' in ua or 'linux' in ua:
+        return 'desktop'
+    return 'other'
+
+
+class ScanRecorder:
+    """Buffers scan events in memory and writes them behind the request.
+
+    record() only appends to a bounded ring buffer; a background thread
+    drains it in batched transactions every flush_interval seconds or as
+    soon as flush_batch events are waiting. When the buffer is full the
+    oldest events are dropped (and counted) rather than blocking scans.
+    """
+
+    def __init__(self, buffer_size, flush_batch, flush_interval):
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=buffer_size)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.stats = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'flush_errors': 0}
+
+    def _ensure_thread(self):
+        # Each forked gunicorn worker needs its own writer thread
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._buffer.clear()
+                self._thread = threading.Thread(target=self._run, name='scan-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def record(self, tablet_id, user_agent=None, language=None):
+        if self._pid != os.getpid():
+            self._ensure_thread()
+        if len(self._buffer) == self._buffer.maxlen:
+            self.stats['dropped'] += 1
+        self._buffer.append((tablet_id, datetime.utcnow(), classify_device(user_agent), language))
+        self.stats['recorded'] += 1
+        if len(self._buffer) >= self.flush_batch:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write every buffered event; safe to call from any thread"""
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.flush_batch:
+                    batch.append(self._buffer.popleft())
+                rows = [{'tablet_id': t, 'scanned_at': at, 'device': dev, 'language': lang}
+                        for t, at, dev, lang in batch]
+                try:
+                    with app.app_context():
+                        with db.engine.begin() as conn:
+                            conn.execute(db.insert(ScanEvent), rows)
+                    self.stats['flushed'] += len(rows)
+                except Exception as e:
+                    self.stats['flush_errors'] += 1
+                    log.error("Scan analytics flush failed", extra={'dropped_events': len(rows), 'error': str(e)})
+
+    def snapshot(self):
+        return dict(self.stats, pending=len(self._buffer))
+
+
+scan_recorder = ScanRecorder(
+    app.config['SCAN_BUFFER_SIZE'],
+    app.config['SCAN_FLUSH_BATCH'],
+    app.config['SCAN_FLUSH_INTERVAL'],
+)
+atexit.register(scan_recorder.flush)
+
+
+def record_scan(tablet_id):
+    if app.config['SCAN_ANALYTICS_ENABLED']:
+        accept_language = request.accept_languages.best
+        scan_recorder.record(
+            tablet_id,
+            request.headers.get('User-Agent'),
+            accept_language[:16] if accept_language else None,
+        )
+
+
+def scan_counts(group_by, since, limit, tablet_id=None, batch_number=None):
+    """Aggregate scan counts per tablet or per batch since a given time"""
+    if group_by == 'batch':
+        key_columns = (Tablet.manufacturer, Tablet.batch_number)
+        query = db.select(*key_columns, db.func.count().label('scans'),
+                          db.func.max(ScanEvent.scanned_at).label('last_scanned_at')) \
+            .join(Tablet, Tablet.id == ScanEvent.tablet_id)
+    else:
+        key_columns = (ScanEvent.tablet_id,)
+        query = db.select(*key_columns, db.func.count().label('scans'),
+                          db.func.max(ScanEvent.scanned_at).label('last_scanned_at'))
+        if batch_number:
+            query = query.join(Tablet, Tablet.id == ScanEvent.tablet_id)
+
+    query = query.where(ScanEvent.scanned_at >= since)
+    if tablet_id:
+        query = query.where(ScanEvent.tablet_id == tablet_id)
+    if batch_number:
+        query = query.where(Tablet.batch_number == batch_number)
+    query = query.group_by(*key_columns).order_by(db.desc('scans')).limit(limit)
+    return [{k: serialize_value(v) for k, v in row.items()}
+            for row in db.session.execute(query).mappings()]
+
+# ============================================================================
+# PROFILING
+# ============================================================================
+# Opt-in and off by default. The WSGI middleware is only installed when
+# PROFILE_SECRET or PROFILE_SAMPLE_EVERY is set, so a normal deployment
+# pays nothing. With a secret, a request carrying a valid X-Profile token
+# is profiled on its own and answered with an X-Profile-Id header; the
+# profile is then fetched from /api/profiles/<id> with the same header.
+# PROFILE_SAMPLE_EVERY=N folds every Nth request into a per-worker
+# aggregate pstats file instead, rewritten every few seconds while sampling
+# and at exit (id aggregate-<pid>). Streamed bodies are profiled only up to
+# the point the view returns.
+PROFILE_TOKEN_TTL = 300
+PROFILE_SAMPLE_INTERVAL = 0.001
+PROFILE_AGGREGATE_WRITE_INTERVAL = 5.0
+PROFILE_ID_PATTERN = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+PROFILE_EXTENSIONS = {'pstats': '.pstats', 'speedscope': '.speedscope.json'}
+
+
+def make_profile_token(secret, now=None):
+    """X-Profile header value: '<unix time>.<hex HMAC of it>'"""
+    stamp = str(int(now or time.time()))
+    return f"{stamp}.{hmac.new(secret.encode('utf-8'), stamp.encode('ascii'), hashlib.sha256).hexdigest()}"
+
+
+def verify_profile_token(secret, token, now=None):
+    stamp, _, signature = (token or '').partition('.')
+    if not secret or not stamp.isdigit() or abs((now or time.time()) - int(stamp)) > PROFILE_TOKEN_TTL:
+        return False
+    return hmac.compare_digest(make_profile_token(secret, int(stamp)).encode('utf-8'), token.encode('utf-8'))
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer; exports speedscope JSON"""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = []
+        self._frame_index = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _stack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self._frame_index.get(key)
+            if index is None:
+                index = self._frame_index[key] = len(self.frames)
+                self.frames.append({'name': key[0], 'file': key[1], 'line': key[2]})
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self.samples.append(self._stack(frame))
+                self.weights.append(now - last)
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def speedscope(self, name):
         return {
-            'id': self.id,
-            'name': self.name,
-            'manufacturer': self.manufacturer,
-            'batch_number': self.batch_number,
-            'mfg_date': self.mfg_date.strftime('%Y-%m-%d'),
-            'expiry_date': self.expiry_date.strftime('%Y-%m-%d'),
-            'composition': self.composition,
-            'dosage': self.dosage,
-            'use_cases': self.use_cases,
-            'side_effects': self.side_effects,
-            'precautions': self.precautions,
-            'storage_instructions': self.storage_instructions
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled', 'name': name, 'unit': 'seconds',
+                'startValue': 0, 'endValue': self.elapsed,
+                'samples': self.samples, 'weights': self.weights,
+            }],
+            'name': name,
+            'exporter': 'pharmaceutical-qr',
         }
 
-# Initialize database
-with app.app_context():
-    try:
-        db.create_all()
-        print("✅ Database initialized successfully")
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
+
+class ProfilingMiddleware:
+    """WSGI wrapper that profiles token-authorised or sampled requests"""
+
+    def __init__(self, wsgi_app, directory, secret, sample_every, fmt, max_files):
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.secret = secret
+        self.sample_every = sample_every
+        self.fmt = fmt
+        self.max_files = max_files
+        self._requests = 0
+        self._aggregate = None
+        self._aggregate_pid = None
+        self._aggregate_written = 0.0
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if self.secret and 'HTTP_X_PROFILE' in environ \
+                and verify_profile_token(self.secret, environ['HTTP_X_PROFILE']) \
+                and not environ.get('PATH_INFO', '').startswith('/api/profiles'):
+            return self._profile_request(environ, start_response)
+        if self.sample_every:
+            with self._lock:
+                self._requests += 1
+                sampled = self._requests % self.sample_every == 0
+            if sampled:
+                return self._sample_request(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def _profile_request(self, environ, start_response):
+        profile_id = f"{datetime.utcnow():%Y%m%d%H%M%S}-{secrets.token_hex(6)}"
+        name = f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')}"
+
+        def start_with_id(status, headers, exc_info=None):
+            return start_response(status, headers + [('X-Profile-Id', profile_id)], exc_info)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id + PROFILE_EXTENSIONS[self.fmt])
+        if self.fmt == 'speedscope':
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                return self.wsgi_app(environ, start_with_id)
+            finally:
+                sampler.stop()
+                with open(path, 'w') as f:
+                    json.dump(sampler.speedscope(name), f)
+                self._prune()
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self.wsgi_app, environ, start_with_id)
+        finally:
+            profiler.dump_stats(path)
+            self._prune()
+
+    def _sample_request(self, environ, start_response):
+        # One long-lived profiler per worker accumulates every sampled
+        # request; a request arriving while another is sampled runs plain
+        if not self._sample_lock.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            if self._aggregate is None or self._aggregate_pid != os.getpid():
+                self._aggregate = cProfile.Profile()
+                self._aggregate_pid = os.getpid()
+                self._aggregate_written = time.monotonic()
+            self._aggregate.enable()
+            try:
+                return self.wsgi_app(environ, start_response)
+            finally:
+                self._aggregate.disable()
+                if time.monotonic() - self._aggregate_written >= PROFILE_AGGREGATE_WRITE_INTERVAL:
+                    self._write_aggregate()
+        finally:
+            self._sample_lock.release()
+
+    def _write_aggregate(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._aggregate.dump_stats(os.path.join(self.directory, f"aggregate-{os.getpid()}.pstats"))
+        self._aggregate_written = time.monotonic()
+
+    def write_aggregate(self):
+        """Persist this worker's aggregate now (registered with atexit)"""
+        with self._sample_lock:
+            if self._aggregate is not None and self._aggregate_pid == os.getpid():
+                self._write_aggregate()
+
+    def _prune(self):
+        try:
+            entries = [e for e in os.scandir(self.directory) if not e.name.startswith('aggregate-')]
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:max(0, len(entries) - self.max_files)]:
+                os.remove(entry.path)
+        except OSError as e:
+            log.warning("Profile pruning failed", extra={'error': str(e)})
+
+
+def find_profile(profile_id):
+    """Path and format of a stored profile, or (None, None)"""
+    if PROFILE_ID_PATTERN.match(profile_id):
+        for fmt, extension in PROFILE_EXTENSIONS.items():
+            path = os.path.join(app.config['PROFILE_DIR'], profile_id + extension)
+            if os.path.exists(path):
+                return path, fmt
+    return None, None
+
+
+if app.config['PROFILE_FORMAT'] not in PROFILE_EXTENSIONS:
+    raise ValueError(f"PROFILE_FORMAT must be one of {', '.join(PROFILE_EXTENSIONS)}")
+if app.config['PROFILE_SECRET'] or app.config['PROFILE_SAMPLE_EVERY']:
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app,
+        app.config['PROFILE_DIR'],
+        app.config['PROFILE_SECRET'],
+        app.config['PROFILE_SAMPLE_EVERY'],
+        app.config['PROFILE_FORMAT'],
+        app.config['PROFILE_MAX_FILES'],
+    )
+    atexit.register(app.wsgi_app.write_aggregate)
+
+
+@app.cli.command('profile-token')
+def profile_token_command():
+    """Print an X-Profile header value valid for the next few minutes."""
+    if not app.config['PROFILE_SECRET']:
+        print("❌ Set PROFILE_SECRET to enable request profiling")
+        return
+    print(make_profile_token(app.config['PROFILE_SECRET']))
+
+# ============================================================================
+# REQUEST METRICS
+# ============================================================================
+def collect_cache_metrics():
+    qr_stats = qr_cache.snapshot()
+    matrix = qr_module_runs.cache_info()
+    page_stats = info_page_cache.snapshot()
+    monograph_stats = monograph_cache.snapshot()
+    tablet_stats = tablet_cache.snapshot()
+    search_stats = search_cache.snapshot()
+    short_code_stats = short_code_cache.snapshot()
+    scans = scan_recorder.snapshot()
+    return [
+        ('qr_cache_requests_total', {'result': 'memory_hit'}, qr_stats['memory_hits']),
+        ('qr_cache_requests_total', {'result': 'disk_hit'}, qr_stats['disk_hits']),
+        ('qr_cache_requests_total', {'result': 'miss'}, qr_stats['misses']),
+        ('qr_cache_evictions_total', {'tier': 'memory'}, qr_stats['memory_evictions']),
+        ('qr_cache_evictions_total', {'tier': 'disk'}, qr_stats['disk_evictions']),
+        ('qr_matrix_cache_requests_total', {'result': 'hit'}, matrix.hits),
+        ('qr_matrix_cache_requests_total', {'result': 'miss'}, matrix.misses),
+        ('info_page_cache_requests_total', {'result': 'hit'}, page_stats['hits']),
+        ('info_page_cache_requests_total', {'result': 'miss'}, page_stats['misses']),
+        ('monograph_cache_requests_total', {'result': 'hit'}, monograph_stats['hits']),
+        ('monograph_cache_requests_total', {'result': 'miss'}, monograph_stats['misses']),
+        ('tablet_cache_requests_total', {'result': 'hit'}, tablet_stats['hits']),
+        ('tablet_cache_requests_total', {'result': 'miss'}, tablet_stats['misses']),
+        ('tablet_cache_flushes_total', {}, tablet_stats['flushes']),
+        ('search_cache_requests_total', {'result': 'hit'}, search_stats['hits']),
+        ('search_cache_requests_total', {'result': 'miss'}, search_stats['misses']),
+        ('short_code_cache_requests_total', {'result': 'hit'}, short_code_stats['hits']),
+        ('short_code_cache_requests_total', {'result': 'miss'}, short_code_stats['misses']),
+        ('scan_events_total', {'state': 'recorded'}, scans['recorded']),
+        ('scan_events_total', {'state': 'flushed'}, scans['flushed']),
+        ('scan_events_total', {'state': 'dropped'}, scans['dropped']),
+    ]
+
+
+metrics.add_collector(collect_cache_metrics)
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.metrics_started = time.perf_counter()
+        g.metrics_db_seconds = 0.0
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies (exports, labels) are timed up to the first byte only
+    if 'metrics_started' in g:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - g.metrics_started,
+                        route=route, method=request.method)
+        metrics.observe('http_request_db_seconds', g.metrics_db_seconds, route=route)
+        metrics.inc('http_requests_total', route=route, method=request.method, status=response.status_code)
+    return response
+
+def route_error(message, error):
+    """Count and log an exception a route caught itself; returns the 500 response"""
+    metrics.inc('app_errors_total', type=type(error).__name__)
+    log.exception(message)
+    return jsonify({'success': False, 'error': str(error)}), 500
 
 # Global error handler for JSON errors
 @app.errorhandler(Exception)
 def handle_error(error):
-    print(f"Error occurred: {str(error)}")
-    traceback.print_exc()
+    metrics.inc('app_errors_total', type=type(error).__name__)
+    log.exception("Unhandled error")
     return jsonify({
         'success': False,
         'error': str(error),
@@ -67,407 +3183,14 @@ def handle_error(error):
 # ROOT ROUTE
 @app.route('/')
 def index():
-    html_template = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Pharmaceutical QR Code Manager</title>
-        <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }
-            
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                padding: 20px;
-            }
-            
-            .container {
-                max-width: 1200px;
-                margin: 0 auto;
-                background: white;
-                border-radius: 15px;
-                overflow: hidden;
-                box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            }
-            
-            .header {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                padding: 30px;
-                text-align: center;
-            }
-            
-            .header h1 {
-                font-size: 2.5em;
-                margin-bottom: 10px;
-            }
-            
-            .content {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 0;
-                min-height: 600px;
-            }
-            
-            .form-section, .qr-section {
-                padding: 30px;
-            }
-            
-            .form-section {
-                border-right: 1px solid #eee;
-            }
-            
-            .section-title {
-                font-size: 1.5em;
-                margin-bottom: 20px;
-                color: #333;
-                border-bottom: 2px solid #667eea;
-                padding-bottom: 10px;
-            }
-            
-            .form-group {
-                margin-bottom: 20px;
-            }
-            
-            .form-group label {
-                display: block;
-                margin-bottom: 5px;
-                font-weight: 600;
-                color: #555;
-            }
-            
-            .form-group input,
-            .form-group textarea {
-                width: 100%;
-                padding: 12px;
-                border: 2px solid #ddd;
-                border-radius: 8px;
-                font-size: 14px;
-                transition: border-color 0.3s;
-            }
-            
-            .form-group input:focus,
-            .form-group textarea:focus {
-                outline: none;
-                border-color: #667eea;
-            }
-            
-            .form-group textarea {
-                height: 80px;
-                resize: vertical;
-            }
-            
-            .form-row {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 15px;
-            }
-            
-            .btn {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                color: white;
-                padding: 15px 30px;
-                border: none;
-                border-radius: 8px;
-                font-size: 16px;
-                font-weight: 600;
-                cursor: pointer;
-                transition: transform 0.2s;
-                width: 100%;
-            }
-            
-            .btn:hover {
-                transform: translateY(-2px);
-            }
-            
-            .btn:disabled {
-                opacity: 0.6;
-                cursor: not-allowed;
-            }
-            
-            .qr-display {
-                text-align: center;
-                padding: 20px;
-                background: #f8f9fa;
-                border-radius: 10px;
-                min-height: 300px;
-                display: flex;
-                flex-direction: column;
-                justify-content: center;
-                align-items: center;
-            }
-            
-            .qr-code {
-                max-width: 250px;
-                border: 3px solid #667eea;
-                border-radius: 10px;
-                padding: 10px;
-                background: white;
-            }
-            
-            .tablet-info {
-                margin-top: 20px;
-                padding: 15px;
-                background: white;
-                border-radius: 8px;
-                border-left: 4px solid #667eea;
-                max-width: 300px;
-            }
-            
-            .success-message {
-                background: #d4edda;
-                color: #155724;
-                padding: 15px;
-                border-radius: 8px;
-                margin-bottom: 20px;
-                border-left: 4px solid #28a745;
-            }
-            
-            .error-message {
-                background: #f8d7da;
-                color: #721c24;
-                padding: 15px;
-                border-radius: 8px;
-                margin-bottom: 20px;
-                border-left: 4px solid #dc3545;
-            }
-            
-            .loading {
-                display: inline-block;
-                width: 20px;
-                height: 20px;
-                border: 3px solid rgba(255,255,255,.3);
-                border-radius: 50%;
-                border-top-color: #fff;
-                animation: spin 1s ease-in-out infinite;
-            }
-            
-            @keyframes spin {
-                to { transform: rotate(360deg); }
-            }
-            
-            @media (max-width: 768px) {
-                .content {
-                    grid-template-columns: 1fr;
-                }
-                
-                .form-section {
-                    border-right: none;
-                    border-bottom: 1px solid #eee;
-                }
-                
-                .form-row {
-                    grid-template-columns: 1fr;
-                }
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>📋 Pharmaceutical QR Code Manager</h1>
-                <p>Create and manage QR codes for tablet information</p>
-            </div>
-            
-            <div class="content">
-                <div class="form-section">
-                    <h2 class="section-title">Add New Tablet</h2>
-                    
-                    <div id="messages"></div>
-                    
-                    <form id="tabletForm">
-                        <div class="form-group">
-                            <label for="name">Tablet Name *</label>
-                            <input type="text" id="name" name="name" required placeholder="e.g., Paracetamol">
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="manufacturer">Manufacturer *</label>
-                            <input type="text" id="manufacturer" name="manufacturer" required placeholder="e.g., ABC Pharmaceuticals">
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="batch_number">Batch Number *</label>
-                            <input type="text" id="batch_number" name="batch_number" required placeholder="e.g., BTH001234">
-                        </div>
-                        
-                        <div class="form-row">
-                            <div class="form-group">
-                                <label for="mfg_date">Manufacturing Date *</label>
-                                <input type="date" id="mfg_date" name="mfg_date" required>
-                            </div>
-                            
-                            <div class="form-group">
-                                <label for="expiry_date">Expiry Date *</label>
-                                <input type="date" id="expiry_date" name="expiry_date" required>
-                            </div>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="composition">Composition *</label>
-                            <textarea id="composition" name="composition" placeholder="Active ingredients and their quantities" required></textarea>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="dosage">Dosage *</label>
-                            <input type="text" id="dosage" name="dosage" placeholder="e.g., 500mg twice daily" required>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="use_cases">Medical Uses *</label>
-                            <textarea id="use_cases" name="use_cases" placeholder="Conditions this medication treats" required></textarea>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="side_effects">Side Effects</label>
-                            <textarea id="side_effects" name="side_effects" placeholder="Common side effects"></textarea>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="precautions">Precautions</label>
-                            <textarea id="precautions" name="precautions" placeholder="Important precautions and warnings"></textarea>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="storage_instructions">Storage Instructions</label>
-                            <textarea id="storage_instructions" name="storage_instructions" placeholder="How to store this medication"></textarea>
-                        </div>
-                        
-                        <button type="submit" class="btn" id="submitBtn">Create Tablet & Generate QR Code</button>
-                    </form>
-                </div>
-                
-                <div class="qr-section">
-                    <h2 class="section-title">Generated QR Code</h2>
-                    
-                    <div class="qr-display" id="qrDisplay">
-                        <p>Fill out the form and submit to generate a QR code</p>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <script>
-            document.getElementById('tabletForm').addEventListener('submit', async function(e) {
-                e.preventDefault();
-                
-                const formData = new FormData(this);
-                const data = Object.fromEntries(formData);
-                
-                const submitBtn = document.getElementById('submitBtn');
-                submitBtn.disabled = true;
-                submitBtn.innerHTML = '<span class="loading"></span> Processing...';
-                
-                // Clear previous messages
-                document.getElementById('messages').innerHTML = '';
-                
-                try {
-                    // Create tablet with better error handling
-                    const response = await fetch('/api/tablets', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify(data)
-                    });
-                    
-                    // Check if response is ok
-                    if (!response.ok) {
-                        throw new Error(`HTTP error! status: ${response.status}`);
-                    }
-                    
-                    // Check if response has content
-                    const contentType = response.headers.get("content-type");
-                    if (!contentType || !contentType.includes("application/json")) {
-                        throw new Error("Server didn't return JSON! Check server logs.");
-                    }
-                    
-                    const result = await response.json();
-                    
-                    if (result.success) {
-                        // Show success message
-                        document.getElementById('messages').innerHTML = `
-                            <div class="success-message">
-                                ✅ Tablet created successfully! Generating QR code...
-                            </div>
-                        `;
-                        
-                        // Generate QR code
-                        const qrResponse = await fetch(`/api/qrcode/${result.tablet_id}`);
-                        
-                        if (!qrResponse.ok) {
-                            throw new Error(`QR generation failed! status: ${qrResponse.status}`);
-                        }
-                        
-                        const qrData = await qrResponse.json();
-                        
-                        // Display QR code
-                        document.getElementById('qrDisplay').innerHTML = `
-                            <img src="${qrData.qr_code}" alt="QR Code" class="qr-code">
-                            <div class="tablet-info">
-                                <h3>${qrData.tablet_info.name}</h3>
-                                <p><strong>Manufacturer:</strong> ${qrData.tablet_info.manufacturer}</p>
-                                <p><strong>Batch:</strong> ${qrData.tablet_info.batch_number}</p>
-                                <p><strong>Expires:</strong> ${qrData.tablet_info.expiry_date}</p>
-                                <button onclick="downloadQR('${qrData.qr_code}', '${qrData.tablet_info.name}_${qrData.tablet_info.batch_number}.png')" class="btn" style="margin-top: 10px; padding: 8px 16px; font-size: 14px;">
-                                    Download QR Code
-                                </button>
-                            </div>
-                        `;
-                        
-                        document.getElementById('messages').innerHTML = `
-                            <div class="success-message">
-                                ✅ Tablet created and QR code generated successfully!
-                            </div>
-                        `;
-                        
-                        // Reset form
-                        this.reset();
-                    } else {
-                        document.getElementById('messages').innerHTML = `
-                            <div class="error-message">
-                                ❌ Error: ${result.error || 'Unknown error occurred'}
-                            </div>
-                        `;
-                    }
-                } catch (error) {
-                    console.error('Full error:', error);
-                    document.getElementById('messages').innerHTML = `
-                        <div class="error-message">
-                            ❌ Error: ${error.message}<br>
-                            <small>Check browser console for more details</small>
-                        </div>
-                    `;
-                } finally {
-                    submitBtn.disabled = false;
-                    submitBtn.textContent = 'Create Tablet & Generate QR Code';
-                }
-            });
-            
-            function downloadQR(dataUrl, filename) {
-                const link = document.createElement('a');
-                link.download = filename;
-                link.href = dataUrl;
-                link.click();
-            }
-        </script>
-    </body>
-    </html>
-    """
-    return render_template_string(html_template)
+    if index_page is None:
+        warm_templates()
+    return index_page.response()
 
 # API Routes with improved error handling
 @app.route('/api/tablets', methods=['POST'])
 def create_tablet():
     try:
-        print("Received POST request to /api/tablets")
         data = request.json
         
         if not data:
@@ -476,26 +3199,29 @@ def create_tablet():
                 'error': 'No JSON data received'
             }), 400
         
-        print(f"Data received: {data}")
-        
+        monograph = {
+            'composition': data['composition'],
+            'use_cases': data['use_cases'],
+            'side_effects': data.get('side_effects', ''),
+            'precautions': data.get('precautions', ''),
+            'storage_instructions': data.get('storage_instructions', '')
+        }
         tablet = Tablet(
             name=data['name'],
             manufacturer=data['manufacturer'],
             batch_number=data['batch_number'],
             mfg_date=datetime.strptime(data['mfg_date'], '%Y-%m-%d').date(),
             expiry_date=datetime.strptime(data['expiry_date'], '%Y-%m-%d').date(),
-            composition=data['composition'],
             dosage=data['dosage'],
-            use_cases=data['use_cases'],
-            side_effects=data.get('side_effects', ''),
-            precautions=data.get('precautions', ''),
-            storage_instructions=data.get('storage_instructions', '')
+            short_code=generate_short_codes(1)[0]
         )
+        store_monographs([monograph])
+        tablet.monograph_id = monograph['monograph_id']
         
         db.session.add(tablet)
         db.session.commit()
         
-        print(f"Tablet created successfully with ID: {tablet.id}")
+        log.info("Tablet created", extra={'tablet_id': tablet.id, 'batch_number': tablet.batch_number})
         
         return jsonify({
             'success': True,
@@ -505,251 +3231,551 @@ def create_tablet():
         
     except KeyError as e:
         error_msg = f'Missing required field: {str(e)}'
-        print(f"KeyError: {error_msg}")
+        log.warning("Tablet rejected", extra={'error': error_msg})
         return jsonify({'success': False, 'error': error_msg}), 400
         
     except Exception as e:
-        error_msg = str(e)
-        print(f"Error creating tablet: {error_msg}")
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': error_msg}), 500
+        return route_error("Error creating tablet", e)
+
+@app.route('/api/tablets/bulk', methods=['POST'])
+def create_tablets_bulk():
+    try:
+        started = time.perf_counter()
+        inserted_ids, errors, error_count, read_error = bulk_insert_tablets(
+            iter_bulk_rows(),
+            app.config['BULK_CHUNK_SIZE'],
+            app.config['BULK_MAX_ERRORS'],
+        )
+        elapsed = time.perf_counter() - started
+        log.info("Bulk import finished", extra={'inserted': len(inserted_ids), 'rejected': error_count,
+                                                'read_error': read_error, 'seconds': round(elapsed, 3)})
+        
+        status = 201 if inserted_ids else 400
+        return jsonify({
+            'success': error_count == 0 and read_error is None,
+            'inserted': len(inserted_ids),
+            'failed': error_count,
+            'tablet_ids': inserted_ids,
+            'errors': errors,
+            'errors_truncated': error_count > len(errors),
+            'read_error': read_error
+        }), status
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+        
+    except Exception as e:
+        db.session.rollback()
+        return route_error("Error in bulk import", e)
+
+@app.route('/api/tablets', methods=['GET'])
+def list_tablets():
+    try:
+        tablets, next_cursor = list_tablets_page(request.args)
+        return jsonify({
+            'tablets': tablets,
+            'count': len(tablets),
+            'next_cursor': next_cursor
+        }), 200
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return route_error("Error listing tablets", e)
+
+@app.route('/api/tablets/search', methods=['GET'])
+def search_tablets_route():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'Missing search query (q)'}), 400
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, app.config['SEARCH_MAX_LIMIT']))
+        
+        results, ranking = cached_search(query, limit)
+        return jsonify({'query': query, 'count': len(results), 'ranking': ranking, 'results': results}), 200
+    except Exception as e:
+        return route_error("Error searching tablets", e)
 
 @app.route('/api/tablets/<tablet_id>', methods=['GET'])
 def get_tablet(tablet_id):
     try:
-        tablet = Tablet.query.get_or_404(tablet_id)
+        tablet = load_tablet_or_404(tablet_id)
         return jsonify(tablet.to_dict()), 200
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 404
 
+def parse_qr_options(args):
+    """Read box size, border and error-correction level from query arguments"""
+    try:
+        box_size = int(args.get('box_size', QR_BOX_SIZE))
+        border = int(args.get('border', QR_BORDER))
+    except ValueError:
+        raise ValueError('box_size and border must be integers')
+    ec = args.get('ec', 'L').upper()
+    if not 1 <= box_size <= 50:
+        raise ValueError('box_size must be between 1 and 50')
+    if not 0 <= border <= 20:
+        raise ValueError('border must be between 0 and 20')
+    if ec not in QR_ERROR_CORRECTION:
+        raise ValueError('ec must be one of L, M, Q, H')
+    check_payload_mode(args.get('payload'))
+    if args.get('rasterizer') not in (None,) + QR_RASTERIZERS:
+        raise ValueError(f"rasterizer must be one of {', '.join(QR_RASTERIZERS)}")
+    return {'box_size': box_size, 'border': border, 'ec': ec}
+
+
+def negotiate_qr_format():
+    """Pick json/png/svg from ?format= or the Accept header (JSON by default)"""
+    fmt = request.args.get('format')
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(QR_FORMATS)}")
+        return fmt
+    best = request.accept_mimetypes.best_match(list(QR_FORMATS.values()), default='application/json')
+    return next(k for k, v in QR_FORMATS.items() if v == best)
+
+
 @app.route('/api/qrcode/<tablet_id>')
 def generate_qr_code(tablet_id):
     try:
-        print(f"Generating QR code for tablet ID: {tablet_id}")
-        tablet = Tablet.query.get_or_404(tablet_id)
+        try:
+            fmt = negotiate_qr_format()
+            options = parse_qr_options(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        tablet = load_tablet_or_404(tablet_id)
         
         # Create QR code data URL - THIS IS WHERE THE NETWORK IP IS USED
         base_url = request.url_root
-        qr_data = f"{base_url}info/{tablet_id}"
+        qr_data = tablet_qr_payload(tablet, base_url, request.args.get('payload'))
+        
+        # Generate QR code (served from the cache when already rendered)
+        kind = 'svg' if fmt == 'svg' else 'png'
+        render = QR_RENDERERS[kind]
+        if kind == 'png':
+            options['rasterizer'] = request.args.get('rasterizer') or app.config['QR_RASTERIZER']
+        cache_key = QRCache.make_key(kind, qr_data, **options)
+        image = qr_cache.get_or_render(cache_key, lambda: render_qr_single(render, qr_data, options))
+        log.debug("QR code served", extra={'tablet_id': tablet_id, 'qr_data': qr_data, 'format': fmt})
+        
+        if fmt != 'json':
+            return Response(
+                image,
+                mimetype=QR_FORMATS[fmt],
+                headers={'Content-Disposition': f'inline; filename="{tablet_id}.{fmt}"'}
+            )
+        
+        with timed_phase('qr_render_phase_seconds', 'base64'):
+            img_str = base64.b64encode(image).decode()
+        return jsonify({
+            'qr_code': f"data:image/png;base64,{img_str}",
+            'qr_data': qr_data,
+            'tablet_info': tablet.to_dict()
+        }), 200
+        
+    except Exception as e:
+        return route_error("Error generating QR code", e)
+
+@app.route('/api/qrcode/batch', methods=['POST'])
+def generate_qr_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        tablet_ids = data.get('tablet_ids')
+        batch_number = data.get('batch_number')
+        
+        try:
+            check_payload_mode(data.get('payload'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        if tablet_ids:
+            if not isinstance(tablet_ids, list) or not all(isinstance(t, str) for t in tablet_ids):
+                return jsonify({'success': False, 'error': 'tablet_ids must be a list of strings'}), 400
+            tablet_ids = list(dict.fromkeys(tablet_ids))
+            total = len(tablet_ids)
+        elif batch_number:
+            total = db.session.execute(
+                db.select(db.func.count()).select_from(Tablet).where(Tablet.batch_number == batch_number)
+            ).scalar()
+        else:
+            return jsonify({'success': False, 'error': 'Provide tablet_ids or batch_number'}), 400
+        
+        # Checked before any rows are loaded, so an oversized request costs one count at most
+        if total > app.config['QR_BATCH_MAX']:
+            return jsonify({
+                'success': False,
+                'error': f"Batch too large: {total} tablets (max {app.config['QR_BATCH_MAX']})"
+            }), 413
+        
+        base_url = request.url_root
+        rows = [(t['id'], t['name'], t['batch_number'], t['expiry_date'].strftime('%Y-%m-%d'),
+                 tablet_qr_payload(t, base_url, data.get('payload')))
+                for t in iter_label_tablets(tablet_ids, batch_number)]
+        if not rows:
+            return jsonify({'success': False, 'error': 'No matching tablets found'}), 404
+        log.info("Rendering QR batch", extra={'count': len(rows), 'batch_number': batch_number})
         
-        print(f"QR Code will point to: {qr_data}")
+        def entries():
+            manifest = io.StringIO()
+            writer = csv.writer(manifest)
+            writer.writerow(['tablet_id', 'name', 'batch_number', 'expiry_date', 'qr_data', 'filename'])
+            for row, png in zip(rows, render_qr_batch([r[4] for r in rows])):
+                filename = f"{row[0]}.png"
+                writer.writerow(list(row) + [filename])
+                yield filename, png
+            yield 'manifest.csv', manifest.getvalue().encode('utf-8')
         
-        # Generate QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
+        archive_name = f"qrcodes_{batch_number or 'selection'}.zip"
+        return Response(
+            stream_zip(entries()),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename="{archive_name}"'}
         )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
         
-        # Create QR code image
-        img = qr.make_image(fill_color="black", back_color="white")
+    except Exception as e:
+        return route_error("Error generating QR batch", e)
+
+@app.route('/api/labels', methods=['GET', 'POST'])
+def label_sheets():
+    try:
+        params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+        tablet_ids = params.get('tablet_ids')
+        batch_number = params.get('batch_number')
+        layout_name = params.get('layout', 'a4')
+        fmt = params.get('format', 'pdf')
         
-        # Convert to base64
-        buffered = BytesIO()
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        if layout_name not in LABEL_LAYOUTS:
+            return jsonify({'success': False, 'error': f"layout must be one of {', '.join(LABEL_LAYOUTS)}"}), 400
+        if fmt not in LABEL_FORMATS:
+            return jsonify({'success': False, 'error': f"format must be one of {', '.join(LABEL_FORMATS)}"}), 400
+        try:
+            check_payload_mode(params.get('payload'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if isinstance(tablet_ids, str):
+            tablet_ids = [t for t in tablet_ids.split(',') if t]
+        
+        if tablet_ids:
+            if not isinstance(tablet_ids, list) or not all(isinstance(t, str) for t in tablet_ids):
+                return jsonify({'success': False, 'error': 'tablet_ids must be a list of strings'}), 400
+            total = len(tablet_ids)
+        elif batch_number:
+            total = db.session.execute(
+                db.select(db.func.count()).select_from(Tablet).where(Tablet.batch_number == batch_number)
+            ).scalar()
+        else:
+            return jsonify({'success': False, 'error': 'Provide tablet_ids or batch_number'}), 400
+        
+        if not total:
+            return jsonify({'success': False, 'error': 'No matching tablets found'}), 404
+        if total > app.config['LABEL_MAX']:
+            return jsonify({
+                'success': False,
+                'error': f"Too many labels: {total} (max {app.config['LABEL_MAX']})"
+            }), 413
+        
+        layout = LABEL_LAYOUTS[layout_name]
+        pages = iter_label_pages(layout, iter_label_tablets(tablet_ids, batch_number), request.url_root,
+                                 params.get('payload'))
+        log.info("Rendering labels", extra={'count': total, 'layout': layout_name, 'format': fmt})
+        
+        filename = f"labels_{batch_number or 'selection'}_{layout_name}"
+        if fmt == 'pdf':
+            body, mimetype, filename = stream_label_pdf(layout, pages), 'application/pdf', filename + '.pdf'
+        else:
+            body = stream_label_pngs(layout, pages, app.config['LABEL_PNG_DPI'])
+            mimetype, filename = 'application/zip', filename + '.zip'
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        
+    except Exception as e:
+        return route_error("Error rendering label sheets", e)
+
+@app.route('/api/qrcode/cache/stats')
+def qr_cache_stats():
+    return jsonify(qr_cache.snapshot()), 200
+
+@app.route('/api/info/cache/stats')
+def info_cache_stats():
+    return jsonify(info_page_cache.snapshot()), 200
+
+@app.route('/api/tablets/cache/stats')
+def tablet_cache_stats():
+    return jsonify(tablet_cache.snapshot()), 200
+
+@app.route('/api/shortcodes/cache/stats')
+def short_code_cache_stats():
+    return jsonify(short_code_cache.snapshot()), 200
+
+@app.route('/api/monographs/cache/stats')
+def monograph_cache_stats():
+    return jsonify(monograph_cache.snapshot()), 200
+
+@app.route('/api/monographs/<monograph_id>', methods=['GET'])
+def get_monograph(monograph_id):
+    """Shared product text; the id is a content hash, so responses never go stale"""
+    monograph = monograph_cache.get(monograph_id)
+    if monograph is None:
+        return jsonify({'success': False, 'error': 'Monograph not found'}), 404
+    response = jsonify(dict(monograph, id=monograph_id))
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response, 200
+
+@app.route('/api/export', methods=['GET'])
+def export_catalog():
+    try:
+        fmt = request.args.get('format', 'ndjson').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'success': False, 'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        if fmt in ('parquet', 'arrow') and optional_module('pyarrow') is None:
+            return jsonify({'success': False, 'error': f'{fmt} export requires pyarrow to be installed'}), 501
+        try:
+            fields = parse_fields_arg(request.args, default=TABLET_FIELDS)
+            # Validate filters up front so errors are reported before streaming starts
+            apply_tablet_filters(db.select(Tablet.id), request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        print("QR code generated successfully")
+        chunks = iter_export_chunks(request.args.copy(), fields, app.config['EXPORT_CHUNK_SIZE'])
+        if fmt == 'ndjson':
+            body = export_ndjson(chunks, fields)
+        elif fmt == 'csv':
+            body = export_csv(chunks, fields)
+        else:
+            body = export_arrow(chunks, fields, parquet=(fmt == 'parquet'))
+        
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="tablets.{extension}"'}
+        )
+    except Exception as e:
+        return route_error("Error exporting catalog", e)
+
+@app.route('/api/verify', methods=['POST'])
+def verify_tablets():
+    """Check a whole delivery in one request: ids, short codes or scanned QR text"""
+    try:
+        if request.mimetype == 'text/plain':
+            codes = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+            params = request.args
+        else:
+            body = request.get_json(silent=True)
+            if isinstance(body, list):
+                # A bare array of codes; options then come from the query string
+                codes, params = body, request.args
+            elif isinstance(body, dict):
+                codes, params = body.get('codes'), body
+            else:
+                codes = None
+            if not isinstance(codes, list):
+                return jsonify({'success': False, 'error': 'codes must be a list'}), 400
+        if not codes:
+            return jsonify({'success': False, 'error': 'No codes to verify'}), 400
+        if len(codes) > app.config['VERIFY_MAX_ITEMS']:
+            return jsonify({
+                'success': False,
+                'error': f"Too many codes: {len(codes)} (max {app.config['VERIFY_MAX_ITEMS']})"
+            }), 413
+        try:
+            within = int(params.get('within', 30))
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'within must be an integer number of days'}), 400
+        if not 0 <= within <= app.config['EXPIRING_MAX_DAYS']:
+            return jsonify({
+                'success': False,
+                'error': f"within must be between 0 and {app.config['EXPIRING_MAX_DAYS']}"
+            }), 400
+        
+        today = date.today()
+        chunks = verify_codes(codes, today, within, app.config['VERIFY_CHUNK_SIZE'])
+        return Response(stream_with_context(stream_verify_json(chunks, today, within)),
+                        mimetype='application/json')
+    except Exception as e:
+        return route_error("Error verifying tablets", e)
+
+@app.route('/api/expiring', methods=['GET'])
+def expiring_stock():
+    try:
+        try:
+            within = int(request.args.get('within', 30))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'within must be an integer number of days'}), 400
+        if not 0 <= within <= app.config['EXPIRING_MAX_DAYS']:
+            return jsonify({
+                'success': False,
+                'error': f"within must be between 0 and {app.config['EXPIRING_MAX_DAYS']}"
+            }), 400
         
+        today = date.today()
+        batches = expiring_batches(
+            today,
+            within,
+            include_expired=request.args.get('include_expired', '').lower() in ('1', 'true', 'yes'),
+            manufacturer=request.args.get('manufacturer')
+        )
         return jsonify({
-            'qr_code': f"data:image/png;base64,{img_str}",
-            'qr_data': qr_data,
-            'tablet_info': tablet.to_dict()
+            'as_of': today.strftime('%Y-%m-%d'),
+            'within_days': within,
+            'total_tablets': sum(b['tablet_count'] for b in batches),
+            'batches': batches
         }), 200
+    except Exception as e:
+        return route_error("Error building expiring stock report", e)
+
+@app.route('/api/scans', methods=['GET'])
+def scan_stats():
+    try:
+        group_by = request.args.get('group_by', 'tablet')
+        if group_by not in ('tablet', 'batch'):
+            return jsonify({'success': False, 'error': 'group_by must be tablet or batch'}), 400
+        try:
+            days = int(request.args.get('days', 30))
+            limit = max(1, min(int(request.args.get('limit', 50)), app.config['LIST_MAX_LIMIT']))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'days and limit must be integers'}), 400
+        if not 0 <= days <= app.config['EXPIRING_MAX_DAYS']:
+            return jsonify({
+                'success': False,
+                'error': f"days must be between 0 and {app.config['EXPIRING_MAX_DAYS']}"
+            }), 400
         
+        # Make this worker's own recent scans visible before aggregating
+        scan_recorder.flush()
+        since = datetime.utcnow() - timedelta(days=days)
+        counts = scan_counts(
+            group_by,
+            since,
+            limit,
+            tablet_id=request.args.get('tablet_id'),
+            batch_number=request.args.get('batch_number')
+        )
+        return jsonify({
+            'group_by': group_by,
+            'days': days,
+            'results': counts,
+            'recorder': scan_recorder.snapshot()
+        }), 200
     except Exception as e:
-        print(f"Error generating QR code: {str(e)}")
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return route_error("Error aggregating scans", e)
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    if not verify_profile_token(app.config['PROFILE_SECRET'], request.headers.get('X-Profile')):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    try:
+        entries = sorted(os.scandir(app.config['PROFILE_DIR']), key=lambda e: e.stat().st_mtime, reverse=True)
+    except FileNotFoundError:
+        entries = []
+    profiles = []
+    for entry in entries:
+        profile_id, _, extension = entry.name.partition('.')
+        stat = entry.stat()
+        profiles.append({
+            'id': profile_id,
+            'format': 'speedscope' if extension == 'speedscope.json' else 'pstats',
+            'bytes': stat.st_size,
+            'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat(),
+        })
+    return jsonify({'profiles': profiles}), 200
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    if not verify_profile_token(app.config['PROFILE_SECRET'], request.headers.get('X-Profile')):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    path, fmt = find_profile(profile_id)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    with open(path, 'rb') as f:
+        data = f.read()
+    mimetype = 'application/json' if fmt == 'speedscope' else 'application/octet-stream'
+    filename = os.path.basename(path)
+    return Response(data, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # Web Interface for Information Display
 @app.route('/info/<tablet_id>')
 def tablet_info(tablet_id):
     try:
-        tablet = Tablet.query.get_or_404(tablet_id)
-        
-        html_template = """
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>{{ tablet.name }} - Medication Information</title>
-            <style>
-                body {
-                    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                    max-width: 800px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: #f5f5f5;
-                    color: #333;
-                }
-                .container {
-                    background: white;
-                    border-radius: 12px;
-                    padding: 30px;
-                    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-                }
-                .header {
-                    text-align: center;
-                    border-bottom: 2px solid #007bff;
-                    padding-bottom: 20px;
-                    margin-bottom: 30px;
-                }
-                .tablet-name {
-                    color: #007bff;
-                    font-size: 2.5em;
-                    margin: 0;
-                    font-weight: bold;
-                }
-                .manufacturer {
-                    color: #666;
-                    font-size: 1.2em;
-                    margin: 10px 0;
-                }
-                .info-grid {
-                    display: grid;
-                    grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
-                    gap: 20px;
-                    margin: 20px 0;
-                }
-                .info-card {
-                    background: #f8f9fa;
-                    border-left: 4px solid #007bff;
-                    padding: 20px;
-                    border-radius: 8px;
-                }
-                .info-title {
-                    font-weight: bold;
-                    color: #007bff;
-                    font-size: 1.1em;
-                    margin-bottom: 10px;
-                }
-                .info-content {
-                    line-height: 1.6;
-                }
-                .dates {
-                    display: flex;
-                    justify-content: space-between;
-                    flex-wrap: wrap;
-                    gap: 20px;
-                    margin: 20px 0;
-                }
-                .date-card {
-                    flex: 1;
-                    min-width: 200px;
-                    text-align: center;
-                    padding: 15px;
-                    border-radius: 8px;
-                }
-                .mfg-date {
-                    background: #d4edda;
-                    color: #155724;
-                }
-                .exp-date {
-                    background: #f8d7da;
-                    color: #721c24;
-                }
-                .warning {
-                    background: #fff3cd;
-                    color: #856404;
-                    padding: 15px;
-                    border-radius: 8px;
-                    margin: 20px 0;
-                    border-left: 4px solid #ffc107;
-                }
-                .batch-info {
-                    background: #e7f3ff;
-                    padding: 15px;
-                    border-radius: 8px;
-                    text-align: center;
-                    margin: 20px 0;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1 class="tablet-name">{{ tablet.name }}</h1>
-                    <p class="manufacturer">{{ tablet.manufacturer }}</p>
-                </div>
-                
-                <div class="batch-info">
-                    <strong>Batch Number:</strong> {{ tablet.batch_number }}
-                </div>
-                
-                <div class="dates">
-                    <div class="date-card mfg-date">
-                        <h3>Manufacturing Date</h3>
-                        <p><strong>{{ tablet.mfg_date.strftime('%d %B %Y') }}</strong></p>
-                    </div>
-                    <div class="date-card exp-date">
-                        <h3>Expiry Date</h3>
-                        <p><strong>{{ tablet.expiry_date.strftime('%d %B %Y') }}</strong></p>
-                    </div>
-                </div>
-                
-                {% if (tablet.expiry_date - today).days < 30 and (tablet.expiry_date - today).days >= 0 %}
-                <div class="warning">
-                    <strong>⚠️ Warning:</strong> This medication expires in {{ (tablet.expiry_date - today).days }} days.
-                </div>
-                {% elif (tablet.expiry_date - today).days < 0 %}
-                <div class="warning" style="background: #f8d7da; color: #721c24;">
-                    <strong>🚫 EXPIRED:</strong> This medication expired. DO NOT USE.
-                </div>
-                {% endif %}
-                
-                <div class="info-grid">
-                    <div class="info-card">
-                        <div class="info-title">💊 Composition & Dosage</div>
-                        <div class="info-content">
-                            <p><strong>Active Ingredients:</strong> {{ tablet.composition }}</p>
-                            <p><strong>Dosage:</strong> {{ tablet.dosage }}</p>
-                        </div>
-                    </div>
-                    
-                    <div class="info-card">
-                        <div class="info-title">🏥 Medical Uses</div>
-                        <div class="info-content">{{ tablet.use_cases }}</div>
-                    </div>
-                    
-                    {% if tablet.side_effects %}
-                    <div class="info-card">
-                        <div class="info-title">⚠️ Side Effects</div>
-                        <div class="info-content">{{ tablet.side_effects }}</div>
-                    </div>
-                    {% endif %}
-                    
-                    {% if tablet.precautions %}
-                    <div class="info-card">
-                        <div class="info-title">⚡ Precautions</div>
-                        <div class="info-content">{{ tablet.precautions }}</div>
-                    </div>
-                    {% endif %}
-                    
-                    {% if tablet.storage_instructions %}
-                    <div class="info-card">
-                        <div class="info-title">🏠 Storage Instructions</div>
-                        <div class="info-content">{{ tablet.storage_instructions }}</div>
-                    </div>
-                    {% endif %}
-                </div>
-                
-                <div style="text-align: center; margin-top: 30px; color: #666; font-size: 0.9em;">
-                    <p>Always consult your healthcare provider.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        today = date.today()
+        entry = info_page_cache.get(tablet_id, today)
+        if entry is not None:
+            record_scan(tablet_id)
+            return cached_page_response(entry)
         
-        return render_template_string(html_template, tablet=tablet, today=date.today(), datetime=datetime)
+        tablet = load_tablet_or_404(tablet_id)
+        record_scan(tablet_id)
+        etag = tablet_etag(tablet, today)
+        # The page changes at midnight (expiry warning), so it is never older than today
+        last_modified = max(tablet.created_at or datetime.min,
+                            datetime.combine(today, datetime.min.time()))
+        if request.if_none_match.contains(etag):
+            return cached_page_response({'etag': etag, 'last_modified': last_modified})
+        
+        html = render_template('info.html', tablet=tablet, today=today, datetime=datetime)
+        info_page_cache.put(tablet_id, today, etag=etag, last_modified=last_modified, html=html)
+        return cached_page_response({'etag': etag, 'last_modified': last_modified, 'html': html})
     except Exception as e:
+        metrics.inc('app_errors_total', type=type(e).__name__)
         return f"<h1>Error</h1><p>{str(e)}</p>", 404
 
+@app.route('/i/<code>')
+@app.route('/I/<code>')
+def resolve_short_code(code):
+    """Short QR URLs resolve in place to the scan page (no redirect round-trip)"""
+    code = normalize_short_code(code)
+    tablet_id = short_code_cache.get(code)
+    if tablet_id is None:
+        return "<h1>Error</h1><p>Unknown tablet code</p>", 404
+    return tablet_info(tablet_id)
+
+@app.route('/v/<blob>')
+@app.route('/V/<blob>')
+def resolve_signed_payload(blob):
+    """Online fallback for signed QR payloads: verify, then show the live scan page"""
+    try:
+        fields = decode_offline_payload(blob)
+    except ValueError as e:
+        return f"<h1>Error</h1><p>Invalid or tampered QR code: {html.escape(str(e))}</p>", 400
+    return tablet_info(fields['id'])
+
+# ============================================================================
+# APPLICATION STARTUP
+# ============================================================================
+def create_app(preload=False):
+    """Finish start-up and return the WSGI app.
+
+    Importing this module only defines the app; it never touches the
+    schema, which `flask --app app migrate` brings up to date. With
+    preload=True (a gunicorn master that forks its workers) the QR and
+    imaging modules are imported up front and the heap is frozen, so the
+    workers share those pages copy-on-write instead of each loading its
+    own copy on first render.
+    """
+    # Fail at start-up rather than on the first label run
+    check_payload_mode(None)
+    with app.app_context():
+        warm_templates()
+    if preload:
+        for name in ('qrcode', 'numpy', 'PIL.Image'):
+            optional_module(name)
+        # Keep the collector from touching (and so copying) the parent's objects
+        gc.freeze()
+    return app
+
 # ============================================================================
 # THIS IS THE IMPORTANT PART - AUTOMATIC IP DETECTION
 # ============================================================================
@@ -785,5 +3811,11 @@ if __name__ == '__main__':
     print("=" * 70)
     print()
     
+    # The development server keeps the old convenience of creating the
+    # database on start; deployments run `flask --app app migrate` instead
+    with app.app_context():
+        migrate_database()
+    create_app()
+    
     # Run the app with network access enabled
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,738 @@
+"""Benchmarks for the Pharmaceutical QR Code Manager hot routes.
+
+Run from the project root, e.g.:
+
+    python bench.py info --tablets 1000 --requests 2000
+    python bench.py info --no-page-cache
+    python bench.py info get qrcode create --target gunicorn --workers 4 --concurrency 16
+    python bench.py mixed --target gunicorn --worker-class sync --concurrency 32
+    python bench.py get --tablets 1m --db /tmp/catalog-1m.db
+    python bench.py matrix png template
+    python bench.py storage --tablets 1m --db /tmp/catalog-1m.db
+    SQLITE_JOURNAL_MODE=DELETE python bench.py concurrent
+
+Route scenarios (info, get, qrcode, create, search, verify) go through the Flask
+test client or, with --target gunicorn, over HTTP to a local gunicorn
+started on the same database. matrix, png and template are
+micro-benchmarks of the QR and page rendering steps.
+
+Each run uses a throwaway SQLite database (or the one given with --db,
+which is seeded once and reused) and prints one JSON object per scenario,
+tagged with the git commit, so results can be compared across commits.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, timedelta
+from io import BytesIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CATALOG_SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+
+def setup_app(db_path, scratch_dir):
+    # The app reads its configuration at import time; keep every file it
+    # writes (QR cache, metrics snapshots, profiles) out of the instance folder
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{db_path}')
+    os.environ.setdefault('QR_CACHE_PATH', os.path.join(scratch_dir, 'qr_cache.db'))
+    os.environ.setdefault('METRICS_DIR', os.path.join(scratch_dir, 'metrics'))
+    os.environ.setdefault('PROFILE_DIR', os.path.join(scratch_dir, 'profiles'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('QR_SIGNING_KEY', 'bench-only-signing-key')
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.migrate_database()
+    app_module.create_app()
+    return app_module
+
+
+def catalog_size(value):
+    """Parse --tablets: a number or one of the 1k/100k/1m presets"""
+    if value.lower() in CATALOG_SIZES:
+        return CATALOG_SIZES[value.lower()]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number or one of {', '.join(CATALOG_SIZES)}")
+
+
+INGREDIENTS = ('Paracetamol', 'Ibuprofen', 'Amoxicillin', 'Cetirizine', 'Metformin', 'Atorvastatin',
+               'Omeprazole', 'Amlodipine', 'Azithromycin', 'Losartan', 'Levothyroxine', 'Pantoprazole',
+               'Montelukast', 'Sertraline', 'Diclofenac', 'Ciprofloxacin', 'Aspirin', 'Clopidogrel',
+               'Doxycycline', 'Prednisolone', 'Ranitidine', 'Loratadine', 'Glimepiride', 'Telmisartan')
+INDICATIONS = ('fever', 'pain', 'bacterial infection', 'allergy', 'type 2 diabetes', 'high cholesterol',
+               'acid reflux', 'hypertension', 'hypothyroidism', 'asthma', 'depression', 'inflammation',
+               'stroke prevention', 'gastric ulcer', 'urinary tract infection', 'arthritis')
+SIDE_EFFECTS = ('nausea', 'rash', 'dizziness', 'headache', 'drowsiness', 'diarrhoea', 'dry mouth', 'fatigue')
+
+
+def load_or_seed(app_module, count):
+    """Top the database up to count tablets and return the first count ids"""
+    Tablet, db = app_module.Tablet, app_module.db
+    with app_module.app.app_context():
+        existing = db.session.execute(db.select(db.func.count()).select_from(Tablet)).scalar()
+    if existing < count:
+        seed_tablets(app_module, count - existing, seed=42 + existing, offset=existing)
+    with app_module.app.app_context():
+        return list(db.session.execute(db.select(Tablet.id).order_by(Tablet.created_at, Tablet.id)
+                                       .limit(count)).scalars())
+
+
+def product_lines(count=400, seed=7):
+    """Synthetic product lines; every pack of a line shares its descriptive text"""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        active = rng.sample(INGREDIENTS, 2)
+        lines.append({
+            'name': f'{active[0]} {rng.choice((250, 500, 650))}',
+            'composition': ', '.join(f'{x} {rng.choice((5, 10, 250, 500))}mg' for x in active),
+            'use_cases': f'Treatment of {rng.choice(INDICATIONS)} and {rng.choice(INDICATIONS)}. ' * 2,
+            'side_effects': ', '.join(rng.sample(SIDE_EFFECTS, 3)),
+            'precautions': 'Do not exceed the stated dose. ' * 3,
+            'storage_instructions': 'Store below 25C in a dry place.',
+        })
+    return lines
+
+
+def synthetic_tablets(rng, start, stop, lines):
+    """Rows for tablets start..stop; each 250-tablet batch belongs to one product line"""
+    for i in range(start, stop):
+        mfg = date(2024, 1, 1) + timedelta(days=rng.randrange(700))
+        row = dict(lines[(i // 250) % len(lines)])
+        row.update({
+            'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            'manufacturer': f'Manufacturer {i % 40}',
+            'batch_number': f'BATCH{i // 250:06d}',
+            'mfg_date': mfg,
+            'expiry_date': mfg + timedelta(days=rng.choice((30, 365, 730, 1095))),
+            'dosage': '1 tablet every 6 hours',
+            'created_at': datetime.utcnow(),
+        })
+        yield row
+
+
+def seed_tablets(app_module, count, seed=42, offset=0):
+    """Insert count synthetic tablets and return their ids"""
+    rng = random.Random(seed)
+    lines = product_lines()
+    Tablet, db = app_module.Tablet, app_module.db
+    ids = []
+    with app_module.app.app_context():
+        for start in range(offset, offset + count, 5000):
+            rows = list(synthetic_tablets(rng, start, min(start + 5000, offset + count), lines))
+            ids.extend(row['id'] for row in rows)
+            app_module.store_monographs(rows)
+            db.session.execute(db.insert(Tablet), rows)
+            db.session.commit()
+    return ids
+
+
+def summarize(name, latencies, elapsed, **extra):
+    latencies = sorted(latencies)
+    result = {
+        'scenario': name,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 4),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 3),
+    }
+    result.update(extra)
+    return result
+
+
+def micro(fn, iterations):
+    """Time iterations calls of fn; returns p50/p99 in microseconds and ops/s"""
+    timings = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    timings.sort()
+    return {
+        'p50_us': round(statistics.median(timings) * 1e6, 1),
+        'p99_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6, 1),
+        'ops_per_second': round(len(timings) / sum(timings)),
+    }
+
+
+class HttpResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+
+class HttpClient:
+    """Just enough of the test client interface to drive a real server"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def _request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return HttpResponse(response.status, response.read())
+        finally:
+            conn.close()
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, json=None):
+        return self._request('POST', path, body=globals()['json'].dumps(json),
+                             headers={'Content-Type': 'application/json'})
+
+
+@contextmanager
+def gunicorn_server(args):
+    """Run gunicorn against the benchmark database for the duration of the block"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ)
+    if args.no_page_cache:
+        env['INFO_PAGE_CACHE_SIZE'] = '0'
+    command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--workers', str(args.workers),
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    if args.worker_class:
+        command += ['--worker-class', args.worker_class]
+        env['GUNICORN_WORKER_CLASS'] = args.worker_class
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+        env['GUNICORN_THREADS'] = str(args.threads)
+    proc = subprocess.Popen(
+        command,
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    client = HttpClient('127.0.0.1', port)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                client.get('/')
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.2)
+        yield client
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def make_client(app_module, args):
+    return args.server if args.target == 'gunicorn' else app_module.app.test_client()
+
+
+def drive(client, paths, warmup=50, concurrency=1, ok=(200, 304)):
+    for path in paths[:warmup]:
+        client.get(path)
+
+    def one(path):
+        t0 = time.perf_counter()
+        response = client.get(path)
+        if response.status_code not in ok:
+            raise RuntimeError(f'{path} returned {response.status_code}')
+        return time.perf_counter() - t0
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(one, paths))
+    else:
+        latencies = [one(path) for path in paths]
+    return latencies, time.perf_counter() - started
+
+
+def bench_info(app_module, ids, args):
+    """Scan page throughput, optionally with the rendered-page cache disabled"""
+    page_cache = getattr(app_module, 'info_page_cache', None)
+    if page_cache is not None and args.no_page_cache:
+        page_cache.max_entries = 0
+    rng = random.Random(1)
+    paths = [f'/info/{rng.choice(ids)}' for _ in range(args.requests)]
+    latencies, elapsed = drive(make_client(app_module, args), paths, concurrency=args.concurrency)
+    return summarize('info', latencies, elapsed, tablets=len(ids),
+                     page_cache=page_cache is not None and not args.no_page_cache)
+
+
+def bench_get(app_module, ids, args):
+    """GET /api/tablets/<id> (full JSON record) over the seeded catalog"""
+    rng = random.Random(5)
+    paths = [f'/api/tablets/{rng.choice(ids)}' for _ in range(args.requests)]
+    latencies, elapsed = drive(make_client(app_module, args), paths, concurrency=args.concurrency)
+    return summarize('get', latencies, elapsed, tablets=len(ids))
+
+
+def bench_qrcode(app_module, ids, args):
+    """GET /api/qrcode/<id> as PNG; tablets are drawn at random so the QR
+    cache hit rate depends on --requests relative to --tablets"""
+    rng = random.Random(6)
+    paths = [f'/api/qrcode/{rng.choice(ids)}?format=png' for _ in range(args.requests)]
+    latencies, elapsed = drive(make_client(app_module, args), paths, concurrency=args.concurrency)
+    return summarize('qrcode', latencies, elapsed, tablets=len(ids))
+
+
+def _mixed_client(client, paths, deadline, latencies, errors):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        t0 = time.perf_counter()
+        try:
+            if client.get(path).status_code != 200:
+                raise OSError(path)
+            latencies.append(time.perf_counter() - t0)
+        except OSError:
+            errors.append(path)
+
+
+def bench_mixed(app_module, ids, args):
+    """Concurrent-connection capacity under a mixed load against gunicorn:
+    --concurrency clients for --duration seconds, a quarter of them
+    requesting uncached QR codes (CPU-heavy) while the rest load /info
+    pages. Shows how much QR rendering delays the cheap scan pages."""
+    rng = random.Random(7)
+    qr_clients = max(1, args.concurrency // 4)
+    info_paths = [f'/info/{rng.choice(ids)}' for _ in range(1000)]
+    info, qr, errors = [], [], []
+    deadline = time.perf_counter() + args.duration
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for n in range(args.concurrency):
+            if n < qr_clients:
+                # A fresh box size per client keeps every render a cache miss
+                paths = [f'/api/qrcode/{tablet_id}?format=png&box_size={n % 40 + 2}&border={n // 40}'
+                         for tablet_id in rng.sample(ids, min(len(ids), 1000))]
+                pool.submit(_mixed_client, args.server, paths, deadline, qr, errors)
+            else:
+                pool.submit(_mixed_client, args.server, info_paths, deadline, info, errors)
+    result = summarize('mixed', info, args.duration, clients=args.concurrency, errors=len(errors),
+                       workers=args.workers, worker_class=args.worker_class or 'gunicorn.conf.py',
+                       threads=args.threads)
+    qr_summary = summarize('qrcode', qr, args.duration)
+    result.update(qr_requests=qr_summary['requests'], qr_rps=qr_summary['rps'],
+                  qr_p50_ms=qr_summary['p50_ms'], qr_p99_ms=qr_summary['p99_ms'])
+    return result
+
+
+def bench_verify(app_module, ids, args):
+    """A 500-pack delivery reconciliation: 500 GET /api/tablets/<id> vs one POST /api/verify"""
+    client = make_client(app_module, args)
+    rng = random.Random(8)
+    rounds = max(1, args.requests // 500)
+    singles, bulk = [], []
+    for _ in range(rounds):
+        delivery = rng.sample(ids, min(500, len(ids)))
+        t0 = time.perf_counter()
+        for tablet_id in delivery:
+            client.get(f'/api/tablets/{tablet_id}')
+        singles.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        response = client.post('/api/verify', json={'codes': delivery})
+        if response.status_code != 200 or len(json.loads(response.data)['results']) != len(delivery):
+            raise RuntimeError(f'verify returned {response.status_code}')
+        bulk.append(time.perf_counter() - t0)
+    return {'scenario': 'verify', 'items': min(500, len(ids)), 'rounds': rounds, 'tablets': len(ids),
+            'single_requests_ms': round(statistics.median(singles) * 1000, 1),
+            'bulk_verify_ms': round(statistics.median(bulk) * 1000, 1)}
+
+
+def bench_create(app_module, ids, args):
+    """POST /api/tablets with full-size text fields (logging and insert cost)"""
+    client = make_client(app_module, args)
+    body = {
+        'name': 'Paracetamol 500', 'manufacturer': 'Bench Pharma', 'batch_number': 'BENCH-0001',
+        'mfg_date': '2025-01-01', 'expiry_date': '2027-01-01', 'composition': 'Paracetamol 500mg',
+        'dosage': '1 tablet every 6 hours', 'use_cases': 'Treatment of fever and pain. ' * 40,
+        'side_effects': ', '.join(SIDE_EFFECTS) * 5, 'precautions': 'Do not exceed the stated dose. ' * 30,
+        'storage_instructions': 'Store below 25C in a dry place.',
+    }
+
+    def one(_):
+        t0 = time.perf_counter()
+        response = client.post('/api/tablets', json=body)
+        if response.status_code != 201:
+            raise RuntimeError(f'create returned {response.status_code}')
+        return time.perf_counter() - t0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        latencies = list(pool.map(one, range(args.requests)))
+    return summarize('create', latencies, time.perf_counter() - started, tablets=len(ids))
+
+
+def bench_search(app_module, ids, args):
+    """Ranked full-text search latency over the seeded catalog"""
+    rng = random.Random(2)
+    terms = ['paracetamol', 'cholesterol', 'amox', 'urinary infection', 'losartan hypertension', 'montel']
+    paths = [f'/api/tablets/search?q={rng.choice(terms).replace(" ", "+")}&limit=20'
+             for _ in range(args.requests)]
+    latencies, elapsed = drive(make_client(app_module, args), paths, concurrency=args.concurrency)
+    return summarize('search', latencies, elapsed, tablets=len(ids))
+
+
+def bench_labels(app_module, ids, args):
+    """Label-sheet rendering throughput (labels/second) for PDF and PNG output"""
+    client = app_module.app.test_client()
+    selection = ids[:args.labels]
+    results = {}
+    app_module.qr_module_runs.cache_clear()
+    # The first pass builds QR matrices; later passes reuse the matrix cache
+    for key, fmt in (('pdf_cold', 'pdf'), ('pdf', 'pdf'), ('png', 'png')):
+        started = time.perf_counter()
+        response = client.post('/api/labels', json={'tablet_ids': selection, 'format': fmt, 'layout': 'a4'})
+        size = sum(len(chunk) for chunk in response.response)
+        elapsed = time.perf_counter() - started
+        results[key] = {'seconds': round(elapsed, 3), 'labels_per_second': round(len(selection) / elapsed, 1),
+                        'bytes': size}
+    return {'scenario': 'labels', 'labels': len(selection), 'layout': 'a4', **results}
+
+
+def bench_qrsize(app_module, ids, args):
+    """QR version, module count and render cost for UUID vs short-code payloads"""
+    base_url = 'https://pharma.example.com/'
+    tablet = {'id': ids[0], 'short_code': 'Q7MZ4K2D', 'name': 'Paracetamol Extended Release 650',
+              'batch_number': 'BATCH-2025-000123', 'mfg_date': date(2025, 1, 1), 'expiry_date': date(2027, 1, 1)}
+    rows = {}
+    for mode in ('uuid', 'short', 'signed'):
+        for ec in ('L', 'M', 'Q', 'H'):
+            payload = app_module.tablet_qr_payload(tablet, base_url, mode)
+            qr = app_module.build_qr(payload, ec=ec)
+            started = time.perf_counter()
+            for _ in range(args.requests // 20 or 1):
+                app_module.render_qr_png(payload, ec=ec)
+            per_render = (time.perf_counter() - started) / (args.requests // 20 or 1)
+            rows[f'{mode}_{ec}'] = {
+                'payload_chars': len(payload),
+                'version': qr.version,
+                'modules': qr.modules_count,
+                'png_render_ms': round(per_render * 1000, 3),
+            }
+    return {'scenario': 'qrsize', **rows}
+
+
+def bench_signed(app_module, ids, args):
+    """Encode/decode throughput of signed offline payloads"""
+    key = b'benchmark-key'
+    fields = (ids[0], 'Paracetamol Extended Release 650', 'BATCH-2025-000123', date(2025, 1, 1), date(2027, 1, 1))
+    n = args.requests * 10
+    started = time.perf_counter()
+    for _ in range(n):
+        blob = app_module.encode_offline_payload(*fields, key=key)
+    encode = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(n):
+        app_module.decode_offline_payload(blob, key=key)
+    decode = time.perf_counter() - started
+    return {'scenario': 'signed', 'iterations': n, 'payload_chars': len(blob),
+            'encode_per_second': round(n / encode), 'decode_per_second': round(n / decode)}
+
+
+def _micro_payloads(app_module, ids):
+    """One /info URL per error-correction level: QR versions 4 to 8"""
+    payload = f'https://pharma.example.com/info/{ids[0]}'
+    return [(ec, payload, app_module.build_qr(payload, ec=ec).version) for ec in ('L', 'M', 'Q', 'H')]
+
+
+def bench_matrix(app_module, ids, args):
+    """Micro: QR encoding and module placement (qrcode's make), per version"""
+    rows = {}
+    for ec, payload, version in _micro_payloads(app_module, ids):
+        rows[f'v{version}_{ec}'] = micro(lambda: app_module.build_qr(payload, ec=ec), args.requests // 10 or 1)
+    return {'scenario': 'matrix', **rows}
+
+
+def bench_png(app_module, ids, args):
+    """Micro: drawing a built QR matrix and PNG-encoding it, per version"""
+    rows = {}
+    for ec, payload, version in _micro_payloads(app_module, ids):
+        qr = app_module.build_qr(payload, ec=ec)
+        image = qr.make_image(fill_color='black', back_color='white')
+        rows[f'v{version}_{ec}'] = {
+            'draw': micro(lambda: qr.make_image(fill_color='black', back_color='white'), args.requests // 10 or 1),
+            'encode': micro(lambda: image.save(BytesIO(), format='PNG'), args.requests // 10 or 1),
+        }
+    return {'scenario': 'png', **rows}
+
+
+def bench_raster(app_module, ids, args):
+    """Micro: qrcode's per-module PIL drawing vs the vectorized rasterizer
+    (NumPy and pure-Python fallback), matrix prebuilt, across QR versions"""
+    numpy = app_module.optional_module('numpy')
+    n = args.requests // 10 or 1
+    rows = {}
+    for chars in (20, 60, 120, 250, 500):
+        qr = app_module.build_qr('Q' * chars, ec='M')
+        matrix = qr.get_matrix()
+
+        def pil():
+            buffered = BytesIO()
+            qr.make_image(fill_color='black', back_color='white').save(buffered, format='PNG')
+            return buffered.getvalue()
+
+        def vector():
+            return app_module.encode_qr_png(matrix, app_module.QR_BOX_SIZE)
+
+        row = {'modules': qr.modules_count, 'pil': micro(pil, n), 'pil_bytes': len(pil())}
+        if numpy is not None:
+            row['numpy'] = micro(vector, n)
+        load = app_module.optional_module
+        app_module.optional_module = lambda name: None
+        try:
+            row['python'] = micro(vector, n)
+        finally:
+            app_module.optional_module = load
+        for level in (1, 6, 9):
+            row[f'bytes_level_{level}'] = len(app_module.encode_qr_png(matrix, app_module.QR_BOX_SIZE, level))
+        rows[f'v{qr.version}'] = row
+    return {'scenario': 'raster', 'numpy': numpy is not None, **rows}
+
+
+def bench_template(app_module, ids, args):
+    """Micro: rendering the info.html scan page for one tablet"""
+    from flask import render_template
+    with app_module.app.test_request_context('/info/x'):
+        tablet = app_module.db.session.get(app_module.Tablet, ids[0])
+        today = date.today()
+        result = micro(lambda: render_template('info.html', tablet=tablet, today=today, datetime=datetime),
+                       args.requests)
+    return {'scenario': 'template', **result}
+
+
+def _reader(app_module, ids, duration, seed, results):
+    with app_module.app.app_context():
+        app_module.db.engine.dispose(close=False)
+    app_module.info_page_cache.max_entries = 0
+    client = app_module.app.test_client()
+    rng = random.Random(seed)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        client.get(f'/info/{rng.choice(ids)}')
+        latencies.append(time.perf_counter() - t0)
+    results.put(('read', latencies))
+
+
+def _writer(app_module, duration, results):
+    with app_module.app.app_context():
+        app_module.db.engine.dispose(close=False)
+    client = app_module.app.test_client()
+    payload = {
+        'name': 'Load Test', 'manufacturer': 'Bench Labs', 'batch_number': 'LOAD01',
+        'mfg_date': '2025-01-01', 'expiry_date': '2027-01-01', 'composition': 'Placebo',
+        'dosage': '1 tablet', 'use_cases': 'Benchmarking',
+    }
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        if client.post('/api/tablets', json=payload).status_code != 201:
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+    results.put(('write', latencies, errors))
+
+
+def bench_concurrent(app_module, ids, args):
+    """Read throughput on /info/<id> from several processes during sustained inserts"""
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_reader, args=(app_module, ids, args.duration, i, results))
+             for i in range(args.readers)]
+    procs.append(ctx.Process(target=_writer, args=(app_module, args.duration, results)))
+    for proc in procs:
+        proc.start()
+    reads, writes, write_errors = [], [], 0
+    for _ in procs:
+        item = results.get()
+        if item[0] == 'read':
+            reads.extend(item[1])
+        else:
+            writes.extend(item[1])
+            write_errors = item[2]
+    for proc in procs:
+        proc.join()
+    with app_module.app.app_context():
+        journal_mode = app_module.db.session.execute(app_module.db.text('PRAGMA journal_mode')).scalar() \
+            if app_module.db.engine.dialect.name == 'sqlite' else None
+    result = summarize('concurrent', reads, args.duration, readers=args.readers, tablets=len(ids),
+                       journal_mode=journal_mode)
+    result.update(writes=len(writes), write_errors=write_errors,
+                  writes_per_second=round(len(writes) / args.duration, 1),
+                  write_p99_ms=round(sorted(writes)[int(len(writes) * 0.99)] * 1000, 3) if writes else None)
+    return result
+
+
+def bench_storage(app_module, ids, args):
+    """On-disk size per table and monograph cache residency after random GETs"""
+    db = app_module.db
+    with app_module.app.app_context():
+        path = db.engine.url.database
+        sizes = dict(db.session.execute(db.text(
+            "SELECT CASE WHEN name LIKE 'tablet_fts%' THEN 'tablet_fts' ELSE name END AS object, SUM(pgsize) "
+            "FROM dbstat GROUP BY object"
+        )).all())
+        monographs = db.session.execute(db.text("SELECT COUNT(*) FROM monographs")).scalar()
+    cache = app_module.monograph_cache
+    rng = random.Random(9)
+    paths = [f'/api/tablets/{rng.choice(ids)}' for _ in range(args.requests)]
+    latencies, elapsed = drive(app_module.app.test_client(), paths)
+    result = summarize('storage', latencies, elapsed, tablets=len(ids), monographs=monographs,
+                       db_mb=round(os.path.getsize(path) / 2**20, 1))
+    for name in ('tablet', 'monographs', 'tablet_fts'):
+        result[f'{name}_mb'] = round(sizes.get(name, 0) / 2**20, 1)
+    result['index_mb'] = round(sum(v for k, v in sizes.items() if k.startswith(('ix_', 'sqlite_autoindex'))) / 2**20, 1)
+    result.update({f'monograph_cache_{k}': v for k, v in cache.snapshot().items()})
+    return result
+
+
+def bench_hot(app_module, ids, args):
+    """Skewed scan traffic: 90% of lookups hit 20 popular batches (page cache off)"""
+    from sqlalchemy import event
+    app_module.info_page_cache.max_entries = 0
+    rng = random.Random(11)
+    popular = ids[:5000]
+    paths = [f"/{rng.choice(('info', 'api/tablets'))}/{rng.choice(popular if rng.random() < 0.9 else ids)}"
+             for _ in range(args.requests)]
+    queries = []
+    count_query = lambda *a: queries.append(1)  # noqa: E731
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', count_query)
+    try:
+        latencies, elapsed = drive(app_module.app.test_client(), paths)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_query)
+    result = summarize('hot', latencies, elapsed, tablets=len(ids),
+                       db_queries_per_request=round(len(queries) / len(paths), 3))
+    cache = getattr(app_module, 'tablet_cache', None)
+    if cache is not None:
+        result['tablet_cache_hit_ratio'] = cache.snapshot()['hit_ratio']
+    return result
+
+
+def bench_breakdown(app_module, ids, args):
+    """Where the time goes on /info and /api/qrcode, from the app's own metrics,
+    plus the cost of collecting them"""
+    rng = random.Random(4)
+    client = app_module.app.test_client()
+    metrics = app_module.metrics
+    result = {'scenario': 'breakdown', 'tablets': len(ids)}
+    paths = [f'/info/{rng.choice(ids)}' for _ in range(args.requests)]
+    app_module.app.config['METRICS_ENABLED'] = False
+    drive(client, paths)  # fill the page cache so both passes see the same hit rate
+    for enabled in (False, True):
+        app_module.app.config['METRICS_ENABLED'] = enabled
+        latencies, elapsed = drive(client, paths)
+        result[f"info_p50_ms_metrics_{'on' if enabled else 'off'}"] = \
+            round(statistics.median(latencies) * 1000, 3)
+    paths = [f'/api/qrcode/{rng.choice(ids)}' for _ in range(args.requests)]
+    drive(client, paths)
+    _, histograms = metrics.collect_all()
+    for (name, labels), (_, total, count) in sorted(histograms.items()):
+        labels = dict(labels)
+        if name in ('http_request_duration_seconds', 'http_request_db_seconds') \
+                and labels.get('route') in ('/info/<tablet_id>', '/api/qrcode/<tablet_id>'):
+            result[f"{name[5:-8]}_{labels['route'].split('/')[-2]}_mean_ms"] = round(total / count * 1000, 3)
+        elif name == 'qr_render_phase_seconds':
+            result[f"qr_{labels['phase']}_mean_ms"] = round(total / count * 1000, 3)
+    return result
+
+
+SCENARIOS = {
+    'info': bench_info,
+    'get': bench_get,
+    'qrcode': bench_qrcode,
+    'create': bench_create,
+    'verify': bench_verify,
+    'mixed': bench_mixed,
+    'search': bench_search,
+    'labels': bench_labels,
+    'qrsize': bench_qrsize,
+    'signed': bench_signed,
+    'breakdown': bench_breakdown,
+    'concurrent': bench_concurrent,
+    'matrix': bench_matrix,
+    'png': bench_png,
+    'raster': bench_raster,
+    'template': bench_template,
+    'storage': bench_storage,
+    'hot': bench_hot,
+}
+HTTP_SCENARIOS = ('info', 'get', 'qrcode', 'create', 'search', 'verify', 'mixed')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', default=[n for n in SCENARIOS if n != 'mixed'],
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all but mixed)")
+    parser.add_argument('--tablets', type=catalog_size, default=1000,
+                        help='size of the seeded catalog: a number or 1k, 100k, 1m')
+    parser.add_argument('--db', help='SQLite file to seed once and reuse across runs (default: temporary)')
+    parser.add_argument('--target', choices=('testclient', 'gunicorn'), default='testclient',
+                        help=f"how to drive {', '.join(HTTP_SCENARIOS)}")
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers for --target gunicorn')
+    parser.add_argument('--worker-class', choices=('sync', 'gthread'),
+                        help='gunicorn worker class (default: as in gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, help='threads per gthread worker (default: as in gunicorn.conf.py)')
+    parser.add_argument('--concurrency', type=int, default=1, help='concurrent clients for route scenarios')
+    parser.add_argument('--output', help='also append the JSON results to this file')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--no-page-cache', action='store_true', help='disable the /info rendered-page cache')
+    parser.add_argument('--labels', type=int, default=1000, help='labels to render in the labels scenario')
+    parser.add_argument('--readers', type=int, default=4, help='reader processes for the concurrent scenario')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run the concurrent scenario')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    if args.target == 'testclient' and args.concurrency > 1:
+        parser.error('--concurrency needs --target gunicorn (the test client is single-threaded)')
+    if args.target == 'testclient' and 'mixed' in args.scenarios:
+        parser.error('mixed needs --target gunicorn')
+
+    commit = git_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module = setup_app(os.path.abspath(args.db) if args.db else os.path.join(tmp, 'bench.db'), tmp)
+        ids = load_or_seed(app_module, args.tablets)
+        with (gunicorn_server(args) if args.target == 'gunicorn' else nullcontext()) as args.server:
+            for name in args.scenarios:
+                result = SCENARIOS[name](app_module, ids, args)
+                result.update(commit=commit, target=args.target if name in HTTP_SCENARIOS else 'inprocess')
+                line = json.dumps(result)
+                print(line)
+                sys.stdout.flush()
+                if args.output:
+                    with open(args.output, 'a') as f:
+                        f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Gunicorn settings for the Pharmaceutical QR Code Manager.
+
+gunicorn picks this file up from the project root. The default is the
+threaded (gthread) worker: a scan from a phone on a slow mobile link
+then ties up one thread instead of a whole worker process. Every
+setting can be overridden from the environment:
+
+    WEB_CONCURRENCY        worker processes (default: CPU count, at least 2)
+    GUNICORN_THREADS       threads per worker (default: 16)
+    GUNICORN_WORKER_CLASS  'gthread' (default) or 'sync'
+    GUNICORN_TIMEOUT       seconds before a silent worker is restarted (default: 30)
+    GUNICORN_PRELOAD       '1' (default) loads the app once in the master and
+                           forks the workers from it; '0' loads it per worker
+
+With preloading, the master imports the app and the QR/imaging modules
+once and the workers share those pages copy-on-write. The schema is not
+touched at start-up: run `flask --app app migrate` first (the Procfile
+release step does).
+
+The app is sized to match: each worker's database pool holds one
+connection per thread, and with more than one thread single QR renders
+are offloaded to a small per-worker process pool (QR_RENDER_OFFLOAD).
+"""
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', max(2, os.cpu_count() or 1)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 16)) if worker_class == 'gthread' else 1
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+wsgi_app = 'app:create_app(preload=True)' if preload_app else 'app:create_app()'
+
+# Read by app.py when each worker imports it
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+if threads > 1:
+    os.environ.setdefault('QR_RENDER_OFFLOAD', '1')
+    os.environ.setdefault('QR_RENDER_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+
+
+def post_fork(server, worker):
+    # Connections opened by the master must not be shared with the workers;
+    # each worker starts with an empty pool of its own
+    if server.cfg.preload_app:
+        import app as app_module
+        with app_module.app.app_context():
+            app_module.db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Runs in the worker: leave its final counts for the master to fold
+    import app as app_module
+    app_module.metrics.write()
+
+
+def child_exit(server, worker):
+    # Runs in the master: fold the exited worker's metrics into the archive
+    # before its pid can be reused. Without preloading the master never
+    # imports the app; the next scrape folds the file instead.
+    if server.cfg.preload_app:
+        import app as app_module
+        app_module.metrics.mark_process_dead(worker.pid)
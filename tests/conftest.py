@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time, so point every file it
+# writes at a scratch directory before importing it
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix='pharma-qr-tests-')
+DB_PATH = os.path.join(SCRATCH, 'tablets.db')
+
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+os.environ['QR_CACHE_PATH'] = os.path.join(SCRATCH, 'qr_cache.db')
+os.environ['METRICS_DIR'] = os.path.join(SCRATCH, 'metrics')
+os.environ['PROFILE_DIR'] = os.path.join(SCRATCH, 'profiles')
+os.environ['LOG_LEVEL'] = 'WARNING'
+os.environ['SCAN_ANALYTICS_ENABLED'] = '0'
+os.environ['QR_SIGNING_KEY'] = 'test-signing-key'
+
+sys.path.insert(0, ROOT)
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def empty_db():
+    """An app context over a database file that does not exist yet"""
+    with app_module.app.app_context():
+        app_module.db.session.remove()
+        app_module.db.engine.dispose()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
+        yield app_module
+        app_module.db.session.remove()
+
+
+@pytest.fixture
+def migrated_db(empty_db):
+    empty_db.migrate_database()
+    return empty_db
+
+
+@pytest.fixture
+def client(migrated_db):
+    return migrated_db.app.test_client()
+
+
+@pytest.fixture
+def make_tablet(client):
+    """POST a tablet and return its id"""
+    def make(**overrides):
+        data = dict(name='Paracetamol', manufacturer='Acme', batch_number='B1', mfg_date='2024-01-01',
+                    expiry_date='2027-01-01', composition='Paracetamol 500mg', dosage='500mg',
+                    use_cases='Fever and pain')
+        data.update(overrides)
+        response = client.post('/api/tablets', json=data)
+        assert response.status_code == 201, response.get_data(as_text=True)
+        return response.get_json()['tablet_id']
+    return make
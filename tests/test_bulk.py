@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+from conftest import app_module
+
+COLUMNS = ['name', 'manufacturer', 'batch_number', 'mfg_date', 'expiry_date', 'composition', 'dosage', 'use_cases']
+
+
+def record(i, **overrides):
+    row = dict(name=f'Tablet {i}', manufacturer='Acme', batch_number=f'B{i % 7}', mfg_date='2024-01-01',
+               expiry_date='2027-01-01', composition='Paracetamol 500mg', dosage='500mg', use_cases='Fever')
+    row.update(overrides)
+    return row
+
+
+def csv_body(count):
+    lines = [','.join(COLUMNS)] + [','.join(record(i)[c] for c in COLUMNS) for i in range(count)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def tablet_count():
+    return app_module.db.session.execute(app_module.db.text("SELECT count(*) FROM tablet")).scalar()
+
+
+def test_json_array_with_invalid_rows(client):
+    rows = [record(0), record(1, expiry_date='2020-01-01'), record(2, mfg_date='soon'), {'name': 'x'}, record(4)]
+    response = client.post('/api/tablets/bulk', json=rows)
+    body = response.get_json()
+    assert response.status_code == 201
+    assert body['inserted'] == 2 and body['failed'] == 3
+    assert [e['row'] for e in body['errors']] == [1, 2, 3]
+    assert body['read_error'] is None
+    assert tablet_count() == 2
+
+
+def test_ndjson_reports_bad_lines(client):
+    lines = [json.dumps(record(0)), '{not json', '', json.dumps(record(2))]
+    response = client.post('/api/tablets/bulk', data='\n'.join(lines), content_type='application/x-ndjson')
+    body = response.get_json()
+    assert body['inserted'] == 2
+    assert body['errors'][0]['row'] == 1 and 'Invalid JSON line' in body['errors'][0]['error']
+
+
+def test_csv_upload_in_chunks(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BULK_CHUNK_SIZE', 7)
+    response = client.post('/api/tablets/bulk', data={'file': (io.BytesIO(csv_body(50)), 'tablets.csv')},
+                           content_type='multipart/form-data')
+    body = response.get_json()
+    assert response.status_code == 201 and body['success'] is True
+    assert body['inserted'] == 50 and len(set(body['tablet_ids'])) == 50
+    assert tablet_count() == 50
+
+
+def test_undecodable_csv_reports_the_rows_it_committed(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BULK_CHUNK_SIZE', 100)
+    data = csv_body(2000)
+    cut = data.rindex(b'Tablet 1990')
+    data = data[:cut] + b'\xff' + data[cut:]
+    response = client.post('/api/tablets/bulk', data=data, content_type='text/csv')
+    body = response.get_json()
+    assert response.status_code == 201
+    assert body['success'] is False
+    assert 'Input unreadable' in body['read_error']
+    assert 0 < body['inserted'] < 2000
+    assert body['inserted'] == len(body['tablet_ids']) == tablet_count()
+
+
+def test_error_list_is_truncated(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BULK_MAX_ERRORS', 3)
+    body = client.post('/api/tablets/bulk', json=[{'name': 'x'}] * 10).get_json()
+    assert body['failed'] == 10 and len(body['errors']) == 3 and body['errors_truncated'] is True
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'json': {'tablets': 'nope'}},
+    {'data': b'\xff\xfe,not,csv', 'content_type': 'text/csv'},
+])
+def test_unreadable_input_is_rejected(client, kwargs):
+    response = client.post('/api/tablets/bulk', **kwargs)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert tablet_count() == 0
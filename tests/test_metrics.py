@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import app_module
+
+
+def dead_pid():
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+def snapshot(requests, seconds):
+    return {'counters': [['http_requests_total', {'route': '/x'}, requests]],
+            'histograms': [['http_request_duration_seconds', {'route': '/x'},
+                            [requests] + [0] * (len(app_module.LATENCY_BUCKETS) - 1), seconds, requests]]}
+
+
+@pytest.fixture
+def metrics(tmp_path):
+    return app_module.Metrics(str(tmp_path), flush_interval=3600)
+
+
+def write(directory, name, snap):
+    with open(os.path.join(directory, name), 'w') as f:
+        json.dump(snap, f)
+
+
+def requests_total(metrics):
+    counters, histograms = metrics.collect_all()
+    key = ('http_requests_total', (('route', '/x'),))
+    return counters.get(key, 0), histograms.get(('http_request_duration_seconds', (('route', '/x'),)))
+
+
+def test_scrape_folds_exited_processes_into_the_archive(metrics, tmp_path):
+    gone = dead_pid()
+    write(tmp_path, f'{gone}-aaaa.json', snapshot(3, 0.3))
+    write(tmp_path, f'{gone}.json', snapshot(1, 0.1))  # name used before tokens were added
+    write(tmp_path, f'{os.getppid()}-bbbb.json', snapshot(5, 0.5))
+
+    assert requests_total(metrics)[0] == 9
+    assert sorted(os.listdir(tmp_path)) == sorted([f'{os.getppid()}-bbbb.json', 'archive.json', 'archive.lock'])
+
+    # Folded counts are not counted twice, and the histogram survives the fold
+    total, histogram = requests_total(metrics)
+    assert total == 9
+    assert histogram[2] == 9 and round(histogram[1], 6) == 0.9
+
+
+def test_mark_process_dead_folds_only_that_pid(metrics, tmp_path):
+    write(tmp_path, '4242-aaaa.json', snapshot(2, 0.2))
+    write(tmp_path, f'{os.getppid()}-bbbb.json', snapshot(5, 0.5))
+    metrics.mark_process_dead(4242)
+    assert not os.path.exists(tmp_path / '4242-aaaa.json')
+    assert os.path.exists(tmp_path / f'{os.getppid()}-bbbb.json')
+    assert requests_total(metrics)[0] == 7
+
+
+def test_reused_pid_does_not_overwrite_an_exited_snapshot(metrics, tmp_path):
+    metrics.inc('http_requests_total', route='/x')
+    metrics.write()
+    first = metrics._filename
+    metrics._pid = None  # as if this pid now belonged to a new process
+    metrics.inc('http_requests_total', route='/x')
+    metrics.write()
+    assert metrics._filename != first
+    assert {first, metrics._filename} <= set(os.listdir(tmp_path))
+
+
+def test_errors_caught_by_routes_are_counted(client, monkeypatch):
+    def fail(args):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(app_module, 'list_tablets_page', fail)
+    monkeypatch.setattr(app_module, 'search_tablets', lambda text, limit: fail(None))
+    key = ('app_errors_total', (('type', 'RuntimeError'),))
+    before = app_module.metrics.collect_all()[0].get(key, 0)
+    assert client.get('/api/tablets').status_code == 500
+    assert client.get('/api/tablets/search', query_string={'q': 'anything-new'}).status_code == 500
+    assert app_module.metrics.collect_all()[0].get(key, 0) == before + 2
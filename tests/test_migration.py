@@ -0,0 +1,117 @@
+import sqlite3
+
+from conftest import DB_PATH
+
+# The tablet table as the first release created it, with the product text
+# stored on every row
+BASELINE_SCHEMA = """
+CREATE TABLE tablet (
+    id VARCHAR(36) NOT NULL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    manufacturer VARCHAR(100) NOT NULL,
+    batch_number VARCHAR(50) NOT NULL,
+    mfg_date DATE NOT NULL,
+    expiry_date DATE NOT NULL,
+    composition TEXT NOT NULL,
+    dosage VARCHAR(50) NOT NULL,
+    use_cases TEXT NOT NULL,
+    side_effects TEXT,
+    precautions TEXT,
+    storage_instructions TEXT,
+    created_at DATETIME
+)
+"""
+
+BASELINE_ROWS = [
+    ('00000000-0000-4000-8000-000000000001', 'Paracetamol 500', 'Acme', 'B1', '2024-01-01', '2026-01-01',
+     'Paracetamol 500mg', '500mg', 'Fever and pain', 'Rare rash', None, 'Below 25C', '2024-01-02 09:00:00.000000'),
+    ('00000000-0000-4000-8000-000000000002', 'Paracetamol 500', 'Acme', 'B1', '2024-01-01', '2026-01-01',
+     'Paracetamol 500mg', '500mg', 'Fever and pain', 'Rare rash', None, 'Below 25C', '2024-01-02 09:00:01.000000'),
+    ('00000000-0000-4000-8000-000000000003', 'Paracetamol 500', 'Acme', 'B2', '2024-03-01', '2026-03-01',
+     'Paracetamol 500mg', '500mg', 'Fever and pain', 'Rare rash', None, 'Below 25C', '2024-03-02 09:00:00.000000'),
+    ('00000000-0000-4000-8000-000000000004', 'Ibuprofen 200', 'Medico', 'M7', '2024-02-01', '2027-02-01',
+     'Ibuprofen 200mg', '200mg', 'Inflammation', 'Stomach upset', 'Take with food', None,
+     '2024-02-02 09:00:00.000000'),
+]
+
+
+def build_baseline(path):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(BASELINE_SCHEMA)
+        conn.executemany(f"INSERT INTO tablet VALUES ({', '.join('?' * 13)})", BASELINE_ROWS)
+    conn.close()
+
+
+def snapshot(app_module):
+    """Everything the migration derives from the tablet rows"""
+    db = app_module.db
+    run = lambda sql: db.session.execute(db.text(sql)).all()  # noqa: E731
+    return {
+        'tablets': run("SELECT id, monograph_id, short_code FROM tablet ORDER BY id"),
+        'monographs': run("SELECT id, composition, use_cases, side_effects, precautions, storage_instructions "
+                          "FROM monographs ORDER BY id"),
+        'summary': run("SELECT manufacturer, batch_number, expiry_date, tablet_count FROM expiry_summary "
+                       "ORDER BY manufacturer, batch_number, expiry_date"),
+        'fts_rows': run("SELECT count(*) FROM tablet_fts")[0][0],
+    }
+
+
+def test_migrate_baseline_database_twice(empty_db):
+    build_baseline(DB_PATH)
+    app_module = empty_db
+
+    app_module.migrate_database()
+    first = snapshot(app_module)
+    app_module.migrate_database()
+    second = snapshot(app_module)
+    assert first == second
+
+    columns = {c['name'] for c in app_module.db.inspect(app_module.db.engine).get_columns('tablet')}
+    assert not columns & set(app_module.MONOGRAPH_FIELDS)
+    assert {'monograph_id', 'short_code'} <= columns
+
+    # Three packs of one product share a monograph; the fourth has its own
+    monograph_ids = {tid: mid for tid, mid, _ in second['tablets']}
+    assert len(second['monographs']) == 2
+    assert len({monograph_ids[row[0]] for row in BASELINE_ROWS[:3]}) == 1
+    assert monograph_ids[BASELINE_ROWS[3][0]] != monograph_ids[BASELINE_ROWS[0][0]]
+    ibuprofen = app_module.db.session.get(app_module.Tablet, BASELINE_ROWS[3][0]).to_dict()
+    assert ibuprofen['composition'] == 'Ibuprofen 200mg'
+    assert ibuprofen['precautions'] == 'Take with food'
+    assert ibuprofen['storage_instructions'] == ''
+
+    codes = [code for _, _, code in second['tablets']]
+    assert len(set(codes)) == len(BASELINE_ROWS)
+    assert all(len(code) == app_module.SHORT_CODE_LENGTH for code in codes)
+    assert all(c in app_module.SHORT_CODE_ALPHABET for code in codes for c in code)
+
+    assert [tuple(row) for row in second['summary']] == [
+        ('Acme', 'B1', '2026-01-01', 2),
+        ('Acme', 'B2', '2026-03-01', 1),
+        ('Medico', 'M7', '2027-02-01', 1),
+    ]
+
+    assert second['fts_rows'] == len(BASELINE_ROWS)
+    results, _ = app_module.search_tablets('stomach', 10)
+    assert [r['id'] for r in results] == [BASELINE_ROWS[3][0]]
+    assert {r['id'] for r in app_module.search_tablets('paracetamol fever', 10)[0]} == \
+        {row[0] for row in BASELINE_ROWS[:3]}
+
+
+def test_triggers_keep_derived_tables_in_step(make_tablet, migrated_db):
+    tablet_id = make_tablet(name='Cetirizine 10', manufacturer='Allergo', batch_number='C1',
+                            composition='Cetirizine 10mg', use_cases='Hay fever')
+    db = migrated_db.db
+    summary = db.session.execute(db.text(
+        "SELECT tablet_count FROM expiry_summary WHERE manufacturer = 'Allergo'"
+    )).scalar()
+    assert summary == 1
+    assert [r['id'] for r in migrated_db.search_tablets('cetirizine', 10)[0]] == [tablet_id]
+
+    db.session.execute(db.text("DELETE FROM tablet WHERE id = :id"), {'id': tablet_id})
+    db.session.commit()
+    assert db.session.execute(db.text(
+        "SELECT count(*) FROM expiry_summary WHERE manufacturer = 'Allergo'"
+    )).scalar() == 0
+    assert migrated_db.search_tablets('cetirizine', 10)[0] == []
@@ -0,0 +1,62 @@
+import pytest
+
+
+@pytest.fixture
+def catalog(make_tablet):
+    """Seven tablets over two manufacturers, with a tie on expiry date"""
+    expiries = ['2027-05-01', '2026-01-01', '2027-05-01', '2028-03-01', '2026-06-01', '2027-05-01', '2029-01-01']
+    return [make_tablet(manufacturer='Acme' if i % 2 else 'Medico', batch_number=f'B{i}', expiry_date=expiry)
+            for i, expiry in enumerate(expiries)]
+
+
+def walk(client, **params):
+    """Follow next_cursor to the end, returning every page"""
+    pages = []
+    cursor = None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/tablets', query_string=query)
+        assert response.status_code == 200, response.get_data(as_text=True)
+        body = response.get_json()
+        pages.append(body['tablets'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pages_cover_every_tablet_once_in_order(client, catalog):
+    pages = walk(client, limit=3)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [t['id'] for page in pages for t in page] == catalog
+
+
+def test_cursor_pagination_by_expiry_breaks_ties_by_id(client, catalog):
+    ids = [t['id'] for page in walk(client, limit=2, sort='expiry_date', order='desc') for t in page]
+    listed = client.get('/api/tablets', query_string={'limit': 100, 'fields': 'expiry_date'}).get_json()['tablets']
+    expected = sorted(listed, key=lambda t: (t['expiry_date'], t['id']), reverse=True)
+    assert ids == [t['id'] for t in expected]
+
+
+def test_cursor_pagination_with_filter(client, catalog):
+    pages = walk(client, limit=2, manufacturer='Acme', fields='manufacturer')
+    tablets = [t for page in pages for t in page]
+    assert [t['id'] for t in tablets] == catalog[1::2]
+    assert {t['manufacturer'] for t in tablets} == {'Acme'}
+
+
+def test_last_page_has_no_cursor(client, catalog):
+    body = client.get('/api/tablets', query_string={'limit': len(catalog)}).get_json()
+    assert body['count'] == len(catalog)
+    assert body['next_cursor'] is None
+
+
+@pytest.mark.parametrize('params', [
+    {'cursor': 'not-a-cursor'},
+    {'sort': 'name'},
+    {'limit': 'ten'},
+    {'fields': 'id,secret'},
+])
+def test_bad_listing_arguments_are_rejected(client, catalog, params):
+    response = client.get('/api/tablets', query_string=params)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,79 @@
+import io
+import zipfile
+
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def batch(make_tablet):
+    return [make_tablet(batch_number='QB') for _ in range(20)]
+
+
+def archive(response):
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return zipfile.ZipFile(io.BytesIO(response.get_data()))
+
+
+def test_batch_archive_keeps_request_order(client, batch):
+    ids = batch[::-1] + batch[:2]
+    names = archive(client.post('/api/qrcode/batch', json={'tablet_ids': ids})).namelist()
+    assert names == [f'{tid}.png' for tid in batch[::-1]] + ['manifest.csv']
+
+    # The second run is served from the cache and is byte-for-byte the same
+    first = archive(client.post('/api/qrcode/batch', json={'batch_number': 'QB'}))
+    second = archive(client.post('/api/qrcode/batch', json={'batch_number': 'QB'}))
+    assert [first.read(n) for n in first.namelist()] == [second.read(n) for n in second.namelist()]
+
+
+def test_batch_limit_is_checked_before_loading_rows(client, batch, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'QR_BATCH_MAX', 5)
+    statements = []
+
+    def record(conn, cursor, sql, *args):
+        statements.append(sql)
+
+    app_module.db.event.listen(app_module.db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/api/qrcode/batch', json={'tablet_ids': batch})
+    finally:
+        app_module.db.event.remove(app_module.db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 413
+    assert not [sql for sql in statements if 'FROM tablet' in sql and 'cache_version' not in sql]
+    assert client.post('/api/qrcode/batch', json={'batch_number': 'QB'}).status_code == 413
+
+
+@pytest.mark.parametrize('route, tablet_ids', [
+    ('/api/qrcode/batch', [1, {'a': 1}]),
+    ('/api/qrcode/batch', [['x']]),
+    ('/api/qrcode/batch', 'abc'),
+    ('/api/labels', [1, {'a': 1}]),
+    ('/api/labels', [['x']]),
+])
+def test_non_string_ids_are_rejected(client, route, tablet_ids):
+    response = client.post(route, json={'tablet_ids': tablet_ids})
+    assert response.status_code == 400
+    assert 'tablet_ids' in response.get_json()['error']
+
+
+def test_unknown_ids_are_not_found(client, batch):
+    assert client.post('/api/qrcode/batch', json={'tablet_ids': ['nope']}).status_code == 404
+
+
+def test_batch_survives_a_broken_pool(migrated_db, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'QR_RENDER_WORKERS', 2)
+    monkeypatch.setitem(app_module.app.config, 'QR_RENDER_TIMEOUT', 5.0)
+    payloads = [f'HTTP://BROKEN-POOL.TEST/{i}' for i in range(60)]
+    pool = app_module.get_render_pool()
+    try:
+        rendered = app_module.render_qr_batch(payloads)
+        first = next(rendered)
+        for process in list(pool._processes.values()):
+            process.kill()
+        pngs = [first] + list(rendered)
+    finally:
+        app_module.discard_render_pool(pool)
+    assert pngs == [app_module.render_qr_png(p) for p in payloads]
+    assert app_module.get_render_pool() is not pool
+    app_module.discard_render_pool(app_module.get_render_pool())
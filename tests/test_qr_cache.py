@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return app_module.QRCache(str(tmp_path / 'qr.db'), memory_bytes=1000, disk_bytes=10000)
+
+
+def stored_bytes(cache):
+    return cache._db().execute("SELECT bytes FROM qr_blobs_total").fetchone()[0]
+
+
+def stored_keys(cache):
+    return {row[0] for row in cache._db().execute("SELECT key FROM qr_blobs")}
+
+
+def test_hits_come_from_memory_then_disk(cache):
+    cache.put('a', b'x' * 100)
+    assert cache.get('a') == b'x' * 100
+    cache._memory.clear()
+    cache._memory_size = 0
+    assert cache.get('a') == b'x' * 100
+    assert cache.get('b') is None
+    assert (cache.stats['memory_hits'], cache.stats['disk_hits'], cache.stats['misses']) == (1, 1, 1)
+    # The disk hit promoted the entry back into memory
+    assert cache.get('a') == b'x' * 100 and cache.stats['memory_hits'] == 2
+
+
+def test_byte_total_follows_inserts_updates_and_deletes(cache):
+    cache.put('a', b'x' * 100)
+    cache.put('b', b'y' * 300)
+    cache.put('a', b'z' * 50)
+    assert stored_bytes(cache) == 350
+    with cache._db() as conn:
+        conn.execute("DELETE FROM qr_blobs WHERE key = 'b'")
+    assert stored_bytes(cache) == 50
+
+
+def test_disk_evicts_oldest_down_to_the_target(cache):
+    for i in range(10):
+        cache.put(f'k{i}', bytes([i]) * 1000)
+    assert stored_bytes(cache) == cache.disk_bytes and cache.stats['disk_evictions'] == 0
+    with cache._db() as conn:
+        conn.execute("UPDATE qr_blobs SET last_access = CAST(substr(key, 2) AS REAL)")
+    # One blob over budget frees the two oldest, down to EVICT_TO of it
+    cache.put('k10', b'x' * 1000)
+    assert stored_bytes(cache) == cache.disk_bytes * cache.EVICT_TO
+    assert stored_keys(cache) == {f'k{i}' for i in range(2, 11)}
+    assert cache.stats['disk_evictions'] == 2
+
+
+def test_memory_tier_stays_within_its_budget(cache):
+    for i in range(5):
+        cache.put(f'k{i}', b'x' * 300)
+    cache.put('huge', b'x' * 2000)
+    assert cache._memory_size <= cache.memory_bytes
+    assert list(cache._memory) == ['k2', 'k3', 'k4']
+    assert cache.stats['memory_evictions'] == 2
+
+
+def test_disk_hits_write_last_access_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(cache, 'TOUCH_BATCH', 3)
+    for key in 'abc':
+        cache.put(key, key.encode() * 10)
+    with cache._db() as conn:
+        conn.execute("UPDATE qr_blobs SET last_access = 0")
+    cache._memory.clear()
+    cache._memory_size = 0
+
+    cache.get('a')
+    cache.get('b')
+    accessed = dict(cache._db().execute("SELECT key, last_access FROM qr_blobs"))
+    assert accessed == {'a': 0, 'b': 0, 'c': 0}
+    cache.get('c')
+    accessed = dict(cache._db().execute("SELECT key, last_access FROM qr_blobs"))
+    assert all(at > 0 for at in accessed.values())
+
+
+def test_missing_checks_both_tiers_without_reading_blobs(cache):
+    cache.put('memory', b'm')
+    cache.put('disk', b'd')
+    cache._memory.pop('disk')
+    assert cache.missing(['memory', 'disk', 'absent', 'gone']) == {'absent', 'gone'}
+    assert cache.stats['misses'] == 2
+
+
+def test_schema_leaves_other_tables_alone(tmp_path):
+    path = str(tmp_path / 'qr.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE qr_cache (key TEXT)")
+    app_module.QRCache(path, 1000, 10000).put('a', b'a')
+    with sqlite3.connect(path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'qr_cache', 'qr_blobs', 'qr_blobs_total'} <= tables
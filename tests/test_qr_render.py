@@ -0,0 +1,40 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def offload(monkeypatch):
+    """Offload single renders to a one-process pool with a short timeout"""
+    monkeypatch.setitem(app_module.app.config, 'QR_RENDER_OFFLOAD', True)
+    monkeypatch.setitem(app_module.app.config, 'QR_RENDER_WORKERS', 1)
+    monkeypatch.setitem(app_module.app.config, 'QR_RENDER_TIMEOUT', 0.2)
+    pool = app_module.get_render_pool()
+    yield pool
+    app_module.discard_render_pool(pool)
+    pool.shutdown(wait=True)
+
+
+def test_offloaded_render_matches_inline(offload):
+    assert app_module.render_qr_single(app_module.render_qr_png, 'HELLO', {'ec': 'M'}) == \
+        app_module.render_qr_png('HELLO', ec='M')
+
+
+def test_timeout_falls_back_inline_without_failing_other_renders(offload):
+    # time.sleep(0.5) outlasts the 0.2 s timeout and queues every other
+    # render behind it in the single pool process
+    def render(_):
+        return app_module.render_qr_single(time.sleep, 0.5, {})
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as threads:
+        results = list(threads.map(render, range(8)))
+    assert results == [None] * 8
+    assert time.monotonic() - started < 3
+
+    # The pool that timed out is still the live one and still works
+    assert app_module.get_render_pool() is offload
+    assert offload.submit(abs, -3).result(timeout=5) == 3
@@ -0,0 +1,37 @@
+import io
+
+import pytest
+
+from conftest import app_module
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def packer(request, monkeypatch):
+    """pack_qr_rows with and without NumPy"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        real = app_module.optional_module
+        monkeypatch.setattr(app_module, 'optional_module', lambda name: None if name == 'numpy' else real(name))
+    return request.param
+
+
+@pytest.mark.parametrize('box_size', [1, 3, 10])
+def test_packed_rows_match_the_matrix(packer, box_size):
+    matrix = app_module.build_qr('HTTP://EXAMPLE.COM/I/Q7MZ4K2D').get_matrix()
+    width, rows = app_module.pack_qr_rows(matrix, box_size)
+    assert width == len(matrix[0]) * box_size
+    for module_row, packed in zip(matrix, rows):
+        bits = ''.join(f'{byte:08b}' for byte in packed)
+        assert bits[:width] == ''.join(('0' if dark else '1') * box_size for dark in module_row)
+        assert set(bits[width:]) <= {'0'}
+
+
+def test_vector_png_matches_pil(packer):
+    payload = 'HTTP://EXAMPLE.COM/I/Q7MZ4K2D'
+    vector = Image.open(io.BytesIO(app_module.render_qr_png(payload, rasterizer='vector'))).convert('L')
+    pil = Image.open(io.BytesIO(app_module.render_qr_png(payload, rasterizer='pil'))).convert('L')
+    assert vector.size == pil.size
+    assert list(vector.getdata()) == list(pil.getdata())
@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def analytics(monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SCAN_ANALYTICS_ENABLED', True)
+
+
+def scans_of(client, tablet_id):
+    body = client.get('/api/scans', query_string={'tablet_id': tablet_id, 'days': 1}).get_json()
+    return sum(row['scans'] for row in body['results'])
+
+
+def test_info_page_revalidates_every_scan(client, make_tablet):
+    tablet_id = make_tablet()
+    response = client.get(f'/info/{tablet_id}')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, no-cache'
+    assert 'max-age' not in response.headers['Cache-Control']
+
+
+def test_conditional_scan_is_answered_304_and_still_recorded(client, make_tablet, analytics):
+    tablet_id = make_tablet()
+    etag = client.get(f'/info/{tablet_id}').headers['ETag']
+    repeat = client.get(f'/info/{tablet_id}', headers={'If-None-Match': etag})
+    assert repeat.status_code == 304
+    assert repeat.headers['Cache-Control'] == 'public, no-cache'
+    assert scans_of(client, tablet_id) == 2
+
+
+@pytest.mark.parametrize('days, status', [(7, 200), (0, 200), (-1, 400), (1000000000, 400)])
+def test_scan_window_is_bounded(client, days, status):
+    response = client.get('/api/scans', query_string={'days': days})
+    assert response.status_code == status
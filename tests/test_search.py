@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def crowded_catalog(make_tablet, migrated_db):
+    """Many tablets that mention fever only in passing, then one that is about it"""
+    db = migrated_db.db
+    db.session.execute(db.text(
+        "INSERT INTO monographs (id, composition, use_cases, side_effects, precautions, storage_instructions) "
+        "VALUES ('m-generic', 'Calcium carbonate', 'Indigestion', 'May cause fever', '', '')"
+    ))
+    db.session.execute(db.text(
+        "INSERT INTO tablet (id, name, manufacturer, batch_number, mfg_date, expiry_date, dosage, created_at, "
+        "monograph_id) VALUES (:id, :name, 'Acme', 'G1', '2024-01-01', '2027-01-01', '500mg', "
+        "'2024-01-01 00:00:00', 'm-generic')"
+    ), [{'id': f'generic-{i:04d}', 'name': f'Generic {i}'} for i in range(60)])
+    db.session.commit()
+    return make_tablet(name='Fever Relief', composition='Paracetamol for fever', use_cases='Fever')
+
+
+def test_best_match_wins_even_when_added_last(client, crowded_catalog):
+    body = client.get('/api/tablets/search', query_string={'q': 'fever', 'limit': 3}).get_json()
+    assert body['ranking'] == 'full'
+    assert body['results'][0]['id'] == crowded_catalog
+
+
+def test_capped_ranking_is_reported_as_partial(client, crowded_catalog, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SEARCH_RANK_CANDIDATES', 50)
+    body = client.get('/api/tablets/search', query_string={'q': 'fever', 'limit': 3}).get_json()
+    assert body['ranking'] == 'partial'
+
+    body = client.get('/api/tablets/search', query_string={'q': 'relief', 'limit': 3}).get_json()
+    assert body['ranking'] == 'full'
+    assert [r['id'] for r in body['results']] == [crowded_catalog]
+
+
+def test_cached_results_follow_new_and_changed_tablets(client, make_tablet, migrated_db):
+    search = lambda: [r['id'] for r in client.get('/api/tablets/search', query_string={'q': 'zinc'}).get_json()['results']]  # noqa: E731
+    first = make_tablet(name='Zinc 50', composition='Zinc sulfate')
+    assert search() == [first]
+    hits = migrated_db.search_cache.snapshot()['hits']
+    assert search() == [first]
+    assert migrated_db.search_cache.snapshot()['hits'] == hits + 1
+
+    second = make_tablet(name='Zinc 25', composition='Magnesium oxide')
+    assert sorted(search()) == sorted([first, second])
+
+    tablet = migrated_db.db.session.get(migrated_db.Tablet, second)
+    tablet.name = 'Magnesium 25'
+    migrated_db.db.session.commit()
+    assert search() == [first]
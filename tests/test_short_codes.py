@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def short_code(client, make_tablet):
+    def make(**overrides):
+        tablet_id = make_tablet(**overrides)
+        return tablet_id, client.get(f'/api/tablets/{tablet_id}').get_json()['short_code']
+    return make
+
+
+def test_short_code_lookups_are_cached_and_counted(client, short_code):
+    tablet_id, code = short_code()
+    before = client.get('/api/shortcodes/cache/stats').get_json()
+    assert client.get(f'/i/{code}').status_code == 200
+    assert client.get(f'/i/{code.lower()}').status_code == 200
+    after = client.get('/api/shortcodes/cache/stats').get_json()
+    assert after['misses'] == before['misses'] + 1
+    assert after['hits'] == before['hits'] + 1
+
+    counters = app_module.metrics.collect_all()[0]
+    assert counters[('short_code_cache_requests_total', (('result', 'hit'),))] == after['hits']
+
+
+def test_unknown_codes_are_not_cached(client):
+    before = app_module.short_code_cache.snapshot()
+    for _ in range(2):
+        assert client.get('/i/ZZZZZZZZ').status_code == 404
+    after = app_module.short_code_cache.snapshot()
+    assert after['misses'] == before['misses'] + 2
+    assert after['entries'] == before['entries']
+
+
+def test_cache_evicts_least_recently_used(migrated_db, short_code):
+    cache = app_module.ShortCodeCache(max_entries=2)
+    (first_id, first), (_, second), (_, third) = [short_code(batch_number=f'B{i}') for i in range(3)]
+    cache.get(first)
+    cache.get(second)
+    cache.get(first)
+    cache.get(third)
+    assert cache.snapshot()['entries'] == 2 and cache.stats['evictions'] == 1
+    assert cache.get(first) == first_id
+    assert cache.stats['hits'] == 2
+    cache.get(second)
+    assert cache.stats['misses'] == 4
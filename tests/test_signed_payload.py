@@ -0,0 +1,92 @@
+import uuid
+from datetime import date
+
+import pytest
+
+from conftest import app_module
+
+TABLET_ID = str(uuid.UUID(int=42))
+
+
+def encode(**overrides):
+    fields = dict(tablet_id=TABLET_ID, name='Paracetamol 500', batch_number='B1',
+                  mfg_date=date(2024, 1, 1), expiry_date=date(2027, 1, 1), key=b'k')
+    fields.update(overrides)
+    return app_module.encode_offline_payload(**fields)
+
+
+def test_round_trip():
+    fields = app_module.decode_offline_payload(encode(), key=b'k')
+    assert fields == {'id': TABLET_ID, 'mfg_date': date(2024, 1, 1), 'expiry_date': date(2027, 1, 1),
+                      'batch_number': 'B1', 'name': 'Paracetamol 500'}
+
+
+def test_round_trip_truncates_long_text_on_a_character_boundary():
+    fields = app_module.decode_offline_payload(encode(name='Ä' * 40, batch_number='B' * 30), key=b'k')
+    assert fields['name'] == 'Ä' * (app_module.OFFLINE_MAX_NAME_BYTES // 2)
+    assert fields['batch_number'] == 'B' * app_module.OFFLINE_MAX_BATCH_BYTES
+
+
+def test_round_trip_at_the_edges_of_the_date_range():
+    blob = encode(mfg_date=app_module.OFFLINE_EPOCH, expiry_date=app_module.OFFLINE_MAX_DATE)
+    fields = app_module.decode_offline_payload(blob, key=b'k')
+    assert (fields['mfg_date'], fields['expiry_date']) == (app_module.OFFLINE_EPOCH, app_module.OFFLINE_MAX_DATE)
+
+
+@pytest.mark.parametrize('dates', [
+    {'mfg_date': date(1999, 12, 31)},
+    {'expiry_date': date(2200, 1, 1)},
+])
+def test_dates_outside_the_range_are_rejected(dates):
+    with pytest.raises(ValueError):
+        encode(**dates)
+
+
+def test_lowercase_text_decodes():
+    assert app_module.decode_offline_payload(encode().lower(), key=b'k')['id'] == TABLET_ID
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda blob: blob[:30] + ('A' if blob[30] != 'A' else 'B') + blob[31:],
+    lambda blob: blob[:-4],
+    lambda blob: 'QQ' + blob[2:],
+    lambda blob: blob + '!',
+])
+def test_tampered_payloads_are_rejected(tamper):
+    with pytest.raises(ValueError):
+        app_module.decode_offline_payload(tamper(encode()), key=b'k')
+
+
+def test_wrong_key_is_rejected():
+    with pytest.raises(ValueError):
+        app_module.decode_offline_payload(encode(), key=b'other')
+
+
+def test_qr_payload_falls_back_to_url_for_unencodable_dates(migrated_db):
+    tablet = {'id': TABLET_ID, 'short_code': None, 'name': 'Old stock', 'batch_number': 'B0',
+              'mfg_date': date(1998, 6, 1), 'expiry_date': date(2001, 6, 1)}
+    assert migrated_db.tablet_qr_payload(tablet, 'https://pharma.example.com/', 'signed') == \
+        f'https://pharma.example.com/info/{TABLET_ID}'
+
+
+def test_signed_qr_resolves_online(client, make_tablet):
+    tablet_id = make_tablet()
+    qr_data = client.get(f'/api/qrcode/{tablet_id}', query_string={'payload': 'signed'}).get_json()['qr_data']
+    assert qr_data.startswith('HTTP://LOCALHOST/V/')
+    response = client.get(qr_data[len('HTTP://LOCALHOST'):])
+    assert response.status_code == 200
+    assert 'Paracetamol' in response.get_data(as_text=True)
+
+    # Flip a character inside the tablet id (the last one may only carry padding bits)
+    forged = qr_data[:25] + ('A' if qr_data[25] != 'A' else 'B') + qr_data[26:]
+    assert client.get(forged[len('HTTP://LOCALHOST'):]).status_code == 400
+
+
+def test_signed_mode_requires_a_key(client, make_tablet, monkeypatch):
+    tablet_id = make_tablet()
+    monkeypatch.setitem(app_module.app.config, 'QR_SIGNING_KEY', None)
+    response = client.get(f'/api/qrcode/{tablet_id}', query_string={'payload': 'signed'})
+    assert response.status_code == 400
+    assert 'QR_SIGNING_KEY' in response.get_json()['error']
+    response = client.get('/api/labels', query_string={'payload': 'signed', 'tablet_ids': tablet_id})
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from conftest import DB_PATH, app_module
+
+
+def write_from_another_process(sql, *params):
+    """Change the database the way another worker would, bypassing this session"""
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute(sql, params)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = app_module.tablet_cache
+    monkeypatch.setattr(cache, 'check_interval', 3600)
+    return cache
+
+
+def recheck_now(cache):
+    cache._next_check = 0.0
+
+
+def test_foreign_write_flushes_records_and_scan_pages(client, make_tablet, cache):
+    tablet_id = make_tablet(batch_number='B1')
+    recheck_now(cache)
+    assert client.get(f'/api/tablets/{tablet_id}').get_json()['batch_number'] == 'B1'
+    assert b'B1' in client.get(f'/info/{tablet_id}').data
+    flushes = cache.snapshot()['flushes']
+
+    write_from_another_process("UPDATE tablet SET batch_number = 'B9' WHERE id = ?", tablet_id)
+    # Until the next check the worker keeps serving what it cached
+    assert client.get(f'/api/tablets/{tablet_id}').get_json()['batch_number'] == 'B1'
+
+    recheck_now(cache)
+    assert client.get(f'/api/tablets/{tablet_id}').get_json()['batch_number'] == 'B9'
+    assert cache.snapshot()['flushes'] == flushes + 1
+    assert b'B9' in client.get(f'/info/{tablet_id}').data
+
+
+def test_foreign_delete_is_seen_after_the_check(client, make_tablet, cache):
+    tablet_id = make_tablet()
+    recheck_now(cache)
+    assert client.get(f'/api/tablets/{tablet_id}').status_code == 200
+    write_from_another_process("DELETE FROM tablet WHERE id = ?", tablet_id)
+    recheck_now(cache)
+    assert client.get(f'/api/tablets/{tablet_id}').status_code == 404
+
+
+def test_cached_records_are_hits_until_the_version_moves(client, make_tablet, cache):
+    tablet_id = make_tablet()
+    recheck_now(cache)
+    client.get(f'/api/tablets/{tablet_id}')
+    before = cache.snapshot()
+    recheck_now(cache)
+    client.get(f'/api/tablets/{tablet_id}')
+    after = cache.snapshot()
+    assert after['hits'] == before['hits'] + 1
+    assert after['flushes'] == before['flushes'] and after['version'] == before['version']
@@ -0,0 +1,81 @@
+import json
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import app_module
+
+
+@pytest.fixture
+def stock(client, make_tablet):
+    """A valid, an expiring and an expired tablet, with their short codes"""
+    today = date.today()
+    ids = {
+        'valid': make_tablet(expiry_date=(today + timedelta(days=400)).isoformat()),
+        'expiring_soon': make_tablet(expiry_date=(today + timedelta(days=10)).isoformat()),
+        'expired': make_tablet(mfg_date='2019-01-01', expiry_date='2020-01-01'),
+    }
+    return {state: (tablet_id, client.get(f'/api/tablets/{tablet_id}').get_json()['short_code'])
+            for state, tablet_id in ids.items()}
+
+
+def verify(client, **kwargs):
+    response = client.post('/api/verify', **kwargs)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return json.loads(response.get_data(as_text=True))
+
+
+def test_bare_array_and_codes_object_agree(client, stock):
+    codes = [stock['valid'][0], stock['expired'][0]]
+    bare = verify(client, json=codes, query_string={'within': 5})
+    wrapped = verify(client, json={'codes': codes, 'within': 5})
+    assert bare == wrapped
+    assert bare['within_days'] == 5
+    assert [r['expiry'] for r in bare['results']] == ['valid', 'expired']
+
+
+def test_statuses_for_each_kind_of_code(client, stock):
+    tablet_id, short_code = stock['expiring_soon']
+    signed = app_module.encode_offline_payload(tablet_id, 'Paracetamol', 'B1', date(2024, 1, 1),
+                                               date.today() + timedelta(days=10))
+    codes = [tablet_id, short_code.lower(), f'https://example.test/i/{short_code}',
+             f'https://example.test/v/{signed}', str(uuid.uuid4()), 'not a code', 42]
+    body = verify(client, json=codes)
+    statuses = [r['status'] for r in body['results']]
+    assert statuses == ['found'] * 4 + ['unknown', 'invalid', 'invalid']
+    assert {r['tablet_id'] for r in body['results'][:4]} == {tablet_id}
+    assert body['results'][0]['expiry'] == 'expiring_soon'
+    assert body['summary']['found'] == 4 and body['summary']['expiring_soon'] == 4
+    assert body['summary']['unknown'] == 1 and body['summary']['invalid'] == 2
+
+
+def test_plain_text_takes_one_code_per_line(client, stock):
+    text = '\n'.join([stock['valid'][1], '', stock['expired'][1]]) + '\n'
+    body = verify(client, data=text, content_type='text/plain')
+    assert [r['expiry'] for r in body['results']] == ['valid', 'expired']
+
+
+def test_results_stream_across_chunks_in_input_order(client, stock, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'VERIFY_CHUNK_SIZE', 2)
+    codes = [stock[state][0] for state in ('expired', 'valid', 'expiring_soon')] * 3
+    body = verify(client, json=codes)
+    assert [r['code'] for r in body['results']] == codes
+
+
+@pytest.mark.parametrize('kwargs, status', [
+    ({'json': {'codes': 'abc'}}, 400),
+    ({'json': 'abc'}, 400),
+    ({'data': 'not json', 'content_type': 'application/json'}, 400),
+    ({'json': []}, 400),
+    ({'data': '\n\n', 'content_type': 'text/plain'}, 400),
+    ({'json': {'codes': ['x'], 'within': 'soon'}}, 400),
+    ({'json': {'codes': ['x'], 'within': -1}}, 400),
+    ({'json': ['x'], 'query_string': {'within': 1000000000}}, 400),
+    ({'json': ['x'] * 4}, 413),
+])
+def test_bad_requests_are_rejected(client, monkeypatch, kwargs, status):
+    monkeypatch.setitem(app_module.app.config, 'VERIFY_MAX_ITEMS', 3)
+    response = client.post('/api/verify', **kwargs)
+    assert response.status_code == status
+    assert response.get_json()['success'] is False